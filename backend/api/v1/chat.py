@@ -1,148 +1,338 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
 from typing import List, Optional
 import os
-from groq import Groq
-import ollama
-import uvicorn
-from fastapi import APIRouter, Depends, Request
+import json
+import time
+import hashlib
+from groq import AsyncGroq
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from models import ChatRequest, ChatResponse
+from auth.auth_bearer import JWTBearer, OptionalJWTBearer
+from auth.auth_handler import token_cache_stats
 from dotenv import load_dotenv
 load_dotenv()
-from services.document_store import DocumentStore, get_chroma_collection
+from services.partitions import partition_for
+from services.prompt_builder import build_prompt
+from services.retrieval import cache_stats, embed_query, retrieve
+from services.sessions import get_session
+from services.metrics import LLM_TOKENS, Operation, observe, span
 
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
 
 chat_router = APIRouter(prefix="/api", tags=["Chat"])
 
+LLM_MODEL = "llama-3.1-8b-instant"
+
+
+async def build_chat_messages(data: ChatRequest, partition, session=None):
+    """
+    Run knowledge base retrieval on the caller's partition and assemble the
+    messages sent to the LLM within the prompt token budget. The history
+    comes from `session` when given, otherwise from the request. Returns the
+    prompt, the sources used (or None) and the ids of the retrieved chunks.
+    """
+    sources = None
+    source_ids = []
+    chunks = None
+
+    document_count = await partition.vector_store.count() if data.use_knowledge_base else 0
+    # If knowledge base is enabled and documents exist
+    if document_count > 0:
+        # Query the vector store for relevant chunks (cached per normalized query)
+        with span("retrieve"):
+            results = await retrieve(partition, data.message, min(3, document_count))
+        source_ids = results['ids']
+        chunks = list(zip(results['documents'], results['metadatas']))
+
+    prompt_started = time.perf_counter()
+    if session is not None:
+        prompt = build_prompt(
+            data.message,
+            history=session.history(),
+            chunks=chunks,
+            history_tokens=session.history_tokens(),
+            earlier_summary=list(session.summary)
+        )
+    else:
+        prompt = build_prompt(
+            data.message,
+            history=[(msg.role, msg.content) for msg in data.history],
+            chunks=chunks
+        )
+    observe("prompt", time.perf_counter() - prompt_started)
+
+    if chunks:
+        sources = []
+        # Only chunks that made it into the prompt are reported as sources
+        for i in sorted(prompt.used_chunks):
+            doc, meta = chunks[i]
+            # Convert distance to similarity score (lower distance = higher similarity)
+            similarity = 1 / (1 + results['distances'][i])
+
+            source = {
+                "filename": meta['filename'],
+                "chunk": doc[:200] + "..." if len(doc) > 200 else doc,
+                "score": round(similarity, 3)
+            }
+            if meta.get('page') is not None:
+                source["page"] = meta['page']
+            sources.append(source)
+
+    return prompt, sources, source_ids
+
+
+async def lookup_cached_answer(data: ChatRequest, partition, source_ids: List[str], session=None):
+    """
+    Look for an earlier answer to a semantically equivalent question asked
+    against the same retrieved chunks and the same conversation history,
+    in the same partition since its documents last changed.
+    Returns (answer or None, store) where `store(answer)` caches a new answer.
+    """
+    cache = partition.app.state.response_cache
+    if data.bypass_cache or cache.max_entries <= 0:
+        return None, lambda answer: None
+
+    if session is not None:
+        history = session.history_key
+    else:
+        history = hashlib.sha256(
+            json.dumps([[msg.role, msg.content] for msg in data.history]).encode("utf-8")
+        ).hexdigest()
+    context_key = (partition.tenant, partition.generation, data.use_knowledge_base, tuple(source_ids), history)
+    embedding = await embed_query(partition.app, data.message)
+
+    def store(answer: dict):
+        cache.set(embedding, context_key, answer)
+
+    return cache.get(embedding, context_key), store
+
+
+def record_usage(usage):
+    """Count the prompt and completion tokens the LLM reported"""
+    if usage is None:
+        return
+    LLM_TOKENS.labels("prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels("completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def record_exchange(session, question: str, answer: str):
+    """Append a completed question/answer pair to the session, if any"""
+    if session is not None:
+        session.add_turn("user", question)
+        session.add_turn("assistant", answer)
+
+
 @chat_router.post("/v1/chat", response_model=ChatResponse)
-async def chat(data: ChatRequest, request: Request):
+async def chat(data: ChatRequest, request: Request, user: Optional[str] = Depends(OptionalJWTBearer())):
     """
-    Main chat endpoint that processes user messages and returns AI responses
+    Main chat endpoint that processes user messages and returns AI responses.
+    The knowledge base is the caller's own documents (anonymous requests use
+    the public ones). With a `session_id`, the conversation history is kept
+    on the server.
     """
+    operation = Operation("chat")
     try:
-        sources = None
-        
-        collection = get_chroma_collection(request)
-        # If knowledge base is enabled and documents exist
-        if data.use_knowledge_base and collection and collection.count() > 0:
-            # Query ChromaDB for relevant chunks
-            results = collection.query(
-                query_texts=[data.message],
-                n_results=min(3, collection.count()),
-                include=["documents", "metadatas", "distances"]
+        session = get_session(request, user, data.session_id) if data.session_id else None
+        async with partition_for(request, user) as partition:
+            prompt, sources, source_ids = await build_chat_messages(data, partition, session)
+
+            with span("answer_cache"):
+                cached_answer, store_answer = await lookup_cached_answer(data, partition, source_ids, session)
+        if cached_answer is not None:
+            record_exchange(session, data.message, cached_answer["response"])
+            return ChatResponse(
+                **cached_answer,
+                prompt_tokens=prompt.prompt_tokens,
+                session_id=data.session_id,
+                cached=True
             )
-            
-            if results and results['documents'] and results['documents'][0]:
-                # Build context from search results
-                documents = results['documents'][0]
-                metadatas = results['metadatas'][0]
-                distances = results['distances'][0]
-                
-                context_parts = []
-                sources = []
-                
-                for doc, meta, dist in zip(documents, metadatas, distances):
-                    context_parts.append(f"From {meta['filename']}:\n{doc}")
-                    
-                    # Convert distance to similarity score (lower distance = higher similarity)
-                    similarity = 1 / (1 + dist)
-                    
-                    sources.append({
-                        "filename": meta['filename'],
-                        "chunk": doc[:200] + "..." if len(doc) > 200 else doc,
-                        "score": round(similarity, 3)
-                    })
-                
-                context = "\n\n".join(context_parts)
-                
-                # Augment the prompt with context
-                augmented_message = f"""Based on the following context from uploaded documents, please answer the question.
-                Context:
-                {context}
-
-                Question: {data.message}
-
-                Please provide a comprehensive answer based on the context above. If the context doesn't contain enough information, please say so."""
-                
-            else:
-                augmented_message = data.message + "\n\n(Note: No relevant information found in uploaded documents)"
-        else:
-            augmented_message = data.message
-        
-        # Prepare messages for Ollama
-        messages = []
-        
-        # Add conversation history (limit to last 10 messages)
-        recent_history = data.history[-10:] if len(data.history) > 10 else data.history
-        for msg in recent_history:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
 
-        # Prepare messages for Groq API
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an assistant. Be specific and direct in your replies."
-            }
-        ]
-        
-        # Add conversation history
-        for msg in data.history:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-        
-        # Add current user message
-        messages.append({
-            "role": "user",
-            "content": augmented_message
-        })
-        
         # Call Groq API
-        chat_completion = groq_client.chat.completions.create(
-            messages=messages,
-            model="llama-3.1-8b-instant",
-            temperature=0.7,
-            max_tokens=1024,
-            top_p=1,
-            stream=False
-        )
+        with span("llm"):
+            chat_completion = await groq_client.chat.completions.create(
+                messages=prompt.messages,
+                model=LLM_MODEL,
+                temperature=0.7,
+                max_tokens=1024,
+                top_p=1,
+                stream=False
+            )
+        record_usage(getattr(chat_completion, "usage", None))
 
-        #Call Ollama Local
-        # chat_completion = ollama.chat(
-        #     messages=messages,
-        #     model="gemma3:1b",
-        #     stream=False
-        # )
-        
         response_content = chat_completion.choices[0].message.content
-        # response_content = chat_completion["message"]["content"]
-        
-        #Groq
-        return ChatResponse(
+        response = ChatResponse(
             response=response_content,
             model=chat_completion.model,
             tokens_used=chat_completion.usage.total_tokens if hasattr(chat_completion, 'usage') else None,
-            sources=sources if data.use_knowledge_base else None
+            prompt_tokens=prompt.prompt_tokens,
+            sources=sources if data.use_knowledge_base else None,
+            session_id=data.session_id
         )
+        store_answer(response.model_dump(exclude={"cached", "prompt_tokens", "session_id"}))
+        record_exchange(session, data.message, response_content)
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing chat request: {str(e)}"
+        )
+    finally:
+        operation.end()
+
+
+def _sse_event(event: str, payload: dict) -> str:
+    """Format a single Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
 
-        #Ollama
-        # return ChatResponse(
-        #     response=response_content,
-        #     model=chat_completion.get("model"),
-        #     tokens_used=chat_completion.get("usage", {}).get("total_tokens"),
-        #     sources=sources if data.use_knowledge_base else None
-        # )
 
-        
+@chat_router.post("/v1/chat/stream")
+async def chat_stream(data: ChatRequest, request: Request, user: Optional[str] = Depends(OptionalJWTBearer())):
+    """
+    Streaming chat endpoint (Server-Sent Events).
+
+    Emits a `sources` event before generation starts, one `token` event per
+    content delta from the model, and a final `done` event carrying the model
+    name, token usage and prompt token count. Failures after the stream has
+    started are reported as an `error` event since the status code has
+    already been sent. With a `session_id`, the exchange is added to the
+    session once it completes.
+    """
+    # Ends when the stream does, so its total includes generation
+    operation = Operation("chat_stream")
+    try:
+        session = get_session(request, user, data.session_id) if data.session_id else None
+        async with partition_for(request, user) as partition:
+            prompt, sources, source_ids = await build_chat_messages(data, partition, session)
+            with span("answer_cache"):
+                cached_answer, store_answer = await lookup_cached_answer(data, partition, source_ids, session)
+    except HTTPException:
+        operation.end()
+        raise
     except Exception as e:
         print(e)
+        operation.end()
         raise HTTPException(
             status_code=500,
             detail=f"Error processing chat request: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+    async def event_stream():
+        try:
+            async for event in stream_events():
+                yield event
+        finally:
+            operation.end()
+
+    async def stream_events():
+        yield _sse_event("sources", {"sources": sources if data.use_knowledge_base else None})
+
+        if cached_answer is not None:
+            yield _sse_event("token", {"content": cached_answer["response"]})
+            record_exchange(session, data.message, cached_answer["response"])
+            yield _sse_event("done", {
+                "model": cached_answer["model"],
+                "tokens_used": cached_answer["tokens_used"],
+                "prompt_tokens": prompt.prompt_tokens,
+                "session_id": data.session_id,
+                "cached": True
+            })
+            return
+
+        model = LLM_MODEL
+        tokens_used = None
+        content_parts = []
+        llm_started = time.perf_counter()
+        first_token = True
+        try:
+            stream = await groq_client.chat.completions.create(
+                messages=prompt.messages,
+                model=LLM_MODEL,
+                temperature=0.7,
+                max_tokens=1024,
+                top_p=1,
+                stream=True
+            )
+            async for chunk in stream:
+                model = chunk.model or model
+                if chunk.choices:
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        if first_token:
+                            observe("llm_first_token", time.perf_counter() - llm_started)
+                            first_token = False
+                        content_parts.append(content)
+                        yield _sse_event("token", {"content": content})
+
+                # Groq reports usage on the final chunk under `x_groq`
+                x_groq = getattr(chunk, "x_groq", None)
+                usage = getattr(x_groq, "usage", None) or getattr(chunk, "usage", None)
+                if usage is not None:
+                    tokens_used = usage.total_tokens
+                    record_usage(usage)
+        except Exception as e:
+            print(e)
+            yield _sse_event("error", {"detail": f"Error processing chat request: {str(e)}"})
+            return
+        observe("llm", time.perf_counter() - llm_started)
+
+        answer = "".join(content_parts)
+        store_answer({
+            "response": answer,
+            "model": model,
+            "tokens_used": tokens_used,
+            "sources": sources if data.use_knowledge_base else None
+        })
+        record_exchange(session, data.message, answer)
+        yield _sse_event("done", {
+            "model": model,
+            "tokens_used": tokens_used,
+            "prompt_tokens": prompt.prompt_tokens,
+            "session_id": data.session_id,
+            "cached": False
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@chat_router.get("/v1/cache/stats")
+async def get_cache_stats(request: Request):
+    """
+    Hit/miss counters and sizes for the query embedding, retrieval, answer
+    and verified-token caches
+    """
+    return {**cache_stats(request.app), "tokens": token_cache_stats()}
+
+
+@chat_router.post("/v1/sessions", status_code=201)
+async def create_session(request: Request, user: str = Depends(JWTBearer())):
+    """
+    Start a server-held conversation. Pass the returned `session_id` with
+    each chat request instead of resending the history.
+    """
+    return request.app.state.sessions.create(user).info()
+
+
+@chat_router.get("/v1/sessions")
+async def list_sessions(request: Request, user: str = Depends(JWTBearer())):
+    """The current user's sessions, most recently used first"""
+    return {"sessions": [session.info() for session in request.app.state.sessions.list(user)]}
+
+
+@chat_router.get("/v1/sessions/{session_id}")
+async def get_session_history(session_id: str, request: Request, user: str = Depends(JWTBearer())):
+    """A session's messages and the summary of turns folded out of it"""
+    return request.app.state.sessions.get(user, session_id).info(include_turns=True)
+
+
+@chat_router.delete("/v1/sessions/{session_id}")
+async def delete_session(session_id: str, request: Request, user: str = Depends(JWTBearer())):
+    request.app.state.sessions.delete(user, session_id)
+    return {"message": "Session deleted successfully", "session_id": session_id}
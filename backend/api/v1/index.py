@@ -1,91 +1,56 @@
 from fastapi import APIRouter, Depends, Request
 from fastapi import FastAPI, HTTPException, UploadFile, File
-from services.retriever import extract_text_from_docx, extract_text_from_pdf, extract_text_from_txt
-from services.document_store import get_chroma_collection, chunk_text
+from auth.auth_bearer import OptionalJWTBearer
+from services.retriever import is_supported_file
+from services.partitions import partition_for, tenant_for
+from services.ingestion import (
+    BATCH_MAX_FILES,
+    delete_document_chunks,
+    document_lock,
+    ingest_batch,
+    ingest_document,
+    partition_lock
+)
+from services.uploads import MAX_BATCH_UPLOAD_BYTES, SpooledUpload, batch_too_large_error, spool_upload
+from services.retrieval import invalidate_retrieval_cache
+from services.metrics import Operation, span
+from services.state_store import run_state_io
 import uuid
-from models import DocumentInfo
-from typing import List
+from models import DocumentInfo, IngestionJob
+from typing import List, Optional
+
+
+async def _spool_upload(file: UploadFile) -> SpooledUpload:
+    """Validate the file type, then stream the upload to disk (size-limited)"""
+    if not is_supported_file(file.filename):
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported file type. Please upload PDF, DOCX, or TXT files."
+        )
+    return await spool_upload(file)
 
 
 router = APIRouter(prefix="/api", tags=["Index"])
 @router.post("/v1/index")
-async def upload_document(request: Request, file: UploadFile = File(...)):
+async def upload_document(
+    request: Request,
+    file: UploadFile = File(...),
+    user: Optional[str] = Depends(OptionalJWTBearer())
+):
     """
-    Upload and process a document into ChromaDB
+    Upload and process a document into the caller's partition
     """
-    collection = get_chroma_collection(request)
-    if not collection:
-        raise HTTPException(status_code=503, detail="Vector database not initialized")
-    
+    upload = None
+    operation = Operation("upload")
     try:
-        # Check file size (limit to 10MB)
-        content = await file.read()
-        if len(content) > 10 * 1024 * 1024:
-            raise HTTPException(
-                status_code=400,
-                detail="File too large. Maximum size is 10MB."
-            )
-        
-        filename = file.filename.lower()
-        
-        # Extract text based on file type
-        if filename.endswith('.pdf'):
-            text = extract_text_from_pdf(content)
-        elif filename.endswith('.docx'):
-            text = extract_text_from_docx(content)
-        elif filename.endswith('.txt'):
-            text = extract_text_from_txt(content)
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="Unsupported file type. Please upload PDF, DOCX, or TXT files."
-            )
-        
-        if not text.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="No text could be extracted from the document."
-            )
-        
-        # Create chunks
-        chunks = chunk_text(text, chunk_size=1000, overlap=200)
-        
-        # Generate document ID
-        doc_id = str(uuid.uuid4())
-        
-        # Prepare data for ChromaDB
-        chunk_ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
-        metadatas = [
-            {
-                "document_id": doc_id,
-                "filename": file.filename,
-                "chunk_index": i,
-                "total_chunks": len(chunks)
-            }
-            for i in range(len(chunks))
-        ]
-        
-        # Add to ChromaDB (it will automatically generate embeddings)
-        collection.add(
-            documents=chunks,
-            metadatas=metadatas,
-            ids=chunk_ids
-        )
-        
-        # Store document metadata
-        request.app.state.document_metadata[doc_id] = {
-            "filename": file.filename,
-            "chunks": len(chunks),
-            "chunk_ids": chunk_ids
-        }
-        
-        print(f"✅ Added document '{file.filename}' with {len(chunks)} chunks to vector DB")
+        async with partition_for(request, user) as partition:
+            with span("spool"):
+                upload = await _spool_upload(file)
+            result = await ingest_document(partition, file.filename, upload.path, content_hash=upload.content_hash)
         
         return {
-            "message": "Document uploaded successfully",
-            "document_id": doc_id,
-            "filename": file.filename,
-            "chunks_created": len(chunks)
+            "message": "Document already indexed" if result["status"] == "unchanged" else "Document uploaded successfully",
+            **result
         }
         
     except HTTPException:
@@ -95,85 +60,180 @@ async def upload_document(request: Request, file: UploadFile = File(...)):
             status_code=500,
             detail=f"Error processing document: {str(e)}"
         )
+    finally:
+        operation.end()
+        if upload:
+            upload.cleanup()
 
-@router.get("/v1/documents", response_model=List[DocumentInfo])
-async def get_documents(request: Request):
+
+@router.post("/v1/index/batch")
+async def upload_documents(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    user: Optional[str] = Depends(OptionalJWTBearer())
+):
     """
-    Get list of all uploaded documents
+    Upload many documents (or zip archives of documents) in one request.
+    Returns a result per file; a bad file doesn't fail the rest of the batch.
     """
-    return [
-        DocumentInfo(
-            id=uuid.UUID(str(doc_id)),
-            filename=meta["filename"],
-            chunks=meta["chunks"]
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files. Maximum is {BATCH_MAX_FILES}."
         )
-        for doc_id, meta in request.app.state.document_metadata.items()
-    ]
+    # Requests without a Content-Length get past the middleware's check
+    if sum(file.size or 0 for file in files) > MAX_BATCH_UPLOAD_BYTES:
+        raise batch_too_large_error()
 
+    spooled = []
+    uploads = []
+    operation = Operation("upload_batch")
+    try:
+        async with partition_for(request, user) as partition:
+            for file in files:
+                try:
+                    with span("spool"):
+                        upload = await spool_upload(file)
+                except HTTPException as e:
+                    uploads.append((file.filename, None, e.detail))
+                    continue
+                spooled.append(upload)
+                uploads.append((file.filename, upload.path, None))
 
-@router.delete("/v1/documents/{doc_id}")
-async def delete_document(doc_id: str, request: Request):
+            results = await ingest_batch(partition, uploads)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing documents: {str(e)}"
+        )
+    finally:
+        operation.end()
+        for upload in spooled:
+            upload.cleanup()
+
+    indexed = [r for r in results if r["status"] in ("indexed", "updated")]
+    return {
+        "message": f"Indexed {len(indexed)} of {len(results)} documents",
+        "documents_indexed": len(indexed),
+        "chunks_created": sum(r["chunks_created"] for r in indexed),
+        "results": results
+    }
+
+
+@router.post("/v1/index/jobs", status_code=202)
+async def enqueue_document(
+    request: Request,
+    file: UploadFile = File(...),
+    user: Optional[str] = Depends(OptionalJWTBearer())
+):
     """
-    Delete a specific document from the vector database
+    Queue a document for background ingestion into the caller's partition
+    and return its job id immediately
     """
-    collection = get_chroma_collection(request)
-    document_metadata = request.app.state.document_metadata
-    if not collection:
+    if request.app.state.partitions is None:
         raise HTTPException(status_code=503, detail="Vector database not initialized")
-    
-    if doc_id not in document_metadata:
-        raise HTTPException(status_code=404, detail="Document not found")
-    
+    upload = await _spool_upload(file)
     try:
-        # Get chunk IDs for this document
-        chunk_ids = document_metadata[doc_id]["chunk_ids"]
-        
-        # Delete from ChromaDB
-        collection.delete(ids=chunk_ids)
+        job = request.app.state.ingestion_queue.submit(upload, tenant_for(user))
+    except HTTPException:
+        upload.cleanup()
+        raise
+    return {
+        "message": "Document queued for indexing",
+        "job_id": job.id,
+        "filename": job.filename,
+        "status": job.status
+    }
+
+
+@router.get("/v1/index/jobs/{job_id}", response_model=IngestionJob)
+async def get_ingestion_job(job_id: str, request: Request, user: Optional[str] = Depends(OptionalJWTBearer())):
+    """
+    Report progress of a background ingestion job (only to the tenant that queued it)
+    """
+    job = request.app.state.ingestion_queue.get(job_id, tenant_for(user))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/v1/documents", response_model=List[DocumentInfo])
+async def get_documents(request: Request, user: Optional[str] = Depends(OptionalJWTBearer())):
+    """
+    Get list of the caller's uploaded documents
+    """
+    async with partition_for(request, user) as partition:
+        return [
+            DocumentInfo(
+                id=uuid.UUID(str(doc_id)),
+                filename=meta["filename"],
+                chunks=meta["chunks"]
+            )
+            for doc_id, meta in partition.document_metadata.items()
+        ]
+
+
+@router.delete("/v1/documents/{doc_id}")
+async def delete_document(doc_id: str, request: Request, user: Optional[str] = Depends(OptionalJWTBearer())):
+    """
+    Delete a specific document from the caller's partition
+    """
+    async with partition_for(request, user) as partition:
+        document_metadata = partition.document_metadata
         
-        # Remove from metadata
+        if doc_id not in document_metadata:
+            raise HTTPException(status_code=404, detail="Document not found")
         filename = document_metadata[doc_id]["filename"]
-        del document_metadata[doc_id]
-        
-        print(f"🗑️ Deleted document '{filename}' from vector DB")
-        
-        return {"message": "Document deleted successfully"}
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error deleting document: {str(e)}"
-        )
+
+        # Not while a new version of the file is being indexed under the same id
+        async with document_lock(partition.tenant, filename):
+            if doc_id not in document_metadata:
+                raise HTTPException(status_code=404, detail="Document not found")
+            try:
+                # Delete its chunks (by document_id) from the vector store and the lexical index
+                await delete_document_chunks(partition, doc_id)
+                invalidate_retrieval_cache(partition)
+                
+                # Remove from metadata
+                await run_state_io(document_metadata.__delitem__, doc_id)
+                
+                print(f"🗑️ Deleted document '{filename}' from vector DB")
+                
+                return {"message": "Document deleted successfully"}
+                
+            except Exception as e:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Error deleting document: {str(e)}"
+                )
     
 @router.delete("/v1/documents")
-async def delete_all_documents(request: Request):
+async def delete_all_documents(request: Request, user: Optional[str] = Depends(OptionalJWTBearer())):
     """
-    Delete all documents from the vector database
+    Delete all of the caller's documents
     """
-    collection = get_chroma_collection(request)
-    document_metadata = request.app.state.document_metadata
-    if not collection:
-        raise HTTPException(status_code=503, detail="Vector database not initialized")
-    
-    try:
-        # Get all chunk IDs
-        all_chunk_ids = []
-        for meta in document_metadata.values():
-            all_chunk_ids.extend(meta["chunk_ids"])
-        
-        if all_chunk_ids:
-            # Delete from ChromaDB
-            collection.delete(ids=all_chunk_ids)
-        
-        # Clear metadata
-        document_metadata.clear()
-        
-        print("🗑️ Deleted all documents from vector DB")
-        
-        return {"message": "All documents deleted successfully"}
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error deleting documents: {str(e)}"
-        )
\ No newline at end of file
+    async with partition_for(request, user) as partition:
+        store = partition.vector_store
+        document_metadata = partition.document_metadata
+        
+        # Waits for uploads in flight, so none registers chunks the reset dropped
+        async with partition_lock(partition.tenant):
+            try:
+                # Drop and recreate the collection rather than deleting chunk by chunk
+                await store.reset()
+                partition.lexical_index.clear()
+                
+                # Clear metadata
+                await run_state_io(document_metadata.clear)
+                invalidate_retrieval_cache(partition)
+                
+                print("🗑️ Deleted all documents from vector DB")
+                
+                return {"message": "All documents deleted successfully"}
+                
+            except Exception as e:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Error deleting documents: {str(e)}"
+                )
@@ -1,15 +1,33 @@
 # app/auth/auth_bearer.py
 from fastapi import Request, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from .auth_handler import decode_token
+from services.state_store import run_state_io
+from .auth_handler import cached_token_user, decode_token
 
 class JWTBearer(HTTPBearer):
     async def __call__(self, request: Request):
         credentials: HTTPAuthorizationCredentials = await super().__call__(request)
         if credentials:
             token = credentials.credentials
-            user = decode_token(token)
+            user = cached_token_user(token) or await run_state_io(decode_token, token)
             if not user:
                 raise HTTPException(status_code=403, detail="Invalid or expired token")
             return user
         raise HTTPException(status_code=403, detail="Invalid authorization header")
+
+
+class OptionalJWTBearer(HTTPBearer):
+    """Like JWTBearer, but anonymous requests pass through as None"""
+
+    def __init__(self):
+        super().__init__(auto_error=False)
+
+    async def __call__(self, request: Request):
+        credentials: HTTPAuthorizationCredentials = await super().__call__(request)
+        if credentials is None:
+            return None
+        token = credentials.credentials
+        user = cached_token_user(token) or await run_state_io(decode_token, token)
+        if not user:
+            raise HTTPException(status_code=403, detail="Invalid or expired token")
+        return user
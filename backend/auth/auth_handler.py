@@ -1,33 +1,108 @@
 # app/auth/auth_handler.py
 from datetime import datetime, timedelta
+from typing import Optional
 from jose import jwt, JWTError
+import hashlib
 import os
+import time
+import uuid
 from dotenv import load_dotenv
+from services.cache import LRUCache
+from services.state_store import STATE_SYNC_INTERVAL, get_state_store
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Verified tokens kept per process, so repeat requests skip the signature check
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
-# in-memory blacklist (for logout)
-blacklist = set()
+# Logged-out token ids (`jti`), kept in the shared state store (see
+# STATE_BACKEND) until the token would have expired anyway
+REVOKED_TOKENS = "revoked_tokens"
+# Seconds a worker trusts its last revocation lookup for a token; a logout
+# on another worker takes effect here within this delay
+REVOCATION_CHECK_SECONDS = float(os.getenv("REVOCATION_CHECK_SECONDS", str(STATE_SYNC_INTERVAL)))
+
+# token -> claims
+_verified_tokens = LRUCache(
+    "tokens",
+    max_entries=TOKEN_CACHE_SIZE,
+    max_bytes=TOKEN_CACHE_SIZE * 1024,
+    ttl_seconds=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+# jti -> revoked?
+_revocation_checks = LRUCache(
+    "revocations",
+    max_entries=TOKEN_CACHE_SIZE,
+    max_bytes=TOKEN_CACHE_SIZE * 256,
+    ttl_seconds=REVOCATION_CHECK_SECONDS
+)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def decode_token(token: str):
-    try:
-        if token in blacklist:
+def verify_token(token: str) -> Optional[dict]:
+    """Claims ("sub", "jti", "exp") of a valid token that wasn't logged out, else None"""
+    claims = _verified_tokens.get(token)
+    if claims is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
             return None
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
-    except JWTError:
+        claims = {
+            "sub": payload.get("sub"),
+            # Tokens issued before jti was added are revoked by their hash
+            "jti": payload.get("jti") or _token_key(token),
+            "exp": payload.get("exp")
+        }
+        _verified_tokens.set(token, claims)
+    elif claims["exp"] is not None and claims["exp"] <= time.time():
+        return None
+    if is_revoked(claims["jti"]):
         return None
+    return claims
+
+def decode_token(token: str):
+    claims = verify_token(token)
+    return claims["sub"] if claims else None
+
+def cached_token_user(token: str) -> Optional[str]:
+    """
+    The token's user when its verification and revocation check are both
+    cached, so no state store I/O is needed; None means "call decode_token".
+    """
+    claims = _verified_tokens.get(token)
+    if claims is None or (claims["exp"] is not None and claims["exp"] <= time.time()):
+        return None
+    if _revocation_checks.get(claims["jti"]) is not False:
+        return None
+    return claims["sub"]
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def is_revoked(jti: str) -> bool:
+    revoked = _revocation_checks.get(jti)
+    if revoked is None:
+        revoked = get_state_store().get(REVOKED_TOKENS, jti) is not None
+        _revocation_checks.set(jti, revoked)
+    return revoked
+
+def invalidate_token(token: str) -> bool:
+    """Revoke a token until it expires; False if it wasn't valid to begin with"""
+    claims = verify_token(token)
+    if claims is None:
+        return False
+    ttl = ACCESS_TOKEN_EXPIRE_MINUTES * 60 if claims["exp"] is None else claims["exp"] - time.time()
+    get_state_store().put(REVOKED_TOKENS, claims["jti"], True, ttl=max(ttl, 1))
+    _revocation_checks.set(claims["jti"], True)
+    return True
 
-def invalidate_token(token: str):
-    blacklist.add(token)
+def token_cache_stats() -> dict:
+    return {"verified": _verified_tokens.stats(), "revocations": _revocation_checks.stats()}
@@ -0,0 +1,158 @@
+"""
+Auth hot path benchmark, in process (no server or network needed):
+
+- verify:   token checks per second (decode_token) over --tokens distinct
+            tokens, with the verified-token and revocation caches off and on;
+- requests: authenticated requests per second through a route guarded by
+            JWTBearer, cache off and on;
+- burst:    latency of authenticated requests while --logins logins run
+            bcrypt on the password pool.
+
+    cd backend
+    python -m benchmarks.bench_auth
+    STATE_BACKEND=sqlite STATE_PATH=/tmp/bench-state.db python -m benchmarks.bench_auth --json
+
+Every check also looks the token up in the revocation store, so the
+STATE_BACKEND in use shows in the numbers. For requests/s across several
+uvicorn workers, see `benchmarks/load_test.py --scenario auth`.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+from fastapi import Depends, FastAPI
+
+from auth import auth_handler
+from auth.auth_bearer import JWTBearer
+from auth.auth_handler import create_access_token, decode_token
+from benchmarks.bench_rag import percentiles
+from routes.user_router import router as user_router
+
+PASSWORD = "bench-auth-password"
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(user_router)
+
+    @app.get("/whoami")
+    def whoami(user: str = Depends(JWTBearer())):
+        return {"user": user}
+
+    return app
+
+
+def set_token_cache(enabled: bool):
+    for cache in (auth_handler._verified_tokens, auth_handler._revocation_checks):
+        cache.clear()
+        cache.max_entries = auth_handler.TOKEN_CACHE_SIZE if enabled else 0
+
+
+def bench_verify(tokens, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            if decode_token(token) is None:
+                raise SystemExit("A benchmark token failed verification")
+    return rounds * len(tokens) / (time.perf_counter() - start)
+
+
+async def drive(client, tokens, concurrency: int, duration: float):
+    """Authenticated GET /whoami from `concurrency` tasks for `duration` seconds"""
+    latencies = []
+    stop_at = time.monotonic() + duration
+
+    async def user(offset):
+        i = offset
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            response = await client.get("/whoami", headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"})
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+            i += concurrency
+
+    await asyncio.gather(*(user(offset) for offset in range(concurrency)))
+    return latencies
+
+
+async def bench_requests(app, tokens, concurrency: int, duration: float) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await drive(client, tokens, concurrency, 0.5)  # warmup
+        latencies = await drive(client, tokens, concurrency, duration)
+    return {"requests_per_s": round(len(latencies) / duration, 1), "latency_ms": percentiles(latencies)}
+
+
+async def bench_burst(app, tokens, logins: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        (await client.post("/auth/v1/signup", json={"email": email, "password": PASSWORD})).raise_for_status()
+        baseline = await drive(client, tokens, concurrency, 1.0)
+
+        async def login():
+            response = await client.post("/auth/v1/login", json={"email": email, "password": PASSWORD})
+            return response.status_code
+
+        started = time.perf_counter()
+        burst = asyncio.gather(*(login() for _ in range(logins)))
+        during = []
+        while not burst.done():
+            during.extend(await drive(client, tokens, concurrency, 0.2))
+        statuses = await burst
+        seconds = time.perf_counter() - started
+    return {
+        "logins": logins,
+        "logins_ok": statuses.count(200),
+        "logins_rejected_busy": statuses.count(503),
+        "logins_per_s": round(logins / seconds, 1),
+        "requests_latency_ms_idle": percentiles(baseline),
+        "requests_latency_ms_during_burst": percentiles(during)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=100, help="distinct users/tokens")
+    parser.add_argument("--rounds", type=int, default=100, help="passes over the tokens in the verify benchmark")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent authenticated requests")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per requests/s measurement")
+    parser.add_argument("--logins", type=int, default=32, help="concurrent logins in the burst")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    tokens = [create_access_token({"sub": f"user-{i}@example.com"}) for i in range(args.tokens)]
+    app = build_app()
+    results = {"tokens": len(tokens), "verify_per_s": {}, "requests": {}}
+    for label, enabled in (("uncached", False), ("cached", True)):
+        set_token_cache(enabled)
+        results["verify_per_s"][label] = round(bench_verify(tokens, args.rounds), 1)
+        results["requests"][label] = asyncio.run(bench_requests(app, tokens, args.concurrency, args.duration))
+    results["burst"] = asyncio.run(bench_burst(app, tokens, args.logins, args.concurrency))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['tokens']} tokens, {args.concurrency} concurrent requests")
+    for label in ("uncached", "cached"):
+        requests = results["requests"][label]
+        print(
+            f"  {label:<9} {results['verify_per_s'][label]:>10.1f} checks/s"
+            f"  {requests['requests_per_s']:>8.1f} requests/s  p95 {requests['latency_ms'].get('p95')} ms"
+        )
+    burst = results["burst"]
+    print(
+        f"  burst of {burst['logins']} logins: {burst['logins_ok']} ok, {burst['logins_rejected_busy']} rejected (busy),"
+        f" {burst['logins_per_s']} logins/s"
+    )
+    print(
+        f"  request p95 idle {burst['requests_latency_ms_idle'].get('p95')} ms,"
+        f" during burst {burst['requests_latency_ms_during_burst'].get('p95')} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
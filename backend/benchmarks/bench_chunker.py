@@ -0,0 +1,110 @@
+"""
+Chunker throughput benchmark: the original character chunker (`chunk_text`)
+against the token-aligned TokenChunker.
+
+    cd backend
+    python -m benchmarks.bench_chunker                 # ~5MB of generated text
+    python -m benchmarks.bench_chunker --file big.txt  # your own text
+    python -m benchmarks.bench_chunker --size-mb 20 --json
+
+Reports MB/s, chunk counts and, when the embedding tokenizer is available,
+how many tokens the character chunks lose to the model's 256-token limit.
+"""
+import argparse
+import json
+import random
+import time
+
+from services.chunker import CHUNK_MAX_TOKENS, TokenChunker, chunk_text, load_tokenizer
+
+WORDS = (
+    "the pump valve pressure must be checked before each maintenance cycle and the operator records "
+    "every reading in the log sheet while flow rate temperature and voltage stay within limits "
+    "replace filter AB-1234 when differential pressure exceeds 0.8 bar see section 4.2 for details"
+).split()
+
+
+def generate_text(size_mb: float, seed: int = 0) -> str:
+    """Paragraphs of sentences of 5-30 words, roughly `size_mb` megabytes"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    paragraphs, size = [], 0
+    while size < target:
+        sentences = []
+        for _ in range(rng.randint(2, 8)):
+            words = rng.choices(WORDS, k=rng.randint(5, 30))
+            sentences.append(" ".join(words).capitalize() + rng.choice(".....?!"))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def timed(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="text file to chunk instead of generated text")
+    parser.add_argument("--size-mb", type=float, default=5.0, help="size of the generated text")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per chunker; the best is reported")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+    else:
+        text = generate_text(args.size_mb)
+    megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+
+    tokenizer = load_tokenizer()
+    chunker = TokenChunker(tokenizer=tokenizer)
+    runs = {
+        "chars (chunk_text)": lambda: chunk_text(text),
+        "tokens (spans only)": lambda: chunker.spans(text),
+        "tokens (with strings)": lambda: chunker.chunk(text),
+    }
+
+    results = {"text_mb": round(megabytes, 2), "exact_tokenizer": tokenizer is not None, "chunkers": {}}
+    outputs = {}
+    for name, fn in runs.items():
+        seconds, output = timed(fn, args.repeat)
+        outputs[name] = output
+        results["chunkers"][name] = {
+            "seconds": round(seconds, 3),
+            "mb_per_s": round(megabytes / seconds, 2),
+            "chunks": len(output)
+        }
+
+    if tokenizer is not None:
+        # Tokens each chunker's chunks would lose to the model's input limit
+        for name in ("chars (chunk_text)", "tokens (with strings)"):
+            lengths = [len(e.ids) for e in tokenizer.encode_batch(outputs[name], add_special_tokens=False)]
+            over = [n for n in lengths if n > CHUNK_MAX_TOKENS]
+            results["chunkers"][name].update({
+                "mean_tokens": round(sum(lengths) / max(len(lengths), 1), 1),
+                "max_tokens": max(lengths, default=0),
+                "chunks_over_limit": len(over),
+                "tokens_truncated_pct": round(100 * sum(n - CHUNK_MAX_TOKENS for n in over) / max(sum(lengths), 1), 2)
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"Text: {results['text_mb']} MB, tokenizer: {'model' if tokenizer is not None else 'approximate'}")
+    for name, stats in results["chunkers"].items():
+        line = f"  {name:<24} {stats['mb_per_s']:>8.2f} MB/s  {stats['chunks']:>8} chunks"
+        if "max_tokens" in stats:
+            line += f"  max {stats['max_tokens']} tokens, {stats['chunks_over_limit']} over limit ({stats['tokens_truncated_pct']}% of tokens dropped)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Embedding throughput benchmark: Chroma's stock DefaultEmbeddingFunction
+against our ONNX provider (services/onnx_embedder.py), in fp32 and int8.
+
+    cd backend
+    python -m benchmarks.bench_embeddings
+    python -m benchmarks.bench_embeddings --chunks 2000 --queries 500 --json
+    python -m benchmarks.bench_embeddings --quantize none   # skip int8 (needs the onnx package)
+
+Reports texts/s for chunk batches (ingestion) and single queries (the
+query path), and how close each variant's vectors are to the stock
+function's (cosine similarity, mean and worst case). Downloads the model
+on first run.
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from benchmarks.bench_chunker import WORDS, generate_text
+from services.chunker import chunk_text
+from services.embeddings import create_embedding_function
+
+
+def generate_queries(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, 12))) + "?" for _ in range(count)]
+
+
+def embed_chunks(fn, chunks, batch_size: int):
+    vectors = []
+    for start in range(0, len(chunks), batch_size):
+        vectors.extend(fn(chunks[start:start + batch_size]))
+    return np.array(vectors)
+
+
+def embed_queries(fn, queries):
+    return np.array([fn([query])[0] for query in queries])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def agreement(vectors, reference) -> dict:
+    cosine = np.sum(vectors * reference, axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+    )
+    return {"mean_cosine": round(float(cosine.mean()), 5), "min_cosine": round(float(cosine.min()), 5)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000, help="document chunks to embed")
+    parser.add_argument("--queries", type=int, default=200, help="queries to embed, one call each")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks per call, as ingestion sends them")
+    parser.add_argument("--quantize", default="none,int8", help="comma-separated ONNX provider variants")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    chunks = chunk_text(generate_text(1.0))
+    chunks = (chunks * (args.chunks // max(len(chunks), 1) + 1))[:args.chunks]
+    queries = generate_queries(args.queries)
+
+    variants = {"chroma (stock)": lambda: create_embedding_function("chroma")}
+    for quantize in args.quantize.split(","):
+        variants[f"onnx ({'fp32' if quantize == 'none' else quantize})"] = (
+            lambda quantize=quantize: create_embedding_function("onnx", quantize=quantize)
+        )
+
+    results = {"chunks": len(chunks), "queries": len(queries), "variants": {}}
+    reference = None
+    for name, factory in variants.items():
+        try:
+            fn = factory()
+            load_seconds, _ = timed(lambda: fn(["warmup"]))
+        except Exception as e:
+            results["variants"][name] = {"error": str(e)}
+            continue
+        chunk_seconds, chunk_vectors = timed(lambda: embed_chunks(fn, chunks, args.batch_size))
+        query_seconds, query_vectors = timed(lambda: embed_queries(fn, queries))
+        stats = {
+            "load_seconds": round(load_seconds, 2),
+            "chunks_per_s": round(len(chunks) / chunk_seconds, 1),
+            "queries_per_s": round(len(queries) / query_seconds, 1),
+        }
+        if reference is None:
+            reference = (chunk_vectors, query_vectors)
+        else:
+            stats["chunks_vs_stock"] = agreement(chunk_vectors, reference[0])
+            stats["queries_vs_stock"] = agreement(query_vectors, reference[1])
+        results["variants"][name] = stats
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['chunks']} chunks (batches of {args.batch_size}), {results['queries']} single queries")
+    for name, stats in results["variants"].items():
+        if "error" in stats:
+            print(f"  {name:<16} skipped: {stats['error']}")
+            continue
+        line = f"  {name:<16} {stats['chunks_per_s']:>8.1f} chunks/s  {stats['queries_per_s']:>8.1f} queries/s"
+        if "chunks_vs_stock" in stats:
+            line += (
+                f"  cosine vs stock: mean {stats['chunks_vs_stock']['mean_cosine']}"
+                f" / min {min(stats['chunks_vs_stock']['min_cosine'], stats['queries_vs_stock']['min_cosine'])}"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
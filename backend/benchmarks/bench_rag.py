@@ -0,0 +1,330 @@
+"""
+Offline benchmark and evaluation harness for the RAG pipeline.
+
+Indexes the labelled fixtures in benchmarks/fixtures, then grows the corpus
+with generated filler documents. At each size it measures:
+- ingestion throughput (documents/s, chunks/s)
+- retrieval latency percentiles
+- memory (process RSS, vector and lexical index sizes)
+- retrieval quality on the labelled questions: recall@k, hit rate@k and
+  MRR, plus the `1 / (1 + distance)` score the chat endpoint reports for
+  relevant and irrelevant chunks
+
+Everything runs in-process against a throwaway ephemeral store; no LLM
+or network service is called (the embedding model must be available
+locally). The current settings are used (VECTOR_BACKEND, CHUNKER,
+CHUNK_*, HYBRID_SEARCH, ...), so two runs with different settings can be
+compared. Results are printed (or written) as JSON.
+
+    cd backend
+    python -m benchmarks.bench_rag
+    python -m benchmarks.bench_rag --sizes 0,200,1000 --output results.json
+    python -m benchmarks.bench_rag --baseline results.json   # exit 1 on regression
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+FILLER_WORDS = (
+    "account agenda album animal answer apple archive autumn balance ball basket beach bicycle bird "
+    "blanket book bottle bread bridge brother budget button cabinet camera candle canvas captain card "
+    "carpet castle chair channel chapter cheese chicken choice circle city cloud coffee collection colour "
+    "concert corner cotton country course cousin crowd culture curtain dance daughter desert dinner doctor "
+    "dream dress driver engine evening example factory family farmer festival field finger flower forest "
+    "friend fruit garden gate gift glass guitar harbour history holiday honey horse hotel island jacket "
+    "journey kitchen ladder language letter library lunch market meadow memory method minute mirror morning "
+    "mountain museum music nature neighbour newspaper novel ocean orange painting paper parent party pencil "
+    "picture planet poem pocket poetry potato puzzle question rabbit recipe river road season shadow "
+    "shoulder singer sister sky smile song spring station story street student summer sunset table teacher "
+    "theatre ticket tomato tower town tradition train travel tree umbrella uncle valley village violin "
+    "voice weather window winter wood writer year yellow"
+).split()
+
+
+def load_fixtures(path: str = FIXTURES):
+    """(filename, bytes) documents and the labelled questions"""
+    docs_dir = os.path.join(path, "docs")
+    documents = []
+    for name in sorted(os.listdir(docs_dir)):
+        with open(os.path.join(docs_dir, name), "rb") as f:
+            documents.append((name, f.read()))
+    with open(os.path.join(path, "questions.json"), "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    return documents, questions
+
+
+def filler_documents(start: int, stop: int, words: int = 600):
+    """Deterministic distractor documents number `start` to `stop - 1`"""
+    for number in range(start, stop):
+        rng = random.Random(number)
+        sentences, count = [], 0
+        while count < words:
+            length = rng.randint(6, 24)
+            sentences.append(" ".join(rng.choices(FILLER_WORDS, k=length)).capitalize() + ".")
+            count += length
+        paragraphs = [" ".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6)]
+        yield f"filler_{number:06d}.txt", "\n\n".join(paragraphs).encode("utf-8")
+
+
+def rss_mb() -> float:
+    """Resident memory of this process in MB"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(samples_ms) -> dict:
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {}
+
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": at(50),
+        "p90": at(90),
+        "p95": at(95),
+        "p99": at(99),
+        "max": round(ordered[-1], 3)
+    }
+
+
+async def ingest(partition, documents) -> dict:
+    from services.ingestion import ingest_document
+
+    count, chunks = 0, 0
+    start = time.perf_counter()
+    for filename, content in documents:
+        result = await ingest_document(partition, filename, content)
+        count += 1
+        chunks += result["chunks_created"]
+    seconds = time.perf_counter() - start
+    return {
+        "documents": count,
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "documents_per_s": round(count / seconds, 2) if count else None,
+        "chunks_per_s": round(chunks / seconds, 2) if count else None
+    }
+
+
+async def measure_latency(partition, queries, n_results: int, rounds: int) -> dict:
+    from services.retrieval import retrieve
+
+    samples = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            await retrieve(partition, query, n_results)
+            samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+
+async def evaluate(partition, questions, ks) -> dict:
+    """
+    A retrieved chunk is relevant when it comes from one of the question's
+    documents and contains one of its evidence strings. recall@k is the
+    share of evidence strings found in the top k, averaged over questions.
+    """
+    from services.retrieval import retrieve
+
+    depth = max(ks)
+    recall = {k: 0.0 for k in ks}
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks = 0.0
+    relevant_scores, other_scores = [], []
+    for question in questions:
+        results = await retrieve(partition, question["question"], depth)
+        evidence = question["evidence"]
+        found_at = {}  # evidence index -> first rank it appears at
+        first_relevant = None
+        for rank, (text, metadata, distance) in enumerate(
+            zip(results["documents"], results["metadatas"], results["distances"]), start=1
+        ):
+            matched = [
+                i for i, snippet in enumerate(evidence)
+                if metadata.get("filename") in question["documents"] and snippet in text
+            ]
+            for i in matched:
+                found_at.setdefault(i, rank)
+            if matched and first_relevant is None:
+                first_relevant = rank
+            # The score the chat endpoint shows next to each source
+            (relevant_scores if matched else other_scores).append(1 / (1 + distance))
+        for k in ks:
+            recall[k] += sum(1 for rank in found_at.values() if rank <= k) / len(evidence)
+            hits[k] += first_relevant is not None and first_relevant <= k
+        reciprocal_ranks += 1 / first_relevant if first_relevant else 0.0
+
+    n = len(questions)
+    return {
+        "questions": n,
+        **{f"recall@{k}": round(recall[k] / n, 4) for k in ks},
+        **{f"hit_rate@{k}": round(hits[k] / n, 4) for k in ks},
+        f"mrr@{depth}": round(reciprocal_ranks / n, 4),
+        "score_relevant_mean": round(sum(relevant_scores) / len(relevant_scores), 4) if relevant_scores else None,
+        "score_other_mean": round(sum(other_scores) / len(other_scores), 4) if other_scores else None
+    }
+
+
+def memory_stats(partition) -> dict:
+    gc.collect()
+    stats = {"rss_mb": rss_mb(), "lexical_index": partition.lexical_index.stats()}
+    index = getattr(partition.vector_store, "index", None)
+    if index is not None:
+        stats["vector_index_mb"] = round(index.nbytes / (1024 * 1024), 2)
+    return stats
+
+
+def compare(results: dict, baseline: dict, ks, tolerance: float, latency_tolerance: float) -> list:
+    """Regressions of each step against the baseline's step with the same corpus size"""
+    regressions = []
+    baseline_steps = {step["filler_documents"]: step for step in baseline.get("steps", [])}
+    for step in results["steps"]:
+        before = baseline_steps.get(step["filler_documents"])
+        if before is None:
+            continue
+        for metric in [f"recall@{k}" for k in ks] + [f"mrr@{max(ks)}"]:
+            old, new = before["quality"].get(metric), step["quality"].get(metric)
+            if old is not None and new is not None and new < old - tolerance:
+                regressions.append(f"{metric} at {step['filler_documents']} filler docs: {old} -> {new}")
+        old, new = before["latency_ms"].get("p95"), step["latency_ms"].get("p95")
+        if old and new and new > old * (1 + latency_tolerance):
+            regressions.append(f"p95 latency at {step['filler_documents']} filler docs: {old} ms -> {new} ms")
+    return regressions
+
+
+def configure_environment(args):
+    """Point the app at a throwaway ephemeral store (and optionally disable caches) before importing it"""
+    os.environ["VECTOR_STORE_MODE"] = "ephemeral"
+    os.environ["CHROMA_PATH"] = tempfile.mkdtemp(prefix="rag-bench-")
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+    if not args.warm_cache:
+        os.environ["QUERY_EMBEDDING_CACHE_SIZE"] = "0"
+        os.environ["RETRIEVAL_CACHE_SIZE"] = "0"
+
+
+async def run(args) -> dict:
+    import main
+    from services.chunker import CHUNKER, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+    from services.retrieval import HYBRID_CANDIDATES, HYBRID_SEARCH
+    from services.vector_index import VECTOR_INDEX_DTYPE
+    from services.vector_store import VECTOR_BACKEND
+
+    from services.partitions import PUBLIC_TENANT
+
+    try:
+        partition = await main.app.state.partitions.open(PUBLIC_TENANT)
+    except Exception as e:
+        raise SystemExit(f"Vector store failed to initialize: {e}")
+    ks = sorted(set(args.k))
+    documents, questions = load_fixtures(args.fixtures)
+    queries = [question["question"] for question in questions]
+
+    results = {
+        "config": {
+            "vector_backend": VECTOR_BACKEND,
+            "vector_index_dtype": VECTOR_INDEX_DTYPE,
+            "chunker": CHUNKER,
+            "chunk_max_tokens": CHUNK_MAX_TOKENS,
+            "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+            "hybrid_search": HYBRID_SEARCH,
+            "hybrid_candidates": HYBRID_CANDIDATES,
+            "n_results": args.n_results,
+            "caches": args.warm_cache,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count()
+        },
+        "memory_baseline": {"rss_mb": rss_mb()},
+        "fixtures": await ingest(partition, documents),
+        "steps": []
+    }
+
+    indexed_filler = 0
+    for size in sorted(set(args.sizes)):
+        step_ingestion = await ingest(partition, filler_documents(indexed_filler, size, args.filler_words))
+        indexed_filler = max(indexed_filler, size)
+        # One untimed pass loads the query path (model sessions, pools)
+        await measure_latency(partition, queries[:3], args.n_results, 1)
+        step = {
+            "filler_documents": size,
+            "chunks": await partition.vector_store.count(),
+            "ingestion": step_ingestion,
+            "latency_ms": await measure_latency(partition, queries, args.n_results, args.rounds),
+            "memory": memory_stats(partition),
+            "quality": await evaluate(partition, questions, ks)
+        }
+        results["steps"].append(step)
+        print(
+            f"📊 {step['chunks']} chunks: p95 {step['latency_ms']['p95']} ms, "
+            f"recall@{ks[0]} {step['quality'][f'recall@{ks[0]}']}, mrr {step['quality'][f'mrr@{max(ks)}']}",
+            file=sys.stderr
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=FIXTURES, help="directory with docs/ and questions.json")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[0, 100, 500],
+                        help="comma-separated filler document counts to measure at")
+    parser.add_argument("--filler-words", type=int, default=600, help="words per filler document")
+    parser.add_argument("-k", type=int, nargs="+", default=[1, 3, 5, 10], help="cutoffs for recall/hit rate")
+    parser.add_argument("--n-results", type=int, default=3, help="results per query in the latency runs (chat uses 3)")
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the question set per latency measurement")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the query embedding and retrieval caches on")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="earlier results to compare against; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="allowed drop in recall/MRR")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25, help="allowed relative p95 latency increase")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    from services.executors import shutdown_pools
+
+    # The app logs to stdout (also at exit); keep stdout for the JSON results
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutdown_pools()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output, file=stdout)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, sorted(set(args.k)), args.tolerance, args.latency_tolerance)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
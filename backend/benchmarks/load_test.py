@@ -0,0 +1,214 @@
+"""
+HTTP load test of the API at different uvicorn worker counts, in
+multi-worker mode (users, revoked tokens and the document registry in a
+shared state store, SQLite by default).
+
+For each worker count it starts `uvicorn main:app --workers N` on a free
+port with a fresh state file, checks that workers agree on shared state
+(every user signed up through one connection can log in through others),
+then drives the server from several client processes and reports
+requests/s and latency percentiles.
+
+    cd backend
+    python -m benchmarks.load_test --workers 1,2,4
+    python -m benchmarks.load_test --workers 1,4 --scenario documents --duration 20 --json
+
+Scenarios:
+  auth       GET /api/v1/sessions with a bearer token (cached JWT check + revocation lookup)
+  documents  GET /api/v1/documents (document registry read)
+  login      POST /auth/v1/login (bcrypt, CPU bound)
+
+Throughput can only scale up to the number of free cores, and the client
+processes need cores too: on a small machine, point --url at a server
+started elsewhere, or run the clients on another host.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+from benchmarks.bench_rag import percentiles
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "load-test-password"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, state_dir: str, state_backend: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "STATE_BACKEND": state_backend,
+        "STATE_PATH": os.path.join(state_dir, "state.db"),
+        "WARMUP": "false",
+    })
+    env.setdefault("GROQ_API_KEY", "unused")  # no LLM calls are made
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+
+
+def wait_until_up(url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/healthz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"Server at {url} did not come up within {timeout}s")
+
+
+def signup_and_login(url: str, email: str) -> str:
+    # A new client per call: no keep-alive, so requests land on different workers
+    with httpx.Client(base_url=url, timeout=30) as client:
+        client.post("/auth/v1/signup", json={"email": email, "password": PASSWORD}).raise_for_status()
+    with httpx.Client(base_url=url, timeout=30) as client:
+        response = client.post("/auth/v1/login", json={"email": email, "password": PASSWORD})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+
+def check_consistency(url: str, users: int) -> dict:
+    """Sign up users and log each in over a fresh connection; counts logins that fail"""
+    failures = 0
+    for _ in range(users):
+        try:
+            signup_and_login(url, f"consistency-{uuid.uuid4().hex[:12]}@example.com")
+        except httpx.HTTPError:
+            failures += 1
+    return {"users": users, "failed_logins": failures}
+
+
+def build_request(scenario: str, email: str, token: str):
+    if scenario == "auth":
+        return "GET", "/api/v1/sessions", {"headers": {"Authorization": f"Bearer {token}"}}
+    if scenario == "documents":
+        return "GET", "/api/v1/documents", {}
+    if scenario == "login":
+        return "POST", "/auth/v1/login", {"json": {"email": email, "password": PASSWORD}}
+    raise SystemExit(f"Unknown scenario '{scenario}'")
+
+
+async def _drive(url: str, scenario: str, email: str, token: str, concurrency: int, warmup: float, duration: float):
+    method, path, kwargs = build_request(scenario, email, token)
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        start = time.monotonic()
+        measure_from, stop_at = start + warmup, start + warmup + duration
+
+        async def user():
+            nonlocal errors
+            while True:
+                sent = time.monotonic()
+                if sent >= stop_at:
+                    return
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if sent >= measure_from:
+                    if ok:
+                        latencies.append((time.monotonic() - sent) * 1000)
+                    else:
+                        errors += 1
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(url, scenario, email, token, concurrency, warmup, duration):
+    return asyncio.run(_drive(url, scenario, email, token, concurrency, warmup, duration))
+
+
+def run_load(args, url: str) -> dict:
+    email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+    token = signup_and_login(url, email)
+    with ProcessPoolExecutor(max_workers=args.client_processes) as pool:
+        futures = [
+            pool.submit(client_process, url, args.scenario, email, token, args.concurrency, args.warmup, args.duration)
+            for _ in range(args.client_processes)
+        ]
+        results = [future.result() for future in futures]
+    latencies = [ms for samples, _ in results for ms in samples]
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "requests_per_s": round(len(latencies) / args.duration, 1),
+        "latency_ms": percentiles(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=lambda s: [int(x) for x in s.split(",")], default=[1, 2, 4],
+                        help="comma-separated uvicorn worker counts")
+    parser.add_argument("--scenario", default="auth", choices=["auth", "documents", "login"])
+    parser.add_argument("--state-backend", default="sqlite", choices=["sqlite", "redis", "memory"],
+                        help="STATE_BACKEND for the server; 'memory' shows what breaks without shared state")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each run")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per client process")
+    parser.add_argument("--client-processes", type=int, default=2)
+    parser.add_argument("--consistency-users", type=int, default=20,
+                        help="users signed up and logged in over separate connections per run")
+    parser.add_argument("--url", help="load an already running server instead (--workers is then only a label)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = {"scenario": args.scenario, "state_backend": args.state_backend, "cpus": os.cpu_count(), "runs": []}
+    for workers in args.workers:
+        server = None
+        with tempfile.TemporaryDirectory(prefix="load-test-") as state_dir:
+            url = args.url
+            if url is None:
+                port = free_port()
+                url = f"http://127.0.0.1:{port}"
+                server = start_server(workers, port, state_dir, args.state_backend)
+            try:
+                wait_until_up(url)
+                run = {"workers": workers, "consistency": check_consistency(url, args.consistency_users)}
+                run.update(run_load(args, url))
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait(timeout=60)
+        results["runs"].append(run)
+        if not args.json:
+            print(
+                f"{workers} worker(s): {run['requests_per_s']:>8.1f} req/s  "
+                f"p50 {run['latency_ms'].get('p50')} ms  p99 {run['latency_ms'].get('p99')} ms  "
+                f"errors {run['errors']}  failed cross-worker logins "
+                f"{run['consistency']['failed_logins']}/{run['consistency']['users']}",
+                flush=True
+            )
+
+    base = results["runs"][0]["requests_per_s"] if results["runs"] else 0
+    for run in results["runs"]:
+        run["speedup"] = round(run["requests_per_s"] / base, 2) if base else None
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,27 @@
-from typing import Union
-
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from api.v1 import chat, index
 from routes import user_router
-from services.document_store import DocumentStore
+from services.embeddings import EmbeddingBatcher, get_embedding_function
+from services.executors import shutdown_pools
+from services.metrics import METRICS_ENABLED, SERVER_TIMING, register_app_metrics, render_metrics, start_trace
+from services.ingestion import IngestionQueue
+from services.retrieval import create_retrieval_caches
+from services.sessions import SessionStore
+from services.registry import DocumentRegistry, SharedDocumentRegistry, clear_shared_registries, watch_registry
+from services.state_store import get_state_store
+from services.partitions import PUBLIC_TENANT, PartitionManager, partition_key
+from services.prompt_builder import get_encoding
+from services.vector_store import ChromaVectorStore, LocalVectorStore, VECTOR_BACKEND
+from services.uploads import MAX_BATCH_UPLOAD_BYTES, MAX_UPLOAD_BYTES, batch_too_large_error, too_large_error
+from services.warmup import WARMUP, readiness, warmup
 import chromadb
 from chromadb.config import Settings
-import uuid
+import asyncio
 import atexit
 import shutil
-import io
 import os
 
 app = FastAPI()
@@ -25,27 +35,142 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize ChromaDB client (in-memory with persistence for session)
-CHROMA_PATH = "./chroma_db"
-chroma_client = chromadb.Client(Settings(
-    persist_directory=CHROMA_PATH,
-    anonymized_telemetry=False
-))
-
-# Get or create collection
-try:
-    collection = chroma_client.get_or_create_collection(
-        name="documents",
-        metadata={"hnsw:space": "cosine"}
-    )
-    print(f"✅ ChromaDB initialized. Collection has {collection.count()} documents.")
-except Exception as e:
-    print(f"⚠️ Error initializing ChromaDB: {e}")
-    collection = None
-
-app.state.chroma_client = chroma_client
-app.state.collection = collection
-app.state.document_metadata = {}
+# Upload endpoints: reject oversized bodies from Content-Length before the
+# multipart parser spools them (1MB slack for multipart framing)
+UPLOAD_LIMITS = {
+    "/api/v1/index": (MAX_UPLOAD_BYTES, too_large_error),
+    "/api/v1/index/jobs": (MAX_UPLOAD_BYTES, too_large_error),
+    "/api/v1/index/batch": (MAX_BATCH_UPLOAD_BYTES, batch_too_large_error),
+}
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    limit = UPLOAD_LIMITS.get(request.url.path) if request.method == "POST" else None
+    if limit is not None:
+        max_bytes, too_large = limit
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes + 1024 * 1024:
+            error = too_large()
+            return JSONResponse(status_code=error.status_code, content={"detail": error.detail})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Collect per-stage timings for the request; optionally return them as Server-Timing"""
+    trace = start_trace()
+    response = await call_next(request)
+    # Streaming responses only carry the stages finished before the first byte
+    if SERVER_TIMING and trace.timings:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+# Vector store mode:
+# - "ephemeral" (default): in-memory ChromaDB, wiped on shutdown
+# - "persistent": on-disk ChromaDB + document registry that survive restarts
+VECTOR_STORE_MODE = os.getenv("VECTOR_STORE_MODE", "ephemeral").lower()
+PERSISTENT = VECTOR_STORE_MODE == "persistent"
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+# Partitions of signed-in users keep their files under here (see open_partition)
+TENANTS_PATH = os.path.join(CHROMA_PATH, "tenants")
+STARTUP_CONSISTENCY_CHECK = os.getenv("STARTUP_CONSISTENCY_CHECK", "true").lower() == "true"
+# Chroma server shared by all workers (multi-worker mode); overrides VECTOR_STORE_MODE
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+# Vectors that don't outlive the process: in-memory Chroma, or the local
+# index outside persistent mode (its files are removed on exit)
+EPHEMERAL_VECTORS = not PERSISTENT and (VECTOR_BACKEND == "local" or not CHROMA_HOST)
+
+# Users, revoked tokens and the document registry (see STATE_BACKEND)
+state_store = get_state_store()
+
+# Embedding function shared by the vector store and query-side embedding.
+# The model itself is loaded by the warmup task (or on first use)
+embedding_function = get_embedding_function()
+
+chroma_client = None
+if VECTOR_BACKEND != "local":
+    if CHROMA_HOST:
+        chroma_client = chromadb.HttpClient(
+            host=CHROMA_HOST,
+            port=CHROMA_PORT,
+            settings=Settings(anonymized_telemetry=False)
+        )
+    elif PERSISTENT:
+        chroma_client = chromadb.PersistentClient(
+            path=CHROMA_PATH,
+            settings=Settings(anonymized_telemetry=False)
+        )
+    else:
+        # Initialize ChromaDB client (in-memory with persistence for session)
+        chroma_client = chromadb.Client(Settings(
+            persist_directory=CHROMA_PATH,
+            anonymized_telemetry=False
+        ))
+
+if state_store.shared and not CHROMA_HOST:
+    print("⚠️ Shared state without CHROMA_HOST: each worker has its own vector store, so run a single worker")
+if not PERSISTENT and not state_store.shared:
+    # Leftovers of an ephemeral run that didn't shut down cleanly
+    shutil.rmtree(TENANTS_PATH, ignore_errors=True)
+elif EPHEMERAL_VECTORS:
+    # The shared registry would outlive the vectors it describes, and
+    # re-uploads would be deduplicated against chunks that are gone
+    shutil.rmtree(TENANTS_PATH, ignore_errors=True)
+    cleared = clear_shared_registries(state_store)
+    if cleared:
+        print(f"🧹 Cleared the document registries of {cleared} partition(s) left in shared state by a previous run")
+
+
+def open_partition(tenant: str):
+    """
+    Vector store and document registry of a tenant's partition.
+
+    The public partition keeps the original "documents" collection and
+    registry. Other tenants get a collection (or local index) and registry
+    of their own, named by partition_key. Their files are written even in
+    ephemeral mode, so an idle partition can be closed without losing
+    anything; ephemeral mode still removes them on exit.
+    """
+    key = partition_key(tenant)
+    public = tenant == PUBLIC_TENANT
+    path = CHROMA_PATH if public else os.path.join(TENANTS_PATH, key)
+    keep_files = PERSISTENT or not public
+
+    if VECTOR_BACKEND == "local":
+        # In-process vector index
+        store = LocalVectorStore(embedding_function, path=os.path.join(path, "local_index") if keep_files else None)
+    else:
+        store = ChromaVectorStore(
+            chroma_client,
+            "documents" if public else f"documents-{key}",
+            embedding_function,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    if state_store.shared:
+        registry = SharedDocumentRegistry(state_store, "documents" if public else f"documents:{key}")
+    else:
+        registry = DocumentRegistry(os.path.join(path, "documents.jsonl") if keep_files else None)
+    return store, registry
+
+
+app.state.partitions = PartitionManager(
+    app,
+    open_partition,
+    # With shared state another worker may be mid-ingestion, and its
+    # not yet registered chunks would look orphaned: skip the check
+    reconcile=PERSISTENT and STARTUP_CONSISTENCY_CHECK and not state_store.shared
+)
+app.state.embedding_function = embedding_function
+app.state.query_embedder = EmbeddingBatcher(embedding_function)
+app.state.sessions = SessionStore()
+app.state.ready = not WARMUP
+app.state.warmup = {"status": "pending" if WARMUP else "skipped"}
+create_retrieval_caches(app)
+if METRICS_ENABLED:
+    register_app_metrics(app)
 
 
 def cleanup_chroma():
@@ -57,22 +182,53 @@ def cleanup_chroma():
     except Exception as e:
         print(f"⚠️ Error cleaning up ChromaDB: {e}")
 
-# Register cleanup on exit
-atexit.register(cleanup_chroma)
+# Register cleanup on exit (persistent mode keeps the data on purpose)
+if not PERSISTENT:
+    atexit.register(cleanup_chroma)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize vector store on startup"""
     print("🚀 Starting AI Assistant API with ChromaDB...")
-    print(f"📊 Vector store location: {CHROMA_PATH}")
-    if collection:
-        print(f"📚 Current documents in collection: {collection.count()}")
+    location = f"{CHROMA_HOST}:{CHROMA_PORT}" if CHROMA_HOST and VECTOR_BACKEND != "local" else CHROMA_PATH
+    print(f"📊 Vector store location: {location} ({VECTOR_BACKEND}, {VECTOR_STORE_MODE}, state: {state_store.name})")
+    # The public partition opens now; users' partitions open on first use
+    try:
+        public = await app.state.partitions.open(PUBLIC_TENANT)
+    except Exception as e:
+        print(f"⚠️ Error initializing the vector store: {e}")
+        app.state.partitions = None
+    else:
+        print(f"📚 Current chunks in the public partition: {await public.vector_store.count()}")
+        if len(public.lexical_index):
+            print(f"🔤 Lexical index loaded with {len(public.lexical_index)} chunks")
+        if state_store.shared:
+            app.state.registry_watcher = asyncio.create_task(watch_registry(app))
+    app.state.ingestion_queue = IngestionQueue(app)
+    app.state.ingestion_queue.start()
+    # Loaded before serving, whatever WARMUP says: tiktoken may download the
+    # encoding on first use, which must not happen on the event loop mid-request
+    encoding = await run_in_threadpool(get_encoding)
+    app.state.warmup["prompt_tokenizer"] = "loaded" if encoding is not None else "approximate"
+    if WARMUP:
+        # Serve liveness probes right away; /readyz turns 200 once the models are loaded
+        app.state.warmup_task = asyncio.create_task(warmup(app))
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     print("🛑 Shutting down AI Assistant API...")
-    cleanup_chroma()
+    for task_name in ("warmup_task", "registry_watcher"):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    await app.state.ingestion_queue.stop()
+    if app.state.partitions is not None:
+        await app.state.partitions.close()
+    shutdown_pools()
+    state_store.close()
+    if not PERSISTENT:
+        cleanup_chroma()
 
 app.include_router(user_router.router)
 app.include_router(chat.chat_router)
@@ -80,9 +236,31 @@ app.include_router(index.router)
 
 @app.get("/")
 async def root():
-    """Health check endpoint"""
+    """Liveness check (same as /healthz)"""
     return {
         "status": "healthy",
         "message": "AI Assistant API is running",
         "version": "1.0.0"
-    }
\ No newline at end of file
+    }
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the models are loaded, 503 before (or if loading failed)"""
+    ready, details = readiness(app)
+    return JSONResponse(status_code=200 if ready else 503, content=details)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, caches, pools and queues"""
+    if not METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Metrics are disabled"})
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
\ No newline at end of file
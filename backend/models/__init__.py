@@ -4,5 +4,6 @@ from .models import (
     ChatResponse, 
     SignupRequest, 
     LoginRequest,
-    DocumentInfo
+    DocumentInfo,
+    IngestionJob
 )
\ No newline at end of file
@@ -1,5 +1,6 @@
+from datetime import datetime
 from uuid import UUID
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 
 class Message(BaseModel):
@@ -9,13 +10,18 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     history: List[Message] = []
+    session_id: Optional[str] = None  # server-held history; `history` is ignored when set
     use_knowledge_base: bool = False
+    bypass_cache: bool = False
 
 class ChatResponse(BaseModel):
     response: str
     model: str
     tokens_used: Optional[int] = None
+    prompt_tokens: Optional[int] = None
     sources: Optional[List[dict]] = None
+    session_id: Optional[str] = None
+    cached: bool = False
 
 class SignupRequest(BaseModel):
     email: EmailStr
@@ -28,4 +34,17 @@ class LoginRequest(BaseModel):
 class DocumentInfo(BaseModel):
     id: UUID
     filename: str
-    chunks: int
\ No newline at end of file
+    chunks: int
+
+class IngestionJob(BaseModel):
+    id: str
+    filename: str
+    status: str = "queued"  # queued | extracting | chunking | embedding | completed | failed
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    document_id: Optional[str] = None
+    error: Optional[str] = None
+    tenant: Optional[str] = Field(default=None, exclude=True)  # whose partition; not returned
+    created_at: datetime
+    updated_at: datetime
@@ -1,17 +1,19 @@
 # app/routes/user_routes.py
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 from passlib.context import CryptContext
 from auth.auth_handler import create_access_token, invalidate_token
-from auth.auth_bearer import JWTBearer
 from models import SignupRequest, LoginRequest
+from services.executors import run_in_pool
+from services.state_store import get_state_store, run_state_io
 
 router = APIRouter(prefix="/auth/v1", tags=["Authentication"])
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Temporary in-memory "user database"
-users_db = {}
+# Users live in the shared state store (see STATE_BACKEND), keyed by email
+USERS = "users"
 
 def hash_password(password: str) -> str:
     # Ensure we always pass in a plain string
@@ -23,26 +25,30 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 @router.post("/signup")
-def signup(request: SignupRequest):
-    if request.email in users_db:
+async def signup(request: SignupRequest):
+    users = get_state_store()
+    if await run_state_io(users.get, USERS, request.email) is not None:
         raise HTTPException(status_code=400, detail="User already exists")
     
-    hashed = hash_password(request.password)
-    users_db[request.email] = {"password": hashed}
+    # bcrypt runs on its own bounded pool (see services/executors.py)
+    hashed = await run_in_pool("password", hash_password, request.password)
+    # Another worker may have signed up the same email while we were hashing
+    if not await run_state_io(users.insert, USERS, request.email, {"password": hashed}):
+        raise HTTPException(status_code=400, detail="User already exists")
     return {"message": "User created successfully"}
 
 @router.post("/login")
-def login(request: LoginRequest):
-    user = users_db.get(request.email)
-    if not user or not verify_password(request.password, user["password"]):
+async def login(request: LoginRequest):
+    user = await run_state_io(get_state_store().get, USERS, request.email)
+    if not user or not await run_in_pool("password", verify_password, request.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     token = create_access_token({"sub": request.email})
     return {"access_token": token, "token_type": "bearer"}
 
-@router.post("/logout", dependencies=[Depends(JWTBearer())])
-def logout(token: str = Depends(JWTBearer())):
-    # JWTBearer returns user email, so we need actual token from header
-    # easiest is to re-parse from Authorization header in main
-    invalidate_token(token)
+@router.post("/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())):
+    # Revoke the token itself (JWTBearer would only give us the user's email)
+    if not await run_state_io(invalidate_token, credentials.credentials):
+        raise HTTPException(status_code=403, detail="Invalid or expired token")
     return {"message": "Logged out successfully"}
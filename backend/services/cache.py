@@ -0,0 +1,181 @@
+# services/cache.py
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def estimate_size(value) -> int:
+    """Rough memory footprint of a cached value in bytes"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and a memory budget.
+
+    Entries are evicted least-recently-used first once either `max_entries`
+    or `max_bytes` is exceeded.
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        size = estimate_size(key) + estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self.current_bytes += size
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class SemanticCache:
+    """
+    Cache of answers keyed by query embedding similarity.
+
+    Entries are grouped by an exact `context_key` (e.g. retrieved chunk ids
+    and conversation history); within a group, a lookup hits when the cosine
+    similarity between the new query embedding and a stored one reaches
+    `threshold`. Eviction is LRU across all groups, bounded by `max_entries`.
+    """
+
+    def __init__(self, name: str, max_entries: int, threshold: float, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._order = OrderedDict()  # entry id -> context key, in LRU order
+        self._groups = {}  # context key -> {entry id: (expires_at, embedding, value)}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding, context_key):
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            group = self._groups.get(context_key)
+            best_id, best_score = None, self.threshold
+            if group:
+                for entry_id in [e for e, entry in group.items() if entry[0] < now]:
+                    self._remove(entry_id)
+                group = self._groups.get(context_key)
+            if group:
+                entry_ids = list(group)
+                scores = np.stack([group[e][1] for e in entry_ids]) @ query
+                index = int(np.argmax(scores))
+                if scores[index] >= best_score:
+                    best_id, best_score = entry_ids[index], float(scores[index])
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._order.move_to_end(best_id)
+            return group[best_id][2]
+
+    def set(self, embedding, context_key, value):
+        if self.max_entries <= 0:
+            return
+        vector = self._normalize(embedding)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._groups.setdefault(context_key, {})[entry_id] = (
+                time.monotonic() + self.ttl_seconds, vector, value
+            )
+            self._order[entry_id] = context_key
+            while len(self._order) > self.max_entries:
+                self._remove(next(iter(self._order)))
+                self.evictions += 1
+
+    def _remove(self, entry_id):
+        context_key = self._order.pop(entry_id)
+        group = self._groups[context_key]
+        del group[entry_id]
+        if not group:
+            del self._groups[context_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._order),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,374 @@
+# services/chunker.py
+import bisect
+import os
+import re
+import threading
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # optional: fall back to approximate word-piece counts
+    Tokenizer = None
+
+# "tokens": chunks aligned to the embedding model's tokenizer (default)
+# "chars": the original 1000-character windows (chunk_text below)
+CHUNKER = os.getenv("CHUNKER", "tokens").lower()
+# all-MiniLM-L6-v2 reads at most 256 tokens, including [CLS] and [SEP];
+# anything beyond that is silently dropped from the embedding
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "254"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+# Tokenizer: a tokenizer.json path or a Hugging Face model name. Empty means
+# the embedding model's own tokenizer (Chroma's ONNX copy, then the Hub)
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "")
+# Texts are tokenized in blocks of about this many characters, in parallel
+CHUNKER_BLOCK_CHARS = int(os.getenv("CHUNKER_BLOCK_CHARS", "262144"))
+# A chunk ends at a sentence boundary only if it's at least this full
+CHUNK_MIN_FILL = 0.5
+
+DEFAULT_TOKENIZERS = (
+    os.path.join(os.path.expanduser("~"), ".cache", "chroma", "onnx_models", "all-MiniLM-L6-v2", "onnx", "tokenizer.json"),
+    "sentence-transformers/all-MiniLM-L6-v2"
+)
+
+# Sentence and line ends; a sentence starts at the first token after one
+SENTENCE_END_RE = re.compile(r"[.!?]+[\"'”’)\]]*(?=\s)|\n")
+# Fallback tokens: words and single punctuation marks
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+# Fallback cost of a word: one token per 4 characters, like prompt_builder's estimate
+FALLBACK_CHARS_PER_TOKEN = 4
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """Split text into overlapping chunks"""
+    chunks = []
+    start = 0
+    text_length = len(text)
+    
+    while start < text_length:
+        end = start + chunk_size
+        chunk = text[start:end]
+        
+        # Try to break at sentence boundary
+        if end < text_length:
+            last_period = chunk.rfind('.')
+            last_newline = chunk.rfind('\n')
+            break_point = max(last_period, last_newline)
+            
+            if break_point > chunk_size * 0.5:
+                chunk = chunk[:break_point + 1]
+                end = start + break_point + 1
+        
+        if chunk.strip():
+            chunks.append(chunk.strip())
+        
+        start = end - overlap
+    
+    return chunks
+
+
+class StreamingChunker:
+    """
+    Incremental version of `chunk_text` over (page, text) segments.
+
+    Produces exactly the chunks `chunk_text` would for the concatenated text,
+    but only keeps a window of roughly one chunk plus the latest segment in
+    memory, so chunking can start before the whole document is extracted.
+    Each chunk is tagged with the page its first character came from.
+    """
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._buffer = ""
+        self._base = 0  # absolute offset of _buffer[0]
+        self._start = 0  # absolute offset of the next chunk
+        self._page_offsets = []  # absolute offset where each segment begins
+        self._page_numbers = []  # page of each segment
+
+    def _page_at(self, offset: int):
+        index = bisect.bisect_right(self._page_offsets, offset) - 1
+        return self._page_numbers[index] if index >= 0 else None
+
+    def _next_chunk(self, text_length: int):
+        start = self._start
+        end = start + self.chunk_size
+        chunk = self._buffer[start - self._base:end - self._base]
+
+        # Try to break at sentence boundary
+        if end < text_length:
+            last_period = chunk.rfind('.')
+            last_newline = chunk.rfind('\n')
+            break_point = max(last_period, last_newline)
+
+            if break_point > self.chunk_size * 0.5:
+                chunk = chunk[:break_point + 1]
+                end = start + break_point + 1
+
+        self._start = end - self.overlap
+        chunk = chunk.strip()
+        return (chunk, self._page_at(start)) if chunk else None
+
+    def feed(self, segments) -> List[tuple]:
+        """Add segments; returns the (chunk, page) pairs that are now complete"""
+        chunks = []
+        for page, text in segments:
+            if not text:
+                continue
+            self._page_offsets.append(self._base + len(self._buffer))
+            self._page_numbers.append(page)
+            self._buffer += text
+            text_length = self._base + len(self._buffer)
+
+            # Only cut chunks whose window is followed by more text, so the
+            # sentence-boundary decision is the same as on the full text
+            while self._start + self.chunk_size < text_length:
+                chunk = self._next_chunk(text_length)
+                if chunk:
+                    chunks.append(chunk)
+
+            drop = self._start - self._base
+            if drop > 0:
+                self._buffer = self._buffer[drop:]
+                self._base = self._start
+                first_live = max(0, bisect.bisect_right(self._page_offsets, self._base) - 1)
+                del self._page_offsets[:first_live]
+                del self._page_numbers[:first_live]
+        return chunks
+
+    def finish(self) -> List[tuple]:
+        """Flush the remaining text once all segments have been fed"""
+        chunks = []
+        text_length = self._base + len(self._buffer)
+        while self._start < text_length:
+            chunk = self._next_chunk(text_length)
+            if chunk:
+                chunks.append(chunk)
+        self._buffer = ""
+        return chunks
+
+
+class Span(NamedTuple):
+    """A chunk as character offsets into the source text"""
+    start: int
+    end: int
+    tokens: int
+
+
+def _load_tokenizer(name: str):
+    if os.path.isfile(name):
+        tokenizer = Tokenizer.from_file(name)
+    else:
+        tokenizer = Tokenizer.from_pretrained(name)
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+
+def load_tokenizer(name: str = CHUNK_TOKENIZER):
+    """The tokenizer chunks are measured with, or None for the approximate fallback"""
+    if Tokenizer is None:
+        print("⚠️ tokenizers is not installed; chunk sizes are approximate")
+        return None
+    candidates = (name,) if name else DEFAULT_TOKENIZERS
+    for candidate in candidates:
+        if not name and candidate.endswith(".json") and not os.path.isfile(candidate):
+            continue
+        try:
+            return _load_tokenizer(candidate)
+        except Exception as e:
+            print(f"⚠️ Could not load tokenizer '{candidate}': {e}")
+    print("⚠️ No tokenizer available; chunk sizes are approximate")
+    return None
+
+
+def _split_blocks(text: str, block_chars: int) -> List[int]:
+    """Block start offsets, each block (but the first) starting right after whitespace"""
+    starts = [0]
+    while len(text) - starts[-1] > block_chars:
+        cut = starts[-1] + block_chars
+        space = max(text.rfind(" ", starts[-1] + 1, cut), text.rfind("\n", starts[-1] + 1, cut))
+        starts.append(space + 1 if space > starts[-1] else cut)
+    return starts
+
+
+class TokenChunker:
+    """
+    Splits text into chunks of at most `max_tokens` model tokens.
+
+    The text is tokenized once (in blocks of CHUNKER_BLOCK_CHARS, batched
+    so the Rust tokenizer runs them in parallel) into arrays of token
+    offsets. Chunk boundaries are then found with binary searches over the
+    cumulative token counts, so the whole pass is linear in the text.
+    A chunk ends at the last sentence start that keeps it at least
+    CHUNK_MIN_FILL full, or else at a word start; the next chunk starts
+    `overlap_tokens` back, moved forward to a sentence or word start.
+
+    `spans()` only returns offsets; `chunk()` creates the strings.
+    """
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, tokenizer=None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer = tokenizer
+
+    def _tokenize(self, text: str):
+        """(token starts, token ends, cumulative token counts, word start flags)"""
+        if self.tokenizer is None:
+            offsets = np.array([m.span() for m in WORD_RE.finditer(text)], dtype=np.int64).reshape(-1, 2)
+            counts = -(-(offsets[:, 1] - offsets[:, 0]) // FALLBACK_CHARS_PER_TOKEN)
+            word_starts = np.ones(len(offsets), dtype=bool)
+        else:
+            block_starts = _split_blocks(text, CHUNKER_BLOCK_CHARS)
+            block_ends = block_starts[1:] + [len(text)]
+            encodings = self.tokenizer.encode_batch(
+                [text[start:end] for start, end in zip(block_starts, block_ends)],
+                add_special_tokens=False
+            )
+            offsets, word_starts = [], []
+            for base, encoding in zip(block_starts, encodings):
+                if not encoding.offsets:
+                    continue
+                offsets.append(np.array(encoding.offsets, dtype=np.int64) + base)
+                word_ids = np.array([-1 if w is None else w for w in encoding.word_ids], dtype=np.int64)
+                word_starts.append(np.concatenate(([True], word_ids[1:] != word_ids[:-1])))
+            offsets = np.concatenate(offsets) if offsets else np.zeros((0, 2), dtype=np.int64)
+            word_starts = np.concatenate(word_starts) if word_starts else np.zeros(0, dtype=bool)
+            counts = np.ones(len(offsets), dtype=np.int64)
+        cumulative = np.concatenate(([0], np.cumsum(counts)))
+        return offsets[:, 0], offsets[:, 1], cumulative, word_starts
+
+    def _plan(self, text: str, final: bool = True) -> Tuple[List[Span], int]:
+        """
+        Chunk spans of `text`, plus the offset to resume from. When `final`
+        is False the text may continue, so chunks whose end could still
+        change are left out and the offset points at the first of them.
+        """
+        starts, ends, cumulative, word_starts = self._tokenize(text)
+        n = len(starts)
+        if n == 0:
+            return [], len(text)
+        boundaries = np.fromiter((m.end() for m in SENTENCE_END_RE.finditer(text)), dtype=np.int64)
+        sentence_starts = np.unique(np.searchsorted(starts, boundaries))
+        word_start_tokens = np.flatnonzero(word_starts)
+
+        spans = []
+        first = 0
+        while first < n:
+            limit = int(np.searchsorted(cumulative, cumulative[first] + self.max_tokens, side="right")) - 1
+            if not final and limit >= n - 1:
+                # The window reaches the end of what's been seen so far
+                return spans, int(starts[first])
+            end = max(limit, first + 1)
+            if end < n:
+                lowest = first + max(1, int((end - first) * CHUNK_MIN_FILL))
+                end = self._snap_back(sentence_starts, lowest, end) or self._snap_back(word_start_tokens, first + 1, end) or end
+            spans.append(Span(int(starts[first]), int(ends[end - 1]), int(cumulative[end] - cumulative[first])))
+            if end >= n:
+                break
+            if self.overlap_tokens <= 0:
+                first = end
+                continue
+            # Step back by the overlap, then forward to a sentence (or word) start
+            back = max(first + 1, int(np.searchsorted(cumulative, cumulative[end] - self.overlap_tokens, side="left")))
+            first = self._snap_forward(sentence_starts, back, end) or self._snap_forward(word_start_tokens, back, end) or back
+        return spans, len(text)
+
+    @staticmethod
+    def _snap_back(candidates: np.ndarray, lowest: int, highest: int) -> Optional[int]:
+        """Largest candidate in [lowest, highest]"""
+        i = int(np.searchsorted(candidates, highest, side="right")) - 1
+        return int(candidates[i]) if i >= 0 and candidates[i] >= lowest else None
+
+    @staticmethod
+    def _snap_forward(candidates: np.ndarray, lowest: int, highest: int) -> Optional[int]:
+        """Smallest candidate in [lowest, highest)"""
+        i = int(np.searchsorted(candidates, lowest, side="left"))
+        return int(candidates[i]) if i < len(candidates) and candidates[i] < highest else None
+
+    def spans(self, text: str) -> List[Span]:
+        return self._plan(text)[0]
+
+    def chunk(self, text: str) -> List[str]:
+        return [text[span.start:span.end] for span in self.spans(text)]
+
+    def streaming(self) -> "StreamingTokenChunker":
+        return StreamingTokenChunker(self)
+
+
+class StreamingTokenChunker:
+    """
+    Incremental TokenChunker over (page, text) segments, with the same
+    feed()/finish() interface as StreamingChunker.
+
+    Only the text from the first unfinished chunk onwards is kept and
+    re-tokenized, so memory stays around one chunk plus the pending
+    segments. Segments are buffered until there are `min_chars` of them,
+    which keeps re-tokenization of the carried-over text cheap.
+    """
+
+    def __init__(self, chunker: TokenChunker, min_chars: int = 65536):
+        self.chunker = chunker
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._base = 0  # absolute offset of _buffer[0]
+        self._pending = 0  # characters added since the last chunking pass
+        self._page_offsets = []  # absolute offset where each segment begins
+        self._page_numbers = []  # page of each segment
+
+    def _page_at(self, offset: int):
+        index = bisect.bisect_right(self._page_offsets, offset) - 1
+        return self._page_numbers[index] if index >= 0 else None
+
+    def _emit(self, final: bool) -> List[tuple]:
+        spans, resume = self.chunker._plan(self._buffer, final=final)
+        chunks = [(self._buffer[s.start:s.end], self._page_at(self._base + s.start)) for s in spans]
+        self._buffer = self._buffer[resume:]
+        self._base += resume
+        self._pending = 0
+        first_live = max(0, bisect.bisect_right(self._page_offsets, self._base) - 1)
+        del self._page_offsets[:first_live]
+        del self._page_numbers[:first_live]
+        return chunks
+
+    def feed(self, segments) -> List[tuple]:
+        """Add segments; returns the (chunk, page) pairs that are now complete"""
+        for page, text in segments:
+            if not text:
+                continue
+            self._page_offsets.append(self._base + len(self._buffer))
+            self._page_numbers.append(page)
+            self._buffer += text
+            self._pending += len(text)
+        if self._pending < self.min_chars:
+            return []
+        return self._emit(final=False)
+
+    def finish(self) -> List[tuple]:
+        """Flush the remaining text once all segments have been fed"""
+        chunks = self._emit(final=True)
+        self._buffer = ""
+        return chunks
+
+
+_chunker = None
+_chunker_lock = threading.Lock()
+
+
+def get_chunker() -> TokenChunker:
+    """Shared TokenChunker; the tokenizer is loaded on first use"""
+    global _chunker
+    with _chunker_lock:
+        if _chunker is None:
+            _chunker = TokenChunker(tokenizer=load_tokenizer())
+        return _chunker
+
+
+def streaming_chunker():
+    """Streaming chunker for ingestion, per the CHUNKER setting"""
+    if CHUNKER == "chars":
+        return StreamingChunker(chunk_size=1000, overlap=200)
+    return get_chunker().streaming()
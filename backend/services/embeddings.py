@@ -0,0 +1,120 @@
+# services/embeddings.py
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+
+from services.executors import get_pool, run_in_pool
+from services.metrics import EMBEDDING_BATCH_SIZE, observe
+
+# Query micro-batching: queries that arrive while the embedding workers are
+# busy wait up to EMBED_BATCH_WAIT_MS and are embedded in one forward pass
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+# "onnx": our ONNX Runtime provider (services/onnx_embedder.py);
+# "chroma": Chroma's stock ONNX model and padding (one session kept, too)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "onnx").lower()
+
+_embedding_function = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """
+    The app's one embedding model (all-MiniLM-L6-v2 on ONNX Runtime, from
+    EMBEDDING_PROVIDER), shared by ingestion and query embedding. The model
+    is read from disk on the first call, not here; see services/warmup.py.
+    """
+    global _embedding_function
+    with _embedding_lock:
+        if _embedding_function is None:
+            _embedding_function = create_embedding_function()
+        return _embedding_function
+
+
+def create_embedding_function(provider: str = EMBEDDING_PROVIDER, **options):
+    """A new embedding function; `options` go to the ONNX provider (quantize, batch_size, ...)"""
+    if provider == "chroma":
+        from services.onnx_embedder import ChromaDefaultEmbeddingFunction
+        return ChromaDefaultEmbeddingFunction()
+    if provider == "onnx":
+        from services.onnx_embedder import OnnxEmbeddingFunction
+        return OnnxEmbeddingFunction(**options)
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}' (expected 'onnx' or 'chroma')")
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batches query embeddings across concurrent requests.
+
+    While an embedding worker is free, queries go to the model right away
+    (those arriving in the same event loop tick share a pass). Once all
+    workers are busy, new queries wait up to EMBED_BATCH_WAIT_MS, or until
+    a worker frees up, and go together in one forward pass of at most
+    EMBED_BATCH_MAX_SIZE texts. Identical texts in a batch are embedded once.
+    """
+
+    def __init__(self, embedding_function, max_batch_size: int = EMBED_BATCH_MAX_SIZE, wait_ms: float = EMBED_BATCH_WAIT_MS):
+        self.embedding_function = embedding_function
+        self.max_batch_size = max(1, max_batch_size)
+        self.wait_seconds = max(0.0, wait_ms) / 1000
+        self.max_running = get_pool("embedding").workers
+        self._pending = []  # (text, future, enqueued_at)
+        self._running = 0
+        self._timer = None
+        self._flush_scheduled = False
+
+    async def embed(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self._schedule(loop)
+        embedding, waited = await future
+        observe("embed_queue", waited)
+        return embedding
+
+    def _schedule(self, loop):
+        if self._flush_scheduled:
+            return
+        if self._running < self.max_running or len(self._pending) >= self.max_batch_size:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait_seconds, self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        self._running += 1
+        asyncio.ensure_future(self._run(batch))
+        if self._pending:
+            self._schedule(asyncio.get_running_loop())
+
+    async def _run(self, batch):
+        started = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        try:
+            vectors = await run_in_pool("embedding", self.embedding_function, texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._running -= 1
+            # Queries that piled up while the model was busy go next
+            if self._pending:
+                self._flush()
+        by_text = {text: np.asarray(vector, dtype=np.float32) for text, vector in zip(texts, vectors)}
+        for text, future, enqueued_at in batch:
+            # Callers that gave up (client disconnected) are skipped
+            if not future.done():
+                future.set_result((by_text[text], started - enqueued_at))
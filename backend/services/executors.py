@@ -0,0 +1,131 @@
+# services/executors.py
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Dict
+
+from fastapi import HTTPException
+
+# Pool sizing: (workers, queue depth, use processes)
+# - parse:     document text extraction (CPU bound pure Python -> processes)
+# - embedding: anything that runs the embedding model (collection.add / query)
+# - chunk:     chunking extracted text during ingestion, kept off the
+#              embedding pool so it can't delay query embeddings
+# - vector:    plain vector store calls (count, get, delete)
+# - state:     shared state store calls (SQLite / Redis I/O; see services/state_store.py)
+# - password:  bcrypt hashing and checks for signup / login, so a login burst
+#              can't starve the default threadpool that sync endpoints run on
+POOL_SETTINGS = {
+    "parse": (
+        int(os.getenv("PARSE_POOL_WORKERS", "2")),
+        int(os.getenv("PARSE_POOL_QUEUE_DEPTH", "8")),
+        True,
+    ),
+    "embedding": (
+        int(os.getenv("EMBEDDING_POOL_WORKERS", "2")),
+        int(os.getenv("EMBEDDING_POOL_QUEUE_DEPTH", "64")),
+        False,
+    ),
+    "chunk": (
+        int(os.getenv("CHUNK_POOL_WORKERS", "2")),
+        int(os.getenv("CHUNK_POOL_QUEUE_DEPTH", "64")),
+        False,
+    ),
+    "vector": (
+        int(os.getenv("VECTOR_POOL_WORKERS", "4")),
+        int(os.getenv("VECTOR_POOL_QUEUE_DEPTH", "128")),
+        False,
+    ),
+    "state": (
+        int(os.getenv("STATE_POOL_WORKERS", "8")),
+        int(os.getenv("STATE_POOL_QUEUE_DEPTH", "256")),
+        False,
+    ),
+    "password": (
+        int(os.getenv("PASSWORD_POOL_WORKERS", "2")),
+        int(os.getenv("PASSWORD_POOL_QUEUE_DEPTH", "32")),
+        False,
+    ),
+}
+
+
+class BoundedPool:
+    """
+    Executor wrapper that limits how many jobs may be running or waiting.
+    Once `workers + queue_depth` jobs are in flight, new submissions are
+    rejected with a 503 instead of piling up behind the busy workers.
+    """
+
+    def __init__(self, name: str, workers: int, queue_depth: int, processes: bool = False):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self.processes = processes
+        self.in_flight = 0
+        self._executor: Executor = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix=f"{self.name}-pool"
+                )
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn` on the pool without blocking the event loop"""
+        if self.in_flight >= self.workers + self.queue_depth:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server busy ({self.name} queue full). Please retry shortly."
+            )
+
+        # in_flight is only touched from the event loop thread, so no lock needed
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), partial(fn, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_pools: Dict[str, BoundedPool] = {}
+
+
+def get_pool(name: str) -> BoundedPool:
+    pool = _pools.get(name)
+    if pool is None:
+        workers, queue_depth, processes = POOL_SETTINGS[name]
+        pool = _pools[name] = BoundedPool(name, workers, queue_depth, processes)
+    return pool
+
+
+async def run_in_pool(name: str, fn, *args, **kwargs):
+    """Shortcut for `get_pool(name).run(fn, *args, **kwargs)`"""
+    return await get_pool(name).run(fn, *args, **kwargs)
+
+
+def pool_stats() -> Dict[str, dict]:
+    return {
+        name: {"in_flight": pool.in_flight, "workers": pool.workers, "queue_depth": pool.queue_depth}
+        for name, pool in _pools.items()
+    }
+
+
+def shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown()
+    _pools.clear()
@@ -0,0 +1,726 @@
+# services/ingestion.py
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from models import IngestionJob
+from services.chunker import streaming_chunker
+from services.executors import get_pool, run_in_pool
+from services.metrics import CHUNKS_INDEXED, DOCUMENTS_INGESTED, Operation, observe, span
+from services.retrieval import invalidate_retrieval_cache
+from services.state_store import run_state_io
+from services.uploads import MAX_ARCHIVE_EXPANDED_BYTES, MAX_UPLOAD_BYTES, UPLOAD_TMP_DIR, SpooledUpload
+from services.retriever import (
+    count_pdf_pages,
+    expand_archive,
+    extract_pdf_pages,
+    extract_segments,
+    hash_source,
+    is_archive,
+    is_supported_file
+)
+
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "5000"))
+BATCH_EMBED_SIZE = int(os.getenv("BATCH_EMBED_SIZE", "256"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+_filename_locks = {}  # (tenant, filename) -> [lock, waiters]
+_content_locks = {}  # (tenant, content hash) -> [lock, waiters]
+_tenant_gates = {}  # tenant -> [gate, users]
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _chunk_records(doc_id: str, filename: str, chunks: List[tuple], first_index: int = 0):
+    """
+    Build the vector store ids and metadata for (chunk, page) pairs of a
+    document. Ids are unique per insert rather than positional, so chunks
+    kept across re-indexing never collide with newly added ones.
+    """
+    chunk_ids = []
+    metadatas = []
+    for i, (chunk, page) in enumerate(chunks, start=first_index):
+        chunk_ids.append(f"{doc_id}_chunk_{uuid.uuid4().hex[:12]}")
+        metadata = {
+            "document_id": doc_id,
+            "filename": filename,
+            "chunk_index": i,
+            "chunk_hash": chunk_hash(chunk)
+        }
+        if page is not None:
+            metadata["page"] = page
+        metadatas.append(metadata)
+    return chunk_ids, metadatas
+
+
+async def _register_document(partition, doc_id: str, filename: str, chunk_ids: List[str], content_hash: str, replaced: bool = False):
+    await run_state_io(partition.document_metadata.__setitem__, doc_id, {
+        "filename": filename,
+        "chunks": len(chunk_ids),
+        "content_hash": content_hash
+    })
+    invalidate_retrieval_cache(partition)
+    DOCUMENTS_INGESTED.labels("updated" if replaced else "indexed").inc()
+    if replaced:
+        print(f"🔄 Re-indexed document '{filename}' ({len(chunk_ids)} chunks)")
+    else:
+        print(f"✅ Added document '{filename}' with {len(chunk_ids)} chunks to vector DB")
+
+
+def find_document(registry, content_hash: str = None, filename: str = None) -> Optional[str]:
+    """Id of the registered document with this content hash (or filename), if any"""
+    for doc_id, meta in list(registry.items()):
+        if content_hash is not None and meta.get("content_hash") == content_hash:
+            return doc_id
+        if filename is not None and meta.get("filename") == filename:
+            return doc_id
+    return None
+
+
+async def _has_chunks(store, doc_id: str) -> bool:
+    page = await store.get(where={"document_id": doc_id}, include=[], limit=1)
+    return bool(page["ids"])
+
+
+async def _existing_chunks(store, doc_id: str, page_size: int = 5000) -> dict:
+    """chunk hash -> [(chunk id, metadata)] for the chunks already stored for a document"""
+    existing = {}
+    offset = 0
+    while True:
+        page = await store.get(
+            where={"document_id": doc_id},
+            include=["metadatas", "documents"],
+            limit=page_size,
+            offset=offset
+        )
+        if not page["ids"]:
+            break
+        for chunk_id, meta, text in zip(page["ids"], page["metadatas"], page["documents"]):
+            # Chunks indexed before hashing was added are hashed from their text
+            key = meta.get("chunk_hash") or chunk_hash(text)
+            existing.setdefault(key, []).append((chunk_id, meta))
+        offset += len(page["ids"])
+    return existing
+
+
+@asynccontextmanager
+async def _keyed_lock(locks: dict, key):
+    entry = locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del locks[key]
+
+
+def _filename_lock(tenant: str, filename: str):
+    """Serialize ingestion of a tenant's uploads sharing a filename, so versions can't interleave"""
+    return _keyed_lock(_filename_locks, (tenant, filename))
+
+
+@asynccontextmanager
+async def _upload_lock(tenant: str, filename: str, content_hash: str):
+    """
+    The filename lock, then one on the content hash: copies of a file
+    uploaded under different names are deduplicated rather than both
+    indexed. Always taken in this order, so two uploads can't deadlock.
+    """
+    async with _filename_lock(tenant, filename), _keyed_lock(_content_locks, (tenant, content_hash)):
+        yield
+
+
+class _IngestionGate:
+    """
+    Any number of ingestions into a tenant's partition may hold the gate at
+    once (`shared`), a delete-all holds it alone (`exclusive`). A waiting
+    delete-all keeps new ingestions out, so a steady stream of uploads can't
+    starve it.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @asynccontextmanager
+    async def shared(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._exclusive and not self._exclusive_waiting)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._shared -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        async with self._condition:
+            self._exclusive_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: not self._exclusive and not self._shared)
+            finally:
+                self._exclusive_waiting -= 1
+                self._condition.notify_all()
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+
+@asynccontextmanager
+async def _tenant_gate(tenant: str, exclusive: bool = False):
+    entry = _tenant_gates.setdefault(tenant, [_IngestionGate(), 0])
+    entry[1] += 1
+    try:
+        async with (entry[0].exclusive() if exclusive else entry[0].shared()):
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _tenant_gates[tenant]
+
+
+@asynccontextmanager
+async def document_lock(tenant: str, filename: str):
+    """
+    Hold off ingestion of `filename` into the tenant's partition (and any
+    delete-all) while one of its documents is deleted
+    """
+    async with _tenant_gate(tenant), _filename_lock(tenant, filename):
+        yield
+
+
+@asynccontextmanager
+async def partition_lock(tenant: str):
+    """
+    Wait for the ingestions and deletes running in the tenant's partition
+    and hold off new ones, for deleting every document
+    """
+    async with _tenant_gate(tenant, exclusive=True):
+        yield
+
+
+async def add_chunks(partition, ids: List[str], documents: List[str], metadatas: List[dict]):
+    """Embed chunks, add them to the partition's vector store, then to its lexical index"""
+    with span("embed"):
+        embeddings = await run_in_pool("embedding", partition.embedding_function, documents)
+    with span("vector_add"):
+        await partition.vector_store.add(ids, documents, metadatas, embeddings=embeddings)
+    with span("lexical_add"):
+        await run_in_pool("vector", partition.lexical_index.add, ids, documents)
+    CHUNKS_INDEXED.inc(len(ids))
+
+
+async def delete_chunks(partition, ids: List[str]):
+    """Remove chunks from the partition's vector store and lexical index"""
+    await partition.vector_store.delete(ids=ids)
+    await run_in_pool("vector", partition.lexical_index.remove, ids)
+
+
+async def delete_document_chunks(partition, doc_id: str, batch_size: int = DELETE_BATCH_SIZE) -> int:
+    """
+    Remove every chunk of a document, found by its `document_id` metadata,
+    `batch_size` ids at a time (only ids are read). Returns how many went.
+    """
+    deleted = 0
+    while True:
+        page = await partition.vector_store.get(where={"document_id": doc_id}, include=[], limit=batch_size)
+        if not page["ids"]:
+            break
+        await partition.vector_store.delete(ids=page["ids"])
+        await run_in_pool("vector", partition.lexical_index.remove, page["ids"], False)
+        deleted += len(page["ids"])
+    # Compact the lexical index once, not after every batch
+    await run_in_pool("vector", partition.lexical_index.compact)
+    return deleted
+
+
+def _touch(job: Optional[IngestionJob], **changes):
+    if job is None:
+        return
+    for key, value in changes.items():
+        setattr(job, key, value)
+    job.updated_at = datetime.utcnow()
+
+
+async def iter_document_segments(filename: str, source, window: int = None):
+    """
+    Yield lists of (page, text) segments in document order as they are extracted.
+
+    PDFs are split into PDF_PAGES_PER_TASK page ranges that are parsed in
+    parallel on the parse process pool, with at most `window` ranges in
+    flight (default: one per parse worker). DOCX/TXT are parsed in one task.
+    `source` is a file path (each worker opens it itself, so nothing large
+    is copied between processes) or raw bytes.
+    """
+    if not filename.lower().endswith('.pdf'):
+        yield await run_in_pool("parse", extract_segments, filename, source)
+        return
+
+    total_pages = await run_in_pool("parse", count_pdf_pages, source)
+    ranges = [
+        (start, min(start + PDF_PAGES_PER_TASK, total_pages))
+        for start in range(0, total_pages, PDF_PAGES_PER_TASK)
+    ]
+    window = window or get_pool("parse").workers
+    in_flight = deque()
+    try:
+        for start, end in ranges:
+            in_flight.append(asyncio.ensure_future(
+                run_in_pool("parse", extract_pdf_pages, source, start, end)
+            ))
+            if len(in_flight) >= window:
+                yield await in_flight.popleft()
+        while in_flight:
+            yield await in_flight.popleft()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+async def iter_document_chunks(filename: str, source, job: Optional[IngestionJob] = None, window: int = None):
+    """Yield lists of (chunk, page) pairs while the document is still being extracted"""
+    # Created in the pool: the tokenizer is loaded on first use
+    chunker = await run_in_pool("chunk", streaming_chunker)
+    is_pdf = filename.lower().endswith('.pdf')
+    pages_parsed = 0
+    # Extraction time is the wait for the next pages, not counting the time
+    # the consumer spends embedding while extraction continues in the pool
+    waiting_since = time.perf_counter()
+    async for segments in iter_document_segments(filename, source, window):
+        observe("extract", time.perf_counter() - waiting_since)
+        pages_parsed += len(segments) if is_pdf else 1
+        _touch(job, status="chunking", pages_parsed=pages_parsed)
+        with span("chunk"):
+            chunks = await run_in_pool("chunk", chunker.feed, segments)
+        if chunks:
+            yield chunks
+        waiting_since = time.perf_counter()
+    with span("chunk"):
+        chunks = await run_in_pool("chunk", chunker.finish)
+    if chunks:
+        yield chunks
+
+
+async def ingest_document(
+    partition,
+    filename: str,
+    source,
+    job: Optional[IngestionJob] = None,
+    content_hash: Optional[str] = None
+) -> dict:
+    """
+    Extract, chunk and embed a document into a partition's vector store.
+
+    Uploads are deduplicated by content hash: a file identical to an
+    indexed document is a no-op that returns the existing document id.
+    A new version of an already indexed filename keeps its document id and
+    only embeds chunks whose hash isn't stored yet; unchanged chunks are
+    kept and chunks that disappeared are deleted.
+
+    The stages are pipelined: chunks are embedded in EMBED_BATCH_SIZE
+    batches as soon as enough pages have been extracted, so large PDFs
+    never hold their full text in memory. Progress is reported on `job`
+    when one is given.
+    """
+    async with _tenant_gate(partition.tenant):
+        return await _ingest_document(partition, filename, source, job, content_hash)
+
+
+async def _ingest_document(partition, filename, source, job=None, content_hash=None) -> dict:
+    if content_hash is None:
+        content_hash = await run_in_pool("parse", hash_source, source)
+
+    registry = partition.document_metadata
+    async with _upload_lock(partition.tenant, filename, content_hash):
+        # Pick up documents other workers indexed since the last sync
+        await run_state_io(registry.refresh)
+        existing_id = find_document(registry, content_hash=content_hash)
+        if existing_id is not None and not await _has_chunks(partition.vector_store, existing_id):
+            # Registered, but its vectors are gone (e.g. an ephemeral store
+            # restarted under a shared registry): index it afresh
+            print(f"⚠️ '{registry[existing_id]['filename']}' is registered without chunks; re-indexing")
+            await run_state_io(registry.__delitem__, existing_id)
+            existing_id = None
+        if existing_id is not None:
+            print(f"♻️ '{filename}' is already indexed as '{registry[existing_id]['filename']}'; skipping")
+            DOCUMENTS_INGESTED.labels("unchanged").inc()
+            return {
+                "document_id": existing_id,
+                "filename": filename,
+                "chunks_created": 0,
+                "status": "unchanged"
+            }
+        previous_id = find_document(registry, filename=filename)
+        return await _index_document(partition, filename, source, content_hash, previous_id, job)
+
+
+async def _index_document(partition, filename, source, content_hash, previous_id, job) -> dict:
+    store = partition.vector_store
+    _touch(job, status="extracting")
+    doc_id = previous_id or str(uuid.uuid4())
+    # Chunks of the previous version, by hash; whatever isn't reused is stale
+    reusable = await _existing_chunks(store, doc_id) if previous_id else {}
+    chunk_ids = []  # every chunk of the new version, in order
+    added_ids = []
+    pending = []  # (chunk, page) waiting for a full batch
+
+    async def add_batch(batch):
+        ids, metadatas = _chunk_records(doc_id, filename, batch, first_index=len(chunk_ids))
+        new = []
+        updated_ids, updated_metadatas = [], []
+        for i, metadata in enumerate(metadatas):
+            kept = reusable.get(metadata["chunk_hash"])
+            if kept:
+                ids[i], old_metadata = kept.pop()
+                if old_metadata != metadata:
+                    updated_ids.append(ids[i])
+                    updated_metadatas.append(metadata)
+            else:
+                new.append(i)
+
+        _touch(job, status="embedding")
+        if new:
+            await add_chunks(
+                partition,
+                ids=[ids[i] for i in new],
+                documents=[batch[i][0] for i in new],
+                metadatas=[metadatas[i] for i in new]
+            )
+            added_ids.extend(ids[i] for i in new)
+        if updated_ids:
+            # Moved but unchanged chunks only get their position updated, not re-embedded
+            await store.update(updated_ids, updated_metadatas)
+        chunk_ids.extend(ids)
+        _touch(job, chunks_embedded=len(chunk_ids))
+
+    try:
+        async for chunks in iter_document_chunks(filename, source, job):
+            pending.extend(chunks)
+            _touch(job, chunks_total=len(chunk_ids) + len(pending))
+            while len(pending) >= EMBED_BATCH_SIZE:
+                await add_batch(pending[:EMBED_BATCH_SIZE])
+                del pending[:EMBED_BATCH_SIZE]
+        if pending:
+            await add_batch(pending)
+        if not chunk_ids:
+            raise HTTPException(
+                status_code=400,
+                detail="No text could be extracted from the document."
+            )
+    except Exception:
+        # Don't leave a half-indexed document behind; the previous version stays searchable
+        if added_ids:
+            await delete_chunks(partition, added_ids)
+            invalidate_retrieval_cache(partition)
+        raise
+
+    stale_ids = [chunk_id for kept in reusable.values() for chunk_id, _ in kept]
+    for start in range(0, len(stale_ids), EMBED_BATCH_SIZE * 16):
+        await delete_chunks(partition, stale_ids[start:start + EMBED_BATCH_SIZE * 16])
+
+    await _register_document(partition, doc_id, filename, chunk_ids, content_hash, replaced=previous_id is not None)
+
+    result = {
+        "document_id": doc_id,
+        "filename": filename,
+        "chunks_created": len(added_ids),
+        "status": "updated" if previous_id else "indexed"
+    }
+    if previous_id:
+        result.update(chunks_reused=len(chunk_ids) - len(added_ids), chunks_deleted=len(stale_ids))
+    return result
+
+
+async def _extract_and_chunk(filename: str, source) -> List[tuple]:
+    # One page range at a time: batch uploads get their parallelism across files
+    chunks = []
+    async for batch in iter_document_chunks(filename, source, window=1):
+        chunks.extend(batch)
+    if not chunks:
+        raise ValueError("No text could be extracted from the document.")
+    return chunks
+
+
+async def ingest_batch(partition, uploads: List[Tuple[str, Optional[str], Optional[str]]]) -> List[dict]:
+    """
+    Index many files into a partition at once, returning one result per file.
+
+    `uploads` are (filename, path, error) entries; entries with an error
+    (e.g. rejected while spooling) are reported as failed. Deleting the
+    uploaded files is up to the caller; extracted archive members are
+    cleaned up here.
+
+    Zip archives are expanded into their members. Files are extracted in
+    parallel (bounded by the parse pool size) and their chunks are pooled
+    into large cross-document batches before being embedded and written to
+    the vector store. A file that fails at any stage only fails itself.
+    """
+    member_paths = []
+    try:
+        # Held until the files are registered: a delete-all must not drop
+        # chunks that are embedded but not yet registered
+        async with _tenant_gate(partition.tenant):
+            return await _ingest_batch(partition, uploads, member_paths)
+    finally:
+        for path in member_paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+async def _ingest_batch(partition, uploads, member_paths: List[str]) -> List[dict]:
+    # Expand archives and validate every entry up front
+    results = []
+    pending = []
+    for filename, path, upload_error in uploads:
+        if upload_error:
+            members = [(filename, None, upload_error)]
+        elif is_archive(filename):
+            try:
+                members = await run_in_pool(
+                    "parse", expand_archive, filename, path, MAX_UPLOAD_BYTES, BATCH_MAX_FILES, UPLOAD_TMP_DIR,
+                    MAX_ARCHIVE_EXPANDED_BYTES
+                )
+            except HTTPException:
+                raise
+            except Exception as e:
+                results.append({"filename": filename, "status": "failed", "error": str(e)})
+                continue
+            member_paths.extend(member_path for _, member_path, _ in members if member_path)
+        else:
+            members = [(filename, path, None)]
+
+        for name, member_path, error in members:
+            result = {"filename": name, "status": "pending"}
+            results.append(result)
+            if error is None and not is_supported_file(name):
+                error = "Unsupported file type"
+            if error:
+                result.update(status="failed", error=error)
+            else:
+                pending.append((result, member_path))
+
+    if len(pending) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files. Maximum is {BATCH_MAX_FILES}.")
+
+    buffer = []  # (result, chunk_id, chunk, metadata)
+    added_ids = {}  # doc_id -> ids already in the vector store
+
+    async def flush(records):
+        try:
+            await add_chunks(
+                partition,
+                ids=[chunk_id for _, chunk_id, _, _ in records],
+                documents=[chunk for _, _, chunk, _ in records],
+                metadatas=[meta for _, _, _, meta in records]
+            )
+        except Exception as e:
+            for result, _, _, _ in records:
+                if result["status"] != "failed":
+                    result.update(status="failed", error=f"Error embedding document: {str(e)}")
+            return
+        for result, chunk_id, _, _ in records:
+            added_ids.setdefault(result["document_id"], []).append(chunk_id)
+
+    # Extraction runs in parallel but never has more files in flight than
+    # the parse pool has workers, so large batches don't trip its queue limit
+    limiter = asyncio.Semaphore(get_pool("parse").workers)
+
+    registry = partition.document_metadata
+    batch_hashes = {}  # content hash -> result of the first file with that content
+
+    async def extract(result, source):
+        async with limiter:
+            try:
+                content_hash = await run_in_pool("parse", hash_source, source)
+                result["content_hash"] = content_hash
+                if content_hash in batch_hashes:
+                    result.update(status="unchanged", duplicate_of=batch_hashes[content_hash]["filename"])
+                    return result, None, None
+                batch_hashes[content_hash] = result
+                if (find_document(registry, content_hash=content_hash) is not None
+                        or find_document(registry, filename=result["filename"]) is not None):
+                    # Already indexed or a new version of a known file: deduplicated
+                    # and re-indexed incrementally on its own
+                    outcome = await _ingest_document(partition, result["filename"], source, content_hash=content_hash)
+                    result.update(outcome)
+                    return result, None, None
+                return result, await _extract_and_chunk(result["filename"], source), None
+            except Exception as e:
+                return result, None, e
+
+    for task in asyncio.as_completed([extract(result, source) for result, source in pending]):
+        result, chunks, error = await task
+        if error is not None:
+            result.update(status="failed", error=getattr(error, "detail", None) or str(error))
+            continue
+        if chunks is None:
+            continue
+
+        doc_id = str(uuid.uuid4())
+        chunk_ids, metadatas = _chunk_records(doc_id, result["filename"], chunks)
+        result.update(document_id=doc_id, chunk_ids=chunk_ids)
+        buffer.extend(zip([result] * len(chunks), chunk_ids, [chunk for chunk, _ in chunks], metadatas))
+
+        while len(buffer) >= BATCH_EMBED_SIZE:
+            await flush(buffer[:BATCH_EMBED_SIZE])
+            del buffer[:BATCH_EMBED_SIZE]
+
+    if buffer:
+        await flush(buffer)
+        buffer.clear()
+
+    # Register what made it in; roll back partial inserts of failed files
+    sources = {id(result): source for result, source in pending}
+    stale_ids = []
+    for result in results:
+        chunk_ids = result.pop("chunk_ids", None)
+        if chunk_ids is None:
+            continue
+        if result["status"] == "failed":
+            stale_ids.extend(added_ids.get(result.pop("document_id"), []))
+            continue
+        # Same lock and re-check as ingest_document: a single upload of the
+        # same file may have registered it while this batch was embedding
+        async with _upload_lock(partition.tenant, result["filename"], result["content_hash"]):
+            await run_state_io(registry.refresh)
+            if (find_document(registry, content_hash=result["content_hash"]) is None
+                    and find_document(registry, filename=result["filename"]) is None):
+                await _register_document(partition, result["document_id"], result["filename"], chunk_ids, result["content_hash"])
+                result.update(status="indexed", chunks_created=len(chunk_ids))
+                continue
+        # Drop this copy and index the file against the registered one
+        await delete_chunks(partition, added_ids.get(result.pop("document_id"), []))
+        try:
+            result.update(await _ingest_document(
+                partition, result["filename"], sources[id(result)], content_hash=result["content_hash"]
+            ))
+        except Exception as e:
+            result.update(status="failed", error=getattr(e, "detail", None) or str(e))
+
+    if stale_ids:
+        await delete_chunks(partition, stale_ids)
+        invalidate_retrieval_cache(partition)
+
+    for result in results:
+        content_hash = result.pop("content_hash", None)
+        if "duplicate_of" in result:
+            DOCUMENTS_INGESTED.labels("unchanged").inc()
+            original = batch_hashes[content_hash]
+            result.update(document_id=original.get("document_id"), chunks_created=0)
+            if original["status"] == "failed":
+                result.update(status="failed", error=original["error"])
+
+    return results
+
+
+class IngestionQueue:
+    """
+    Bounded background ingestion queue.
+
+    Uploads are queued as spooled temp files, together with the tenant
+    whose partition they go to, and processed by INGEST_CONCURRENCY
+    workers. The queue holds at most INGEST_QUEUE_SIZE pending uploads;
+    beyond that submissions are rejected (503) so a burst of uploads can't
+    exhaust memory or disk.
+    """
+
+    def __init__(self, app, concurrency: int = INGEST_CONCURRENCY, max_queued: int = INGEST_QUEUE_SIZE):
+        self.app = app
+        self.concurrency = max(1, concurrency)
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queued))
+        self._workers = []
+
+    def start(self):
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(), name=f"ingest-worker-{i}")
+                for i in range(self.concurrency)
+            ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Remove the temp files of uploads that never got processed
+        while not self._queue.empty():
+            _, upload = self._queue.get_nowait()
+            upload.cleanup()
+
+    def submit(self, upload: SpooledUpload, tenant: str) -> IngestionJob:
+        now = datetime.utcnow()
+        job = IngestionJob(id=str(uuid.uuid4()), filename=upload.filename, tenant=tenant, created_at=now, updated_at=now)
+        try:
+            self._queue.put_nowait((job, upload))
+        except asyncio.QueueFull:
+            raise HTTPException(
+                status_code=503,
+                detail="Ingestion queue is full. Please retry shortly."
+            )
+        self.jobs[job.id] = job
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str, tenant: str) -> Optional[IngestionJob]:
+        """The job, if it was submitted by the same tenant"""
+        job = self.jobs.get(job_id)
+        return job if job is not None and job.tenant == tenant else None
+
+    def pending(self) -> int:
+        """Uploads waiting for a worker"""
+        return self._queue.qsize()
+
+    def _trim_history(self):
+        # Forget the oldest finished jobs once the history limit is reached
+        overflow = len(self.jobs) - INGEST_JOB_HISTORY
+        if overflow <= 0:
+            return
+        for job_id in [j.id for j in self.jobs.values() if j.status in ("completed", "failed")][:overflow]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job, upload = await self._queue.get()
+            try:
+                with Operation("ingest_job"):
+                    async with self.app.state.partitions.use(job.tenant) as partition:
+                        result = await ingest_document(partition, job.filename, upload.path, job, upload.content_hash)
+                _touch(job, status="completed", document_id=result["document_id"])
+            except asyncio.CancelledError:
+                raise
+            except HTTPException as e:
+                _touch(job, status="failed", error=e.detail)
+            except Exception as e:
+                print(f"⚠️ Ingestion job {job.id} failed: {e}")
+                _touch(job, status="failed", error=str(e))
+            finally:
+                upload.cleanup()
+                self._queue.task_done()
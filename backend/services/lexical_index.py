@@ -0,0 +1,260 @@
+# services/lexical_index.py
+import math
+import os
+import re
+import threading
+from array import array
+from itertools import chain
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from services.executors import run_in_pool
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Compact the postings once this share of indexed chunks has been deleted
+LEXICAL_COMPACT_RATIO = float(os.getenv("LEXICAL_COMPACT_RATIO", "0.25"))
+# Terms found in more than this share of chunks are skipped when a query has rarer terms
+BM25_MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", "0.2"))
+
+# Words, numbers and identifiers such as "AB-1234", "E_042" or "v2.1.3"
+TOKEN_RE = re.compile(r"[^\W_]+(?:[-_./][^\W_]+)*")
+SEPARATOR_RE = re.compile(r"[-_./]")
+MAX_TF = 65535
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms of `text`. Compound identifiers are kept whole (so a
+    part number matches exactly) and also split into their parts.
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    for token in [token for token in tokens if not token.isalnum()]:
+        tokens.extend(SEPARATOR_RE.split(token))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over chunk texts.
+
+    Every chunk gets an integer slot. Postings are kept per term as two
+    parallel typed arrays (uint32 slots, uint16 term frequencies), 6 bytes
+    per posting, and only grow by appending, so adding chunks never
+    rewrites existing postings. Deletes are tombstones; once more than
+    LEXICAL_COMPACT_RATIO of the slots are dead the postings are compacted
+    in place. Scoring is vectorized with numpy over the postings of the
+    query terms only.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._terms = {}  # term -> term id
+        self._posting_slots = []  # term id -> array("I") of slots, ascending
+        self._posting_tfs = []  # term id -> array("H") of term frequencies
+        self._slot_ids = []  # slot -> chunk id
+        self._slots = {}  # chunk id -> slot
+        self._lengths = array("I")  # slot -> chunk length in tokens
+        self._alive = array("b")  # slot -> 1 while the chunk exists
+        self._live_count = 0
+        self._total_length = 0
+
+    def __len__(self):
+        return self._live_count
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._slots
+
+    def add(self, ids: Iterable[str], documents: Iterable[str]):
+        """Index chunks; postings for a whole batch are grouped by term and appended in bulk"""
+        ids = list(ids)
+        tokenized = [tokenize(text) for text in documents]
+        if not ids:
+            return
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id in self._slots:
+                    self._remove_slot(self._slots[chunk_id])
+            first_slot = len(self._slot_ids)
+
+            tokens = list(chain.from_iterable(tokenized))
+            for term in set(tokens).difference(self._terms):
+                self._terms[term] = len(self._posting_slots)
+                self._posting_slots.append(array("I"))
+                self._posting_tfs.append(array("H"))
+            term_ids = np.fromiter(map(self._terms.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+            lengths = np.array([len(terms) for terms in tokenized], dtype=np.int64)
+
+            if tokens:
+                self._add_postings(term_ids, lengths, first_slot)
+
+            self._slot_ids.extend(ids)
+            self._slots.update(zip(ids, range(first_slot, first_slot + len(ids))))
+            self._lengths.frombytes(lengths.astype(np.uint32).tobytes())
+            self._alive.frombytes(bytes([1]) * len(ids))
+            self._live_count += len(ids)
+            self._total_length += int(lengths.sum())
+
+    def _add_postings(self, term_ids: np.ndarray, lengths: np.ndarray, first_slot: int):
+        # One (term, chunk) key per token; counting the unique keys gives
+        # term frequencies already sorted by term, then by slot
+        n_chunks = len(lengths)
+        keys = term_ids * n_chunks + np.repeat(np.arange(n_chunks), lengths)
+        keys, counts = np.unique(keys, return_counts=True)
+        key_terms = keys // n_chunks
+        slots = (keys % n_chunks + first_slot).astype(np.uint32)
+        tfs = np.minimum(counts, MAX_TF).astype(np.uint16)
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(key_terms)) + 1, [len(keys)]))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            term_id = int(key_terms[start])
+            self._posting_slots[term_id].frombytes(slots[start:end].tobytes())
+            self._posting_tfs[term_id].frombytes(tfs[start:end].tobytes())
+
+    def remove(self, ids: Iterable[str], compact: bool = True):
+        """
+        Tombstone chunks. With `compact=False` (a bulk delete in batches)
+        posting lists are left as they are until `compact()` is called.
+        """
+        with self._lock:
+            for chunk_id in ids:
+                slot = self._slots.get(chunk_id)
+                if slot is not None:
+                    self._remove_slot(slot)
+            if compact:
+                self._compact_if_needed()
+
+    def compact(self):
+        with self._lock:
+            self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        if self._live_count == 0:
+            self._reset()
+            return
+        dead = len(self._slot_ids) - self._live_count
+        if dead > 1000 and dead > LEXICAL_COMPACT_RATIO * len(self._slot_ids):
+            self._compact()
+
+    def _remove_slot(self, slot: int):
+        del self._slots[self._slot_ids[slot]]
+        self._alive[slot] = 0
+        self._live_count -= 1
+        self._total_length -= self._lengths[slot]
+
+    def ids(self) -> List[str]:
+        """Chunk ids currently indexed"""
+        with self._lock:
+            return list(self._slots)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def _compact(self):
+        """Drop tombstoned slots from every posting list and renumber the rest"""
+        alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+        remap = (np.cumsum(alive) - 1).astype(np.uint32)
+        terms = {}
+        posting_slots, posting_tfs = [], []
+        for term, term_id in self._terms.items():
+            slots = np.frombuffer(self._posting_slots[term_id], dtype=np.uint32)
+            keep = alive[slots]
+            if not keep.any():
+                continue
+            terms[term] = len(posting_slots)
+            posting_slots.append(array("I", remap[slots[keep]].tobytes()))
+            posting_tfs.append(array("H", np.frombuffer(self._posting_tfs[term_id], dtype=np.uint16)[keep].tobytes()))
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)[alive]
+        slot_ids = [chunk_id for chunk_id, live in zip(self._slot_ids, alive) if live]
+
+        self._terms = terms
+        self._posting_slots = posting_slots
+        self._posting_tfs = posting_tfs
+        self._slot_ids = slot_ids
+        self._slots = {chunk_id: slot for slot, chunk_id in enumerate(slot_ids)}
+        self._lengths = array("I", lengths.tobytes())
+        self._alive = array("b", bytes([1]) * len(slot_ids))
+
+    def search(self, query: str, n_results: int) -> List[Tuple[str, float]]:
+        """Top `n_results` (chunk id, BM25 score) pairs for `query`, best first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not terms or n_results <= 0 or self._live_count == 0:
+                return []
+            return self._search(terms, n_results)
+
+    def _search(self, terms: List[str], n_results: int) -> List[Tuple[str, float]]:
+        # numpy views share memory with the arrays, so this runs under the lock
+        n_docs = self._live_count
+        avg_length = self._total_length / n_docs
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+        alive = np.frombuffer(self._alive, dtype=np.int8)
+
+        # Document frequency includes tombstones until the next compaction
+        term_ids = [self._terms[term] for term in terms if term in self._terms]
+        dfs = [len(self._posting_slots[term_id]) for term_id in term_ids]
+        # Very common terms add little to the ranking but dominate the cost;
+        # they are only scored when the query has nothing rarer
+        rare = [term_id for term_id, df in zip(term_ids, dfs) if df <= BM25_MAX_DF_RATIO * n_docs]
+        if rare:
+            term_ids = rare
+
+        matched = []
+        for term_id in term_ids:
+            slots = np.frombuffer(self._posting_slots[term_id], dtype=np.uint32)
+            tfs = np.frombuffer(self._posting_tfs[term_id], dtype=np.uint16).astype(np.float32)
+            df = len(slots)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[slots] / avg_length)
+            matched.append((slots, idf * tfs * (self.k1 + 1) / (tfs + norm)))
+        if not matched:
+            return []
+
+        if len(matched) == 1:
+            candidates, scores = matched[0]
+        else:
+            # Sum the per-term scores of every chunk that matched any term
+            all_slots = np.concatenate([slots for slots, _ in matched])
+            candidates, inverse = np.unique(all_slots, return_inverse=True)
+            scores = np.bincount(
+                inverse,
+                weights=np.concatenate([term_scores for _, term_scores in matched]),
+                minlength=len(candidates)
+            )
+        scores = np.where(alive[candidates] == 1, scores, 0)
+
+        k = min(n_results, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            (self._slot_ids[int(candidates[i])], float(scores[i]))
+            for i in top if scores[i] > 0
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chunks": self._live_count,
+                "tombstones": len(self._slot_ids) - self._live_count,
+                "terms": len(self._terms),
+                "postings": sum(len(slots) for slots in self._posting_slots)
+            }
+
+
+async def rebuild_lexical_index(store, index: LexicalIndex, page_size: int = 5000) -> int:
+    """Load every chunk text of the vector store into `index`; used at startup in persistent mode"""
+    index.clear()
+    offset = 0
+    while True:
+        page = await store.get(include=["documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        await run_in_pool("vector", index.add, page["ids"], page["documents"])
+        offset += len(page["ids"])
+    return len(index)
@@ -0,0 +1,182 @@
+# services/metrics.py
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "youassist_stage_duration_seconds",
+    "Time spent in each stage of an operation (chat, upload, ...); stage 'total' is the whole operation",
+    ["operation", "stage"],
+    buckets=STAGE_BUCKETS
+)
+IN_FLIGHT = Gauge("youassist_operations_in_flight", "Operations currently running", ["operation"])
+LLM_TOKENS = Counter("youassist_llm_tokens", "Tokens reported by the LLM", ["kind"])
+CHUNKS_INDEXED = Counter("youassist_chunks_indexed", "Chunks embedded and added to the vector store")
+DOCUMENTS_INGESTED = Counter("youassist_documents_ingested", "Documents processed by ingestion", ["status"])
+EMBEDDING_BATCH_SIZE = Histogram(
+    "youassist_query_embedding_batch_size",
+    "Distinct queries embedded per micro-batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+class Trace:
+    """Stage durations of one request or background job, for the Server-Timing header"""
+
+    __slots__ = ("operation", "timings")
+
+    def __init__(self):
+        self.operation: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.timings.items())
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_stage_children = {}  # (operation, stage) -> histogram child, skips the labels() lookup
+
+
+def observe(stage: str, seconds: float):
+    """Record `seconds` spent in `stage` of the current operation"""
+    if not METRICS_ENABLED:
+        return
+    trace = _trace.get()
+    operation = trace.operation if trace is not None and trace.operation else "other"
+    child = _stage_children.get((operation, stage))
+    if child is None:
+        child = _stage_children[(operation, stage)] = STAGE_SECONDS.labels(operation, stage)
+    child.observe(seconds)
+    if trace is not None:
+        trace.timings[stage] = trace.timings.get(stage, 0.0) + seconds
+
+
+class span:
+    """
+    Time a block as one stage of the current operation:
+
+        with span("embed"):
+            embeddings = await run_in_pool(...)
+
+    Spans of the same stage within one operation add up.
+    """
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Operation:
+    """
+    A traced operation (a chat request, an upload, an ingestion job).
+    Tracks it in the in-flight gauge and records its 'total' stage on
+    `end()`. Usable as a context manager; streaming responses call `end()`
+    themselves once the stream is finished.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        trace = _trace.get()
+        if trace is None or trace.operation is not None:
+            # Not inside a request (or already inside another operation)
+            trace = Trace()
+            _trace.set(trace)
+        trace.operation = name
+        self.trace = trace
+        self.start = time.perf_counter()
+        self._ended = False
+        if METRICS_ENABLED:
+            IN_FLIGHT.labels(name).inc()
+
+    def end(self):
+        if self._ended:
+            return
+        self._ended = True
+        if METRICS_ENABLED:
+            IN_FLIGHT.labels(self.name).dec()
+        observe("total", time.perf_counter() - self.start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+        return False
+
+
+def start_trace() -> Trace:
+    """Give the current request a fresh trace; used by the HTTP middleware"""
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+class AppCollector:
+    """Cache, pool and queue statistics, read from the app only when /metrics is scraped"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def collect(self):
+        from services.executors import pool_stats
+
+        state = self.app.state
+        hits = CounterMetricFamily("youassist_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("youassist_cache_misses", "Cache misses", labels=["cache"])
+        entries = GaugeMetricFamily("youassist_cache_entries", "Entries held per cache", labels=["cache"])
+        for name, cache in (
+            ("query_embeddings", state.query_embedding_cache),
+            ("retrieval", state.retrieval_cache),
+            ("responses", state.response_cache)
+        ):
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            entries.add_metric([name], stats["entries"])
+        yield hits
+        yield misses
+        yield entries
+
+        pools = GaugeMetricFamily("youassist_pool_jobs_in_flight", "Jobs running or queued per worker pool", labels=["pool"])
+        for name, stats in pool_stats().items():
+            pools.add_metric([name], stats["in_flight"])
+        yield pools
+
+        queue = getattr(state, "ingestion_queue", None)
+        if queue is not None:
+            yield GaugeMetricFamily("youassist_ingestion_jobs_queued", "Ingestion jobs waiting for a worker", value=queue.pending())
+        partitions = getattr(state, "partitions", None)
+        if partitions is not None:
+            stats = partitions.stats()
+            yield GaugeMetricFamily("youassist_partitions_open", "Tenant partitions open in this worker", value=stats["open"])
+            yield CounterMetricFamily("youassist_partitions_evicted", "Idle partitions closed to stay within PARTITION_MAX_OPEN", value=stats["evicted"])
+            yield GaugeMetricFamily("youassist_lexical_index_chunks", "Chunks in the BM25 indexes of open partitions", value=stats["lexical_chunks"])
+        yield GaugeMetricFamily("youassist_sessions", "Conversation sessions held in memory", value=state.sessions.stats()["sessions"])
+
+
+def register_app_metrics(app):
+    REGISTRY.register(AppCollector(app))
+
+
+def render_metrics():
+    """Prometheus text exposition of every registered metric"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
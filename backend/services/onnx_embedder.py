@@ -0,0 +1,167 @@
+# services/onnx_embedder.py
+import os
+from functools import cached_property
+from typing import List
+
+import numpy as np
+from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+
+from services.executors import get_pool
+
+# "int8": dynamically quantize the model's weights on first load (cached on
+# disk next to the model; needs the `onnx` package). Smaller and faster on
+# CPU at a small cost in accuracy; see benchmarks/bench_embeddings.py.
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "none").lower()
+# A different (e.g. pre-quantized) all-MiniLM-L6-v2 ONNX file
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "")
+# Threads per model call; 0 splits the cores between the embedding pool's workers
+EMBEDDING_INTRA_OP_THREADS = int(os.getenv("EMBEDDING_INTRA_OP_THREADS", "0"))
+EMBEDDING_INTER_OP_THREADS = int(os.getenv("EMBEDDING_INTER_OP_THREADS", "1"))
+# Texts per forward pass; texts are sorted by length so each pass pads little
+EMBEDDING_FORWARD_BATCH_SIZE = int(os.getenv("EMBEDDING_FORWARD_BATCH_SIZE", "32"))
+MAX_SEQUENCE_TOKENS = 256
+
+
+def _quantize(model_path: str) -> str:
+    """int8 copy of the model, created once and reused"""
+    quantized_path = os.path.splitext(model_path)[0] + ".int8.onnx"
+    if not os.path.exists(quantized_path):
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as e:
+            raise RuntimeError(f"EMBEDDING_QUANTIZE=int8 needs the onnx package (pip install onnx): {e}")
+        tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+        print(f"🗜️ Quantized embedding model to {quantized_path}")
+    return quantized_path
+
+
+class ChromaDefaultEmbeddingFunction(ONNXMiniLM_L6_V2):
+    """
+    Chroma's stock all-MiniLM-L6-v2 function (EMBEDDING_PROVIDER=chroma),
+    held as one instance so its session is loaded once. Newer Chroma
+    releases' DefaultEmbeddingFunction builds a new one on every call.
+    """
+
+    @staticmethod
+    def name() -> str:
+        return "default"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return ChromaDefaultEmbeddingFunction()
+
+    @staticmethod
+    def validate_config(config):
+        return
+
+
+class OnnxEmbeddingFunction(ONNXMiniLM_L6_V2):
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime, tuned for CPU serving.
+
+    Compared with Chroma's DefaultEmbeddingFunction, which builds a new model
+    session for every call and pads every text to 256 tokens:
+    - the session and tokenizer are loaded once and kept;
+    - texts are tokenized in one batch, sorted by length and run in batches
+      padded only to their own longest text;
+    - intra/inter-op thread counts are set explicitly, so the embedding
+      pool's threads don't oversubscribe the cores;
+    - the weights can be int8-quantized.
+
+    It reports itself as Chroma's "default" function: vectors come from the
+    same model, so existing collections keep working.
+    """
+
+    def __init__(
+        self,
+        quantize: str = EMBEDDING_QUANTIZE,
+        model_path: str = EMBEDDING_MODEL_PATH,
+        intra_op_threads: int = EMBEDDING_INTRA_OP_THREADS,
+        inter_op_threads: int = EMBEDDING_INTER_OP_THREADS,
+        batch_size: int = EMBEDDING_FORWARD_BATCH_SIZE
+    ):
+        super().__init__(preferred_providers=["CPUExecutionProvider"])
+        self.quantize = quantize
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.batch_size = max(1, batch_size)
+
+    @staticmethod
+    def name() -> str:
+        return "default"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return OnnxEmbeddingFunction()
+
+    @staticmethod
+    def validate_config(config):
+        return
+
+    @cached_property
+    def tokenizer(self):
+        self._download_model_if_not_exists()
+        tokenizer = self.Tokenizer.from_file(
+            os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "tokenizer.json")
+        )
+        tokenizer.enable_truncation(max_length=MAX_SEQUENCE_TOKENS)
+        tokenizer.no_padding()
+        return tokenizer
+
+    @cached_property
+    def model(self):
+        model_path = self.model_path
+        if not model_path:
+            self._download_model_if_not_exists()
+            model_path = os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "model.onnx")
+        if self.quantize == "int8":
+            model_path = _quantize(model_path)
+
+        intra_op_threads = self.intra_op_threads
+        if intra_op_threads <= 0:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // get_pool("embedding").workers)
+        options = self.ort.SessionOptions()
+        options.log_severity_level = 3
+        options.graph_optimization_level = self.ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = max(1, self.inter_op_threads)
+        return self.ort.InferenceSession(model_path, providers=self._preferred_providers, sess_options=options)
+
+    def _forward(self, documents: List[str], batch_size: int = None) -> np.ndarray:
+        batch_size = batch_size or self.batch_size
+        encoded = self.tokenizer.encode_batch(list(documents))
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i].ids))
+        embeddings = None
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            width = max(len(encoded[i].ids) for i in batch)
+            input_ids = np.zeros((len(batch), width), dtype=np.int64)
+            attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+            for row, i in enumerate(batch):
+                ids = encoded[i].ids
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
+            hidden = self.model.run(None, {
+                "input_ids": input_ids,
+                "attention_mask": attention_mask,
+                "token_type_ids": np.zeros_like(input_ids)
+            })[0]
+            # Mean pooling over real tokens, then L2 normalization
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if embeddings is None:
+                embeddings = np.empty((len(encoded), pooled.shape[1]), dtype=np.float32)
+            embeddings[batch] = self._normalize(pooled)
+        return embeddings
+
+    def __call__(self, input):
+        return list(self._forward(input))
@@ -0,0 +1,201 @@
+# services/partitions.py
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
+
+from fastapi import HTTPException, Request
+
+from services.executors import run_in_pool
+from services.lexical_index import LexicalIndex, rebuild_lexical_index
+from services.registry import reconcile_registry
+from services.retrieval import next_generation
+
+# "user" (default): every signed-in user searches and manages only their own
+# documents, anonymous requests share the public partition;
+# "none": everyone shares the public partition
+TENANT_ISOLATION = os.getenv("TENANT_ISOLATION", "user").lower()
+# Users' partitions kept open at once (the public one comes on top); beyond
+# that the least recently used idle one is closed
+PARTITION_MAX_OPEN = int(os.getenv("PARTITION_MAX_OPEN", "64"))
+PUBLIC_TENANT = "public"
+
+
+def tenant_for(user: Optional[str]) -> str:
+    """The tenant whose documents a request works on"""
+    if user is None or TENANT_ISOLATION == "none":
+        return PUBLIC_TENANT
+    return f"user:{user}"
+
+
+def partition_key(tenant: str) -> str:
+    """Name of a tenant's collection, state namespace and directory (no user data in it)"""
+    if tenant == PUBLIC_TENANT:
+        return tenant
+    return hashlib.sha256(tenant.encode("utf-8")).hexdigest()[:32]
+
+
+class Partition:
+    """
+    One tenant's documents: a vector store of its own (a separate Chroma
+    collection or local index), its BM25 index and its document registry.
+    Ingestion, search and deletes only ever touch the caller's partition,
+    so their cost follows the tenant's corpus, not everyone's.
+
+    The query caches are shared by all partitions; keys include the tenant
+    and `generation`, which every document change replaces. Generations come
+    from a process-wide counter, so entries cached before the partition was
+    last closed are never hit once it's reopened.
+    """
+
+    def __init__(self, app, tenant: str, vector_store, document_metadata):
+        self.app = app
+        self.tenant = tenant
+        self.key = partition_key(tenant)
+        self.vector_store = vector_store
+        self.document_metadata = document_metadata
+        self.lexical_index = LexicalIndex()
+        self.generation = next_generation()
+        self.users = 0  # requests and jobs currently using the partition
+        # Registry state the multi-worker watcher last applied (see watch_registry)
+        self.synced = {}
+        self.synced_version = None
+
+    @property
+    def embedding_function(self):
+        return self.app.state.embedding_function
+
+    def close(self):
+        self.vector_store.close()
+        self.document_metadata.close()
+
+
+class PartitionManager:
+    """
+    The open partitions, in LRU order.
+
+    A partition is opened on first use: `opener(tenant)` opens its vector
+    store and registry (in the vector pool), then its BM25 index is rebuilt
+    from the stored chunks. Beyond `max_open` partitions the least recently
+    used idle one is closed, which frees its BM25 index and registry and,
+    for the local backend, its vectors; a Chroma collection stays with
+    Chroma (in this process for the in-process ephemeral client).
+    Partitions in use (see `use`) and the public partition are never closed;
+    the public one doesn't count towards `max_open`.
+    """
+
+    def __init__(
+        self,
+        app,
+        opener: Callable[[str], tuple],
+        max_open: int = PARTITION_MAX_OPEN,
+        reconcile: bool = False
+    ):
+        self.app = app
+        self.opener = opener
+        self.max_open = max(1, max_open)
+        self.reconcile = reconcile
+        self.opened = 0
+        self.evicted = 0
+        self._partitions: "OrderedDict[str, Partition]" = OrderedDict()
+        self._loading = {}  # tenant -> task opening it
+        self._closing = {}  # tenant -> task closing it
+
+    def open_partitions(self) -> List[Partition]:
+        return list(self._partitions.values())
+
+    async def open(self, tenant: str) -> Partition:
+        """The tenant's partition, opening it if needed (without holding it open; see `use`)"""
+        partition = self._partitions.get(tenant)
+        if partition is not None:
+            self._partitions.move_to_end(tenant)
+            return partition
+        task = self._loading.get(tenant)
+        if task is None:
+            task = self._loading[tenant] = asyncio.ensure_future(self._load(tenant))
+            task.add_done_callback(lambda _: self._loading.pop(tenant, None))
+        # Shielded: a cancelled request doesn't abort a load others wait on
+        return await asyncio.shield(task)
+
+    @asynccontextmanager
+    async def use(self, tenant: str):
+        """Hold the tenant's partition open for the duration of the block"""
+        partition = await self.open(tenant)
+        partition.users += 1
+        try:
+            yield partition
+        finally:
+            partition.users -= 1
+            self._evict()
+
+    async def _load(self, tenant: str) -> Partition:
+        closing = self._closing.get(tenant)
+        if closing is not None:
+            # Reopen only once the files of the previous close are written
+            await closing
+        vector_store, registry = await run_in_pool("vector", self.opener, tenant)
+        partition = Partition(self.app, tenant, vector_store, registry)
+        try:
+            if self.reconcile:
+                report = await reconcile_registry(vector_store, registry)
+                if report["dropped"] or report["purged_chunks"]:
+                    print(f"🔎 Registry check for partition {partition.key}: {report}")
+            if await vector_store.count():
+                await rebuild_lexical_index(vector_store, partition.lexical_index)
+        except Exception:
+            await run_in_pool("vector", partition.close)
+            raise
+        self._partitions[tenant] = partition
+        self.opened += 1
+        return partition
+
+    def _evict(self):
+        while len(self._partitions) - (PUBLIC_TENANT in self._partitions) > self.max_open:
+            idle = next(
+                (tenant for tenant, partition in self._partitions.items()
+                 if partition.users == 0 and tenant != PUBLIC_TENANT),
+                None
+            )
+            if idle is None:
+                return
+            partition = self._partitions.pop(idle)
+            self.evicted += 1
+            task = self._closing[idle] = asyncio.ensure_future(self._close(partition))
+            task.add_done_callback(lambda _, tenant=idle: self._closing.pop(tenant, None))
+
+    @staticmethod
+    async def _close(partition: Partition):
+        try:
+            await run_in_pool("vector", partition.close)
+        except Exception as e:
+            print(f"⚠️ Error closing partition {partition.key}: {e}")
+
+    async def close(self):
+        """Close every partition (shutdown)"""
+        await asyncio.gather(*self._closing.values(), return_exceptions=True)
+        for partition in self._partitions.values():
+            partition.close()
+        self._partitions.clear()
+
+    def stats(self) -> dict:
+        partitions = self.open_partitions()
+        return {
+            "open": len(partitions),
+            "max_open": self.max_open,
+            "in_use": sum(1 for partition in partitions if partition.users),
+            "opened": self.opened,
+            "evicted": self.evicted,
+            "lexical_chunks": sum(len(partition.lexical_index) for partition in partitions)
+        }
+
+
+@asynccontextmanager
+async def partition_for(request: Request, user: Optional[str]):
+    """The caller's partition (see TENANT_ISOLATION), held open for the duration of the block"""
+    partitions = request.app.state.partitions
+    if partitions is None:
+        raise HTTPException(status_code=503, detail="Vector database not initialized")
+    async with partitions.use(tenant_for(user)) as partition:
+        yield partition
@@ -0,0 +1,291 @@
+# services/prompt_builder.py
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import chain
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to an approximate count
+    tiktoken = None
+
+# Tokens allowed for the whole prompt (system + history + context + question)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# Share of what's left after the system prompt and question that retrieved chunks may use
+PROMPT_CONTEXT_SHARE = float(os.getenv("PROMPT_CONTEXT_SHARE", "0.6"))
+# Tokens for the summary of conversation turns that no longer fit
+PROMPT_SUMMARY_TOKENS = int(os.getenv("PROMPT_SUMMARY_TOKENS", "200"))
+# Llama 3's vocabulary extends cl100k_base, so its counts are a close
+# (slightly high) estimate for the chat model. tiktoken downloads the
+# encoding once into TIKTOKEN_CACHE_DIR; offline hosts need it copied there
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+# Smallest truncated chunk worth including when a chunk doesn't fit whole
+MIN_CHUNK_TOKENS = 64
+# Per-message framing overhead of chat formats (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SYSTEM_PROMPT = "You are an assistant. Be specific and direct in your replies."
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _load_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(PROMPT_TOKENIZER)
+    except Exception as e:
+        print(f"⚠️ Tokenizer '{PROMPT_TOKENIZER}' unavailable ({e}); using approximate token counts")
+        return None
+
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    The PROMPT_TOKENIZER encoding, loaded on first use (the app loads it
+    at startup, off the event loop); None means approximate counts
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                _encoding = _load_encoding()
+                _encoding_loaded = True
+    return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """
+    Token count of `text` with the local tokenizer. Without tiktoken it's an
+    estimate: one token per punctuation mark and ~4 characters per word piece.
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(piece) / 4) for piece in _WORD_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + "…"
+    kept, used = [], 0
+    for match in re.finditer(r"\S+\s*", text):
+        cost = count_tokens(match.group())
+        if used + cost > max_tokens:
+            break
+        kept.append(match.group())
+        used += cost
+    return "".join(kept).rstrip() + "…"
+
+
+def _overlap(previous: str, following: str, probe: int = 64) -> int:
+    """Length of the longest suffix of `previous` that starts `following`"""
+    head = following[:min(probe, len(following))]
+    if not head:
+        return 0
+    start = previous.find(head)
+    while start != -1:
+        tail = previous[start:]
+        if following.startswith(tail):
+            return len(tail)
+        start = previous.find(head, start + 1)
+    return 0
+
+
+def merge_chunks(chunks: Sequence[Tuple[str, dict]]) -> List[Tuple[str, dict, List[int]]]:
+    """
+    Drop duplicate chunks and merge chunks that are adjacent in the same
+    document, removing the text they share through chunk overlap.
+    Returns (text, metadata, indices of the input chunks) in rank order.
+    """
+    merged = []  # [text, metadata, indices]
+    seen_texts = set()
+    by_position = {}  # (document_id, chunk_index) -> merged entry
+    for i, (text, metadata) in enumerate(chunks):
+        if text in seen_texts:
+            continue
+        seen_texts.add(text)
+        doc_id = metadata.get("document_id")
+        index = metadata.get("chunk_index")
+        entry = None
+        if doc_id is not None and index is not None:
+            before = by_position.get((doc_id, index - 1))
+            after = by_position.get((doc_id, index + 1))
+            if before is not None:
+                before[0] += text[_overlap(before[0], text):]
+                entry = before
+            elif after is not None:
+                after[0] = text + after[0][_overlap(text, after[0]):]
+                entry = after
+        if entry is None:
+            entry = [text, metadata, []]
+            merged.append(entry)
+        entry[2].append(i)
+        if doc_id is not None and index is not None:
+            by_position[(doc_id, index)] = entry
+    return [(text, metadata, indices) for text, metadata, indices in merged]
+
+
+def summary_line(role: str, content: str) -> str:
+    """One summary line for a conversation turn: its first sentence"""
+    first = _SENTENCE_RE.split(content.strip(), maxsplit=1)[0]
+    return f"- {role}: {truncate_to_tokens(first, 40)}"
+
+
+def summarize_turns(
+    turns: Sequence[Tuple[str, str]],
+    max_tokens: int,
+    earlier: Sequence[str] = ()
+) -> Optional[str]:
+    """
+    Extractive summary of conversation turns that no longer fit: the first
+    sentence of each turn, most recent turns first until `max_tokens` is
+    used, listed in conversation order. `earlier` are summary lines of
+    turns older than `turns` (e.g. a session's rolling summary).
+    """
+    if (not turns and not earlier) or max_tokens <= 0:
+        return None
+    header = "Summary of the earlier conversation:"
+    lines, used = [], count_tokens(header)
+    candidates = chain(
+        (summary_line(role, content) for role, content in reversed(turns)),
+        reversed(earlier)
+    )
+    for line in candidates:
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return None
+    return "\n".join([header] + lines[::-1])
+
+
+def _augment(question: str, context: str) -> str:
+    return f"""Based on the following context from uploaded documents, please answer the question.
+            Context:
+            {context}
+
+            Question: {question}
+
+            Please provide a comprehensive answer based on the context above. If the context doesn't contain enough information, please say so."""
+
+
+@dataclass
+class Prompt:
+    messages: List[dict]
+    prompt_tokens: int
+    used_chunks: List[int] = field(default_factory=list)  # indices of the chunks that made it in
+    history_kept: int = 0
+    history_summarized: int = 0
+
+
+def build_prompt(
+    question: str,
+    history: Sequence[Tuple[str, str]] = (),
+    chunks: Optional[Sequence[Tuple[str, dict]]] = None,
+    budget: int = PROMPT_TOKEN_BUDGET,
+    system_prompt: str = SYSTEM_PROMPT,
+    history_tokens: Optional[Sequence[int]] = None,
+    earlier_summary: Sequence[str] = ()
+) -> Prompt:
+    """
+    Fit the system prompt, conversation history, retrieved chunks and the
+    question into `budget` tokens.
+
+    `chunks` are (text, metadata) in rank order; None means the knowledge
+    base wasn't used, an empty list that nothing relevant was found.
+    Chunks are deduplicated and merged, then packed best-first into their
+    share of the budget. History is kept newest-first in what's left; turns
+    that don't fit are replaced by a short extractive summary.
+
+    `history_tokens` are precomputed token counts of the history contents
+    (sessions keep them so turns aren't re-tokenized on every request);
+    `earlier_summary` are summary lines of turns no longer in `history`.
+    """
+    system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+    question_tokens = count_tokens(_augment(question, "")) if chunks else count_tokens(question)
+    question_tokens += MESSAGE_OVERHEAD_TOKENS
+    available = max(0, budget - system_tokens - question_tokens)
+
+    # Retrieved context
+    used_chunks = []
+    if chunks:
+        context_budget = int(available * PROMPT_CONTEXT_SHARE)
+        parts, context_tokens = [], 0
+        for text, metadata, indices in merge_chunks(chunks):
+            part = f"From {metadata.get('filename')}:\n{text}"
+            cost = count_tokens(part) + 1
+            if context_tokens + cost > context_budget:
+                room = context_budget - context_tokens - 1
+                if room < MIN_CHUNK_TOKENS:
+                    continue
+                # Too long for what's left: keep its beginning, then stop
+                part = truncate_to_tokens(part, room)
+                cost = count_tokens(part) + 1
+                context_budget = context_tokens + cost
+            parts.append(part)
+            context_tokens += cost
+            used_chunks.extend(indices)
+        if parts:
+            user_content = _augment(question, "\n\n".join(parts))
+        else:
+            user_content = question + "\n\n(Note: No relevant information found in uploaded documents)"
+    elif chunks is not None:
+        user_content = question + "\n\n(Note: No relevant information found in uploaded documents)"
+    else:
+        user_content = question
+    user_tokens = count_tokens(user_content) + MESSAGE_OVERHEAD_TOKENS
+    available = max(0, budget - system_tokens - user_tokens)
+
+    # History, newest turns first; keep room for a summary of what's dropped
+    kept = []
+    history = list(history)
+    if history_tokens is None:
+        history_tokens = [count_tokens(content) for _, content in history]
+    reserve = min(PROMPT_SUMMARY_TOKENS, available // 4)
+    for position in range(len(history) - 1, -1, -1):
+        role, content = history[position]
+        cost = history_tokens[position] + MESSAGE_OVERHEAD_TOKENS
+        limit = available - (reserve if position > 0 or earlier_summary else 0)
+        if cost > limit:
+            break
+        kept.append((role, content))
+        available -= cost
+    kept.reverse()
+    dropped = history[:len(history) - len(kept)]
+
+    summary = None
+    if dropped or earlier_summary:
+        summary = summarize_turns(dropped, available - MESSAGE_OVERHEAD_TOKENS, earlier=earlier_summary)
+    if summary:
+        system_prompt = f"{system_prompt}\n\n{summary}"
+        system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend({"role": role, "content": content} for role, content in kept)
+    messages.append({"role": "user", "content": user_content})
+
+    return Prompt(
+        messages=messages,
+        prompt_tokens=system_tokens + user_tokens + sum(history_tokens[len(dropped):]) + MESSAGE_OVERHEAD_TOKENS * len(kept),
+        used_chunks=used_chunks,
+        history_kept=len(kept),
+        history_summarized=len(dropped) if summary else 0
+    )
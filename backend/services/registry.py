@@ -0,0 +1,332 @@
+# services/registry.py
+import asyncio
+import json
+import os
+import threading
+from collections.abc import MutableMapping
+from typing import Optional
+
+from services.executors import run_in_pool
+from services.retrieval import invalidate_retrieval_cache
+from services.state_store import STATE_SYNC_INTERVAL
+
+
+class DocumentRegistry(MutableMapping):
+    """
+    Document metadata keyed by document id (a partition's
+    `document_metadata`). Without a path it's a plain in-memory dict.
+
+    With a path, every change is appended (and fsynced) to a JSON-lines
+    journal, so writes cost O(1) regardless of corpus size. On load the journal is replayed
+    and rewritten as a compact snapshot.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._data = {}
+        self._lock = threading.Lock()
+        self._journal = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-write; everything before it is intact
+                        continue
+                    if entry["op"] == "set":
+                        entry["value"].pop("chunk_ids", None)  # no longer kept (chunks are found by document_id)
+                        self._data[entry["id"]] = entry["value"]
+                    elif entry["op"] == "del":
+                        self._data.pop(entry["id"], None)
+                    elif entry["op"] == "clear":
+                        self._data.clear()
+        self.compact()
+
+    def compact(self):
+        """Rewrite the journal as one `set` line per live document"""
+        if not self.path:
+            return
+        with self._lock:
+            if self._journal:
+                self._journal.close()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for doc_id, value in self._data.items():
+                    f.write(json.dumps({"op": "set", "id": doc_id, "value": value}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._journal = open(self.path, "a", encoding="utf-8")
+
+    def _append(self, entry: dict):
+        if self._journal:
+            self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            # Durable like the vector store's journal: a registry that falls
+            # behind it after a crash makes reconcile_registry purge chunks
+            os.fsync(self._journal.fileno())
+
+    def __getitem__(self, doc_id):
+        return self._data[doc_id]
+
+    def __setitem__(self, doc_id, value):
+        with self._lock:
+            self._data[doc_id] = value
+            self._append({"op": "set", "id": doc_id, "value": value})
+
+    def __delitem__(self, doc_id):
+        with self._lock:
+            del self._data[doc_id]
+            self._append({"op": "del", "id": doc_id})
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._data
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._append({"op": "clear"})
+
+    def refresh(self) -> bool:
+        """Nothing to reload: this process is the only writer"""
+        return False
+
+    def close(self):
+        with self._lock:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+
+
+class SharedDocumentRegistry(MutableMapping):
+    """
+    Document registry kept in the shared state store, for running several
+    workers. Reads are served from an in-process copy; `refresh()` reloads
+    it when the store's version shows another worker changed something
+    (one small query when nothing has). Writes go straight to the store.
+    Each partition has its own `namespace`.
+    """
+
+    def __init__(self, store, namespace: str = "documents"):
+        self.store = store
+        self.namespace = namespace
+        self.version = -1
+        self._data = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Reload from the store if it changed; True if it did"""
+        version = self.store.version(self.namespace)
+        if version == self.version:
+            return False
+        data = self.store.items(self.namespace)
+        for value in data.values():
+            value.pop("chunk_ids", None)  # written by older versions
+        with self._lock:
+            self._data = data
+            self.version = version
+        return True
+
+    def _wrote(self, version: int):
+        # Our copy is current only if nobody else wrote since the last refresh
+        if version == self.version + 1:
+            self.version = version
+
+    def __getitem__(self, doc_id):
+        return self._data[doc_id]
+
+    def __setitem__(self, doc_id, value):
+        with self._lock:
+            self._data[doc_id] = value
+            self._wrote(self.store.put(self.namespace, doc_id, value))
+
+    def __delitem__(self, doc_id):
+        with self._lock:
+            del self._data[doc_id]
+            self._wrote(self.store.delete(self.namespace, doc_id))
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._data
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+            self._wrote(self.store.clear(self.namespace))
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def clear_shared_registries(store, prefix: str = "documents") -> int:
+    """Empty every partition's registry in the state store; returns how many had entries"""
+    namespaces = store.namespaces(prefix)
+    for namespace in namespaces:
+        store.clear(namespace)
+    return len(namespaces)
+
+
+def _document_of(chunk_id: str) -> str:
+    # Chunk ids are "<document id>_chunk_<suffix>" (see ingestion._chunk_records)
+    return chunk_id.rsplit("_chunk_", 1)[0]
+
+
+async def _stored_ids(store, where: Optional[dict] = None, batch_size: int = 5000) -> set:
+    """Ids of the stored chunks matching a filter, read page by page (ids only)"""
+    ids, offset = set(), 0
+    while True:
+        page = await store.get(where=where, include=[], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            return ids
+        ids.update(page["ids"])
+        offset += len(page["ids"])
+
+
+async def sync_partition(partition, batch_size: int = 5000):
+    """
+    Bring a partition's lexical index and caches in line with documents
+    other workers added, re-indexed or deleted since the last call. Chunk
+    texts are read back from the shared vector store.
+
+    The registry keeps no chunk lists, so chunks are found by their
+    `document_id` metadata, and only for documents whose registry entry
+    changed. The first pass, and any pass after every synced document went
+    (a delete-all), compares the whole store with the lexical index
+    instead: that catches documents registered while it was being built,
+    and chunks a reset dropped that were never registered.
+    """
+    registry = partition.document_metadata
+    lexical_index = partition.lexical_index
+    store = partition.vector_store
+    await run_in_pool("vector", registry.refresh)
+    if registry.version == partition.synced_version:
+        return
+    first_pass = partition.synced_version is None
+    partition.synced_version = registry.version
+    synced = partition.synced
+    current = {doc_id: (meta.get("content_hash"), meta["chunks"]) for doc_id, meta in registry.items()}
+    partition.synced = current
+
+    if first_pass or not synced.keys() & current.keys():
+        # Snapshot the lexical index first: chunks reach the store before it
+        indexed = set(lexical_index.ids())
+        stored = await _stored_ids(store, batch_size=batch_size)
+        added = list(stored.difference(indexed))
+        removed = list(indexed.difference(stored))
+    else:
+        changed = [doc_id for doc_id, state in current.items() if synced.get(doc_id) != state]
+        gone = {doc_id for doc_id in synced if doc_id not in current}
+        if not changed and not gone:
+            return
+        affected = gone.union(changed)
+        indexed = {}  # document id -> its chunk ids in the lexical index
+        for chunk_id in lexical_index.ids():
+            doc_id = _document_of(chunk_id)
+            if doc_id in affected:
+                indexed.setdefault(doc_id, set()).add(chunk_id)
+        removed = [chunk_id for doc_id in gone for chunk_id in indexed.get(doc_id, ())]
+        added = []
+        for doc_id in changed:
+            stored = await _stored_ids(store, where={"document_id": doc_id}, batch_size=batch_size)
+            have = indexed.get(doc_id, set())
+            # Only differences are applied: chunks this worker indexed or deleted itself are left alone
+            added.extend(stored.difference(have))
+            removed.extend(have.difference(stored))
+    if not removed and not added:
+        return
+
+    if removed:
+        await run_in_pool("vector", lexical_index.remove, removed)
+    for start in range(0, len(added), batch_size):
+        page = await store.get(ids=added[start:start + batch_size], include=["documents"])
+        await run_in_pool("vector", lexical_index.add, page["ids"], page["documents"])
+    invalidate_retrieval_cache(partition)
+    print(f"🔁 Synced partition {partition.key} from other workers: +{len(added)} / -{len(removed)} chunks")
+
+
+async def watch_registry(app, interval: float = STATE_SYNC_INTERVAL):
+    """
+    Multi-worker mode: keep every partition this worker has open in sync
+    with changes made by other workers. Runs until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for partition in app.state.partitions.open_partitions():
+            try:
+                await sync_partition(partition)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Registry sync failed for partition {partition.key}: {e}")
+
+
+async def reconcile_registry(store, registry: DocumentRegistry, page_size: int = 5000) -> dict:
+    """
+    Startup consistency check between the registry and the vector store.
+
+    Scans chunk metadata page by page (no documents or embeddings are
+    loaded, nothing is re-embedded) and then:
+    - drops registry entries whose chunks are missing or incomplete,
+    - deletes chunks of documents that were never registered (ingestion
+      interrupted before it completed, so the upload was never acknowledged).
+    """
+    found = {}  # document_id -> {"filename", "ids"}
+    offset = 0
+    while True:
+        page = await store.get(include=["metadatas"], limit=page_size, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            break
+        for chunk_id, meta in zip(ids, page["metadatas"]):
+            doc_id = (meta or {}).get("document_id")
+            if doc_id is None:
+                continue
+            doc = found.setdefault(doc_id, {"filename": meta.get("filename"), "ids": []})
+            doc["ids"].append(chunk_id)
+        offset += len(ids)
+
+    report = {"documents": 0, "dropped": 0, "purged_chunks": 0}
+    stale_ids = []
+
+    for doc_id in list(registry):
+        doc = found.get(doc_id)
+        if doc is None or len(doc["ids"]) != registry[doc_id]["chunks"]:
+            print(f"⚠️ Registry entry '{registry[doc_id]['filename']}' doesn't match the vector store; dropping it")
+            del registry[doc_id]
+            report["dropped"] += 1
+            if doc is not None:
+                stale_ids.extend(doc["ids"])
+                found.pop(doc_id)
+
+    for doc_id, doc in found.items():
+        if doc_id not in registry:
+            stale_ids.extend(doc["ids"])
+
+    if stale_ids:
+        await store.delete(ids=stale_ids)
+    report["purged_chunks"] = len(stale_ids)
+    report["documents"] = len(registry)
+
+    registry.compact()
+    return report
@@ -0,0 +1,176 @@
+# services/retrieval.py
+import asyncio
+import itertools
+import os
+
+import numpy as np
+
+from services.cache import LRUCache, SemanticCache
+from services.executors import run_in_pool
+from services.metrics import span
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+QUERY_EMBEDDING_CACHE_MAX_MB = float(os.getenv("QUERY_EMBEDDING_CACHE_MAX_MB", "32"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+RETRIEVAL_CACHE_MAX_MB = float(os.getenv("RETRIEVAL_CACHE_MAX_MB", "64"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+# Hybrid retrieval: fuse BM25 and dense rankings with reciprocal rank fusion
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Partition generations, drawn process-wide so a partition reopened after
+# an eviction never reuses a generation its cache entries were stored under
+_generations = itertools.count(1)
+
+
+def create_retrieval_caches(app):
+    """Attach the query embedding, retrieval result and answer caches to the app"""
+    app.state.query_embedding_cache = LRUCache(
+        "query_embeddings",
+        max_entries=QUERY_EMBEDDING_CACHE_SIZE,
+        max_bytes=int(QUERY_EMBEDDING_CACHE_MAX_MB * 1024 * 1024),
+        ttl_seconds=QUERY_EMBEDDING_CACHE_TTL
+    )
+    app.state.retrieval_cache = LRUCache(
+        "retrieval",
+        max_entries=RETRIEVAL_CACHE_SIZE,
+        max_bytes=int(RETRIEVAL_CACHE_MAX_MB * 1024 * 1024),
+        ttl_seconds=RETRIEVAL_CACHE_TTL
+    )
+    app.state.response_cache = SemanticCache(
+        "responses",
+        max_entries=SEMANTIC_CACHE_SIZE if SEMANTIC_CACHE_ENABLED else 0,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds=SEMANTIC_CACHE_TTL
+    )
+
+
+def next_generation() -> int:
+    return next(_generations)
+
+
+def invalidate_retrieval_cache(partition):
+    """
+    Retire a partition's cached search results and answers; call whenever its
+    documents are added or removed. Cache keys carry the partition's
+    generation, so older entries are never hit again and age out of the LRU.
+    """
+    partition.generation = next_generation()
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+async def embed_query(app, query: str) -> np.ndarray:
+    """Embed a query string (micro-batched with concurrent queries), reusing cached embeddings for repeated queries"""
+    key = normalize_query(query)
+    cache = app.state.query_embedding_cache
+    embedding = cache.get(key)
+    if embedding is None:
+        with span("embed_query"):
+            embedding = await app.state.query_embedder.embed(key)
+        cache.set(key, embedding)
+    return embedding
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> list:
+    """Merge ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+async def _dense_search(partition, embedding: np.ndarray, n_results: int) -> dict:
+    with span("vector_query"):
+        results = await partition.vector_store.query([embedding], n_results)
+    return results[0]
+
+
+async def _lexical_search(partition, query: str, n_results: int) -> list:
+    with span("lexical_query"):
+        return await run_in_pool("vector", partition.lexical_index.search, query, n_results)
+
+
+async def _hybrid_search(partition, query: str, embedding: np.ndarray, n_results: int) -> dict:
+    candidates = max(n_results, HYBRID_CANDIDATES)
+    dense, lexical = await asyncio.gather(
+        _dense_search(partition, embedding, candidates),
+        _lexical_search(partition, query, candidates)
+    )
+    if not lexical:
+        return {key: values[:n_results] for key, values in dense.items()}
+
+    fused = reciprocal_rank_fusion([dense["ids"], [chunk_id for chunk_id, _ in lexical]])[:n_results]
+    found = {
+        chunk_id: (document, metadata, distance)
+        for chunk_id, document, metadata, distance in zip(
+            dense["ids"], dense["documents"], dense["metadatas"], dense["distances"]
+        )
+    }
+    missing = [chunk_id for chunk_id in fused if chunk_id not in found]
+    if missing:
+        # Lexical-only hits: load their text and score them against the query
+        # embedding so every result carries a comparable cosine distance
+        with span("vector_get"):
+            rows = await partition.vector_store.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+        query_vector = embedding / (np.linalg.norm(embedding) or 1.0)
+        for chunk_id, document, metadata, vector in zip(
+            rows["ids"], rows["documents"], rows["metadatas"], rows["embeddings"]
+        ):
+            vector = np.asarray(vector, dtype=np.float32)
+            similarity = float(vector @ query_vector) / (float(np.linalg.norm(vector)) or 1.0)
+            found[chunk_id] = (document, metadata, 1.0 - similarity)
+
+    fused = [chunk_id for chunk_id in fused if chunk_id in found]
+    return {
+        "ids": fused,
+        "documents": [found[chunk_id][0] for chunk_id in fused],
+        "metadatas": [found[chunk_id][1] for chunk_id in fused],
+        "distances": [found[chunk_id][2] for chunk_id in fused],
+    }
+
+
+async def retrieve(partition, query: str, n_results: int) -> dict:
+    """
+    Top-k search for `query` in a partition. Returns flat `ids`, `documents`,
+    `metadatas` and `distances` lists, served from the retrieval cache when
+    possible.
+
+    With HYBRID_SEARCH the dense and BM25 top HYBRID_CANDIDATES are fused
+    with reciprocal rank fusion, so exact matches on identifiers, codes and
+    names surface even when their embedding similarity is low.
+    """
+    cache = partition.app.state.retrieval_cache
+    # The key takes the partition's generation before searching, so a result
+    # that raced with an invalidation is stored where it's never looked up
+    key = (partition.tenant, partition.generation, normalize_query(query), n_results)
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    embedding = await embed_query(partition.app, query)
+    if HYBRID_SEARCH:
+        results = await _hybrid_search(partition, query, embedding, n_results)
+    else:
+        results = await _dense_search(partition, embedding, n_results)
+    cache.set(key, results)
+    return results
+
+
+def cache_stats(app) -> dict:
+    return {
+        "query_embeddings": app.state.query_embedding_cache.stats(),
+        "retrieval": app.state.retrieval_cache.stats(),
+        "responses": app.state.response_cache.stats(),
+        "partitions": app.state.partitions.stats() if app.state.partitions is not None else None,
+        "sessions": app.state.sessions.stats()
+    }
@@ -1,56 +1,209 @@
-from PyPDF2 import PdfReader
-from docx import Document
+import codecs
+import hashlib
 import io
+import os
+import tempfile
+import zipfile
+from contextlib import contextmanager
 
-# def extract_text_from_pdf(file_content: bytes) -> str:
-#     """Extract text from PDF file"""
-#     pdf_reader = PdfReader(io.BytesIO(file_content))
-#     text = ""
-#     for page in pdf_reader.pages:
-#         text += page.extract_text() + "\n"
-#     return text
-
-# def extract_text_from_docx(file_content: bytes) -> str:
-#     """Extract text from DOCX file"""
-#     doc = Document(io.BytesIO(file_content))
-#     text = ""
-#     for paragraph in doc.paragraphs:
-#         text += paragraph.text + "\n"
-#     return text
-
-# def extract_text_from_txt(file_content: bytes) -> str:
-#     """Extract text from TXT file"""
-#     return file_content.decode('utf-8')
-
-
-def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract text from PDF file"""
+TXT_SEGMENT_BYTES = 64 * 1024
+
+
+@contextmanager
+def open_source(source):
+    """
+    Binary file object over a document source: raw bytes or a file path.
+    Paths are read lazily from disk, never copied into memory as a whole.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+
+def hash_source(source) -> str:
+    """sha256 of a document source, read in 1MB pieces"""
+    digest = hashlib.sha256()
+    with open_source(source) as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def preload_parsers():
+    """Import the PDF and DOCX parsers (they are imported on first use otherwise)"""
+    import PyPDF2  # noqa: F401
+    import docx  # noqa: F401
+
+
+def iter_pdf_pages(source, start: int = 0, end: int = None):
+    """Yield (page_number, text) for PDF pages [start, end), 1-based page numbers"""
+    from PyPDF2 import PdfReader
     try:
-        pdf_reader = PdfReader(io.BytesIO(file_content))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        with open_source(source) as f:
+            pdf_reader = PdfReader(f)
+            pages = pdf_reader.pages
+            for index in range(start, len(pages) if end is None else min(end, len(pages))):
+                yield index + 1, (pages[index].extract_text() or "") + "\n"
     except Exception as e:
         raise Exception(f"Error extracting PDF: {str(e)}")
 
-def extract_text_from_docx(file_content: bytes) -> str:
-    """Extract text from DOCX file"""
+
+def count_pdf_pages(source) -> int:
+    from PyPDF2 import PdfReader
     try:
-        doc = Document(io.BytesIO(file_content))
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        with open_source(source) as f:
+            return len(PdfReader(f).pages)
+    except Exception as e:
+        raise Exception(f"Error extracting PDF: {str(e)}")
+
+
+def extract_pdf_pages(source, start: int, end: int):
+    """Extract a page range in one go (unit of work for the parse process pool)"""
+    return list(iter_pdf_pages(source, start, end))
+
+
+def iter_docx_paragraphs(source):
+    """Yield (None, text) per DOCX paragraph (DOCX has no fixed pages)"""
+    from docx import Document
+    try:
+        with open_source(source) as f:
+            doc = Document(f)
+            for paragraph in doc.paragraphs:
+                yield None, paragraph.text + "\n"
     except Exception as e:
         raise Exception(f"Error extracting DOCX: {str(e)}")
 
-def extract_text_from_txt(file_content: bytes) -> str:
-    """Extract text from TXT file"""
+
+def _txt_encoding(f) -> str:
+    """utf-8 if the whole file decodes as utf-8, latin-1 otherwise (validated block by block)"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
     try:
-        return file_content.decode('utf-8')
+        while True:
+            block = f.read(TXT_SEGMENT_BYTES)
+            if not block:
+                break
+            decoder.decode(block)
+        decoder.decode(b"", final=True)
+        return 'utf-8'
     except UnicodeDecodeError:
-        try:
-            return file_content.decode('latin-1')
-        except Exception as e:
-            raise Exception(f"Error decoding text file: {str(e)}")
\ No newline at end of file
+        return 'latin-1'
+    finally:
+        f.seek(0)
+
+
+def iter_txt_segments(source):
+    """Yield (None, text) in ~64KB segments of a TXT file"""
+    try:
+        with open_source(source) as f:
+            decoder = codecs.getincrementaldecoder(_txt_encoding(f))()
+            while True:
+                block = f.read(TXT_SEGMENT_BYTES)
+                if not block:
+                    break
+                text = decoder.decode(block)
+                if text:
+                    yield None, text
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield None, tail
+    except Exception as e:
+        raise Exception(f"Error decoding text file: {str(e)}")
+
+
+def extract_segments(filename: str, source):
+    """Extract all (page, text) segments of a DOCX or TXT file"""
+    if filename.lower().endswith('.docx'):
+        return list(iter_docx_paragraphs(source))
+    return list(iter_txt_segments(source))
+
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+
+def is_supported_file(filename: str) -> bool:
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith('.zip')
+
+
+def expand_archive(
+    filename: str,
+    source,
+    max_member_bytes: int,
+    max_members: int,
+    tmp_dir: str = None,
+    max_total_bytes: int = None
+):
+    """
+    Unpack a zip archive into (member_name, temp_path | None, error | None)
+    entries. Members are streamed to temp files (the caller deletes them);
+    oversized or unsupported members are reported instead of extracted.
+    The whole archive fails once its members decompress to more than
+    `max_total_bytes` together.
+    """
+    entries = []
+    remaining = max_total_bytes
+    try:
+        with open_source(source) as f, zipfile.ZipFile(f) as archive:
+            for info in archive.infolist():
+                name = info.filename
+                base = os.path.basename(name)
+                if info.is_dir() or not base or name.startswith('__MACOSX/') or base.startswith('.'):
+                    continue
+                if len(entries) >= max_members:
+                    raise ValueError(f"Archive has more than {max_members} files")
+
+                member = f"{filename}/{name}"
+                if not is_supported_file(base):
+                    entries.append((member, None, "Unsupported file type"))
+                elif info.file_size > max_member_bytes:
+                    entries.append((member, None, "File too large"))
+                else:
+                    limit = max_member_bytes if remaining is None else min(max_member_bytes, remaining)
+                    if info.file_size > limit:
+                        raise ValueError(f"Archive expands to more than {max_total_bytes // (1024 * 1024)} MB")
+                    path = _extract_member(archive, info, limit, tmp_dir)
+                    entries.append((member, path, None))
+                    if remaining is not None:
+                        remaining -= os.path.getsize(path)
+    except zipfile.BadZipFile as e:
+        _remove_entries(entries)
+        raise Exception(f"Error reading archive: {str(e)}")
+    except Exception:
+        _remove_entries(entries)
+        raise
+    return entries
+
+
+def _extract_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int, tmp_dir: str = None) -> str:
+    # Don't trust the declared size: count what is actually decompressed
+    suffix = os.path.splitext(info.filename)[1].lower()
+    tmp = tempfile.NamedTemporaryFile(prefix="upload-", suffix=suffix, dir=tmp_dir, delete=False)
+    size = 0
+    try:
+        with tmp, archive.open(info) as member:
+            while True:
+                block = member.read(1024 * 1024)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise ValueError(f"Archive member too large or archive over its size budget: {info.filename}")
+                tmp.write(block)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    return tmp.name
+
+
+def _remove_entries(entries):
+    for _, path, _ in entries:
+        if path:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
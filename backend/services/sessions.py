@@ -0,0 +1,178 @@
+# services/sessions.py
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from services.prompt_builder import count_tokens, summary_line
+
+# Sessions kept in memory across all users; least recently used are evicted first
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+# Sessions per user; creating one more evicts that user's least recently used
+SESSION_MAX_PER_USER = int(os.getenv("SESSION_MAX_PER_USER", "50"))
+# Idle sessions expire after this many seconds
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+# Turns (user and assistant messages) held verbatim per session; older
+# turns are folded into the session's rolling summary
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "100"))
+# Summary lines kept for turns folded out of a session
+SESSION_SUMMARY_LINES = int(os.getenv("SESSION_SUMMARY_LINES", "50"))
+
+
+class Session:
+    """
+    One conversation held on the server.
+
+    Turns are stored with their token counts, computed once when the turn
+    is added. When a session holds more than SESSION_MAX_TURNS turns, the
+    oldest are folded into `summary` (one extractive line per turn).
+    `history_key` is a rolling digest of every turn, used to key the answer
+    cache without rehashing the whole conversation on each request.
+    """
+
+    def __init__(self, user: str):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.turns = deque()  # (role, content, tokens)
+        self.summary = deque(maxlen=SESSION_SUMMARY_LINES)
+        self.summarized_turns = 0
+        self.history_key = ""
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def add_turn(self, role: str, content: str):
+        self.turns.append((role, content, count_tokens(content)))
+        self.history_key = hashlib.sha256(
+            f"{self.history_key}\0{role}\0{content}".encode("utf-8")
+        ).hexdigest()
+        while len(self.turns) > SESSION_MAX_TURNS:
+            old_role, old_content, _ = self.turns.popleft()
+            self.summary.append(summary_line(old_role, old_content))
+            self.summarized_turns += 1
+        self.updated_at = time.time()
+
+    def history(self):
+        return [(role, content) for role, content, _ in self.turns]
+
+    def history_tokens(self) -> List[int]:
+        return [tokens for _, _, tokens in self.turns]
+
+    def info(self, include_turns: bool = False) -> dict:
+        info = {
+            "session_id": self.id,
+            "turns": len(self.turns),
+            "summarized_turns": self.summarized_turns,
+            "tokens": sum(tokens for _, _, tokens in self.turns),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+        if include_turns:
+            info["summary"] = list(self.summary)
+            info["messages"] = [{"role": role, "content": content} for role, content, _ in self.turns]
+        return info
+
+
+class SessionStore:
+    """
+    Bounded in-memory store of conversation sessions.
+
+    Sessions belong to the user who created them; looking up another user's
+    session behaves as if it didn't exist. Eviction is LRU, bounded by
+    `max_sessions` overall and `max_per_user` per user, and idle sessions
+    expire after `ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        max_per_user: int = SESSION_MAX_PER_USER,
+        ttl_seconds: float = SESSION_TTL_SECONDS
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.max_per_user = max(1, max_per_user)
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._sessions = OrderedDict()  # session id -> (expires_at, Session), in LRU order
+        self._by_user = {}  # user -> OrderedDict of session ids, in LRU order
+        self._lock = threading.Lock()
+
+    def create(self, user: str) -> Session:
+        session = Session(user)
+        with self._lock:
+            self._expire()
+            user_sessions = self._by_user.get(user, ())
+            while len(user_sessions) >= self.max_per_user:
+                self._remove(next(iter(user_sessions)))
+                self.evictions += 1
+            # Evicting the user's last session drops their entry, so look it up again
+            user_sessions = self._by_user.setdefault(user, OrderedDict())
+            self._sessions[session.id] = (time.monotonic() + self.ttl_seconds, session)
+            user_sessions[session.id] = None
+            while len(self._sessions) > self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+                self.evictions += 1
+        return session
+
+    def get(self, user: str, session_id: str) -> Session:
+        """The user's session, refreshing its TTL; 404 if it's unknown, expired or someone else's"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(session_id)
+                entry = None
+            if entry is None or entry[1].user != user:
+                raise HTTPException(status_code=404, detail="Session not found")
+            session = entry[1]
+            self._sessions[session_id] = (time.monotonic() + self.ttl_seconds, session)
+            self._sessions.move_to_end(session_id)
+            self._by_user[user].move_to_end(session_id)
+            return session
+
+    def list(self, user: str) -> List[Session]:
+        with self._lock:
+            self._expire()
+            return [self._sessions[session_id][1] for session_id in reversed(self._by_user.get(user, ()))]
+
+    def delete(self, user: str, session_id: str):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[1].user != user:
+                raise HTTPException(status_code=404, detail="Session not found")
+            self._remove(session_id)
+
+    def _expire(self):
+        now = time.monotonic()
+        # TTLs are refreshed on access, so expired sessions sit at the LRU end
+        while self._sessions:
+            session_id, (expires_at, _) = next(iter(self._sessions.items()))
+            if expires_at >= now:
+                break
+            self._remove(session_id)
+
+    def _remove(self, session_id: str):
+        _, session = self._sessions.pop(session_id)
+        user_sessions = self._by_user[session.user]
+        del user_sessions[session_id]
+        if not user_sessions:
+            del self._by_user[session.user]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "users": len(self._by_user),
+                "max_sessions": self.max_sessions,
+                "evictions": self.evictions
+            }
+
+
+def get_session(request, user: Optional[str], session_id: str) -> Session:
+    """Resolve a chat request's session; sessions require an authenticated user"""
+    if user is None:
+        raise HTTPException(status_code=401, detail="Sessions require an authenticated user")
+    return request.app.state.sessions.get(user, session_id)
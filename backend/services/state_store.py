@@ -0,0 +1,367 @@
+# services/state_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from services.executors import run_in_pool
+
+try:
+    import redis
+except ImportError:  # optional: only needed for STATE_BACKEND=redis
+    redis = None
+
+# Where users, revoked tokens and the document registry live:
+# - "memory" (default): per-process dicts; fine for a single worker
+# - "sqlite": one SQLite file (WAL) shared by every worker on the host
+# - "redis": a Redis server shared by workers on any number of hosts
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+STATE_PATH = os.getenv("STATE_PATH", "./state/state.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "youassist")
+# How often each worker checks for registry changes made by other workers
+STATE_SYNC_INTERVAL = float(os.getenv("STATE_SYNC_INTERVAL", "1.0"))
+
+
+class StateStore:
+    """
+    Small key-value store for state every worker must agree on, split into
+    namespaces ("users", "revoked_tokens", "documents"). Values are JSON.
+    Each namespace has a version number that every write bumps, so readers
+    can keep an in-process copy and reload it only when it has changed.
+    """
+
+    name = "base"
+    shared = False  # True when other processes see the same data
+
+    def get(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    def put(self, namespace: str, key: str, value, ttl: Optional[float] = None) -> int:
+        """Store a value (expiring after `ttl` seconds if given); returns the new namespace version"""
+        raise NotImplementedError
+
+    def insert(self, namespace: str, key: str, value) -> bool:
+        """Store a value only if the key is absent; False if it already exists"""
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> int:
+        raise NotImplementedError
+
+    def clear(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def items(self, namespace: str) -> Dict[str, object]:
+        raise NotImplementedError
+
+    def version(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def namespaces(self, prefix: str) -> List[str]:
+        """Namespaces starting with `prefix` that hold any entries"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """Per-process dicts: the single-worker default"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data = {}  # namespace -> {key: (expires_at | None, value)}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _bump(self, namespace):
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+        return self._versions[namespace]
+
+    def get(self, namespace, key):
+        entry = self._data.get(namespace, {}).get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return value
+
+    def put(self, namespace, key, value, ttl=None):
+        with self._lock:
+            data = self._data.setdefault(namespace, {})
+            if ttl is not None:
+                # Expired entries are dropped as new ones with a TTL come in
+                now = time.time()
+                for stale in [k for k, (expires_at, _) in data.items() if expires_at is not None and expires_at < now]:
+                    del data[stale]
+            data[key] = (time.time() + ttl if ttl is not None else None, value)
+            return self._bump(namespace)
+
+    def insert(self, namespace, key, value):
+        with self._lock:
+            data = self._data.setdefault(namespace, {})
+            if key in data:
+                return False
+            data[key] = (None, value)
+            self._bump(namespace)
+            return True
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.get(namespace, {}).pop(key, None)
+            return self._bump(namespace)
+
+    def clear(self, namespace):
+        with self._lock:
+            self._data.pop(namespace, None)
+            return self._bump(namespace)
+
+    def items(self, namespace):
+        now = time.time()
+        return {
+            key: value
+            for key, (expires_at, value) in list(self._data.get(namespace, {}).items())
+            if expires_at is None or expires_at >= now
+        }
+
+    def version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def namespaces(self, prefix):
+        with self._lock:
+            return [namespace for namespace, data in self._data.items() if data and namespace.startswith(prefix)]
+
+
+class SQLiteStateStore(StateStore):
+    """
+    One SQLite file shared by all workers on a host. WAL mode lets readers
+    run alongside a writer; each thread keeps its own open connection, so a
+    call costs one indexed query rather than a connect.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        with self._write() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS versions (namespace TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Autocommit; writes open their own transaction in _write()
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def _write(self):
+        return _Transaction(self._connection())
+
+    @staticmethod
+    def _bump(db, namespace) -> int:
+        db.execute(
+            "INSERT INTO versions (namespace, version) VALUES (?, 1) "
+            "ON CONFLICT(namespace) DO UPDATE SET version = version + 1",
+            (namespace,)
+        )
+        return db.execute("SELECT version FROM versions WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def get(self, namespace, key):
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, namespace, key, value, ttl=None):
+        with self._write() as db:
+            if ttl is not None:
+                db.execute("DELETE FROM kv WHERE namespace = ? AND expires_at < ?", (namespace, time.time()))
+            db.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time() + ttl if ttl is not None else None)
+            )
+            return self._bump(db, namespace)
+
+    def insert(self, namespace, key, value):
+        with self._write() as db:
+            inserted = db.execute(
+                "INSERT OR IGNORE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                (namespace, key, json.dumps(value))
+            ).rowcount
+            if inserted:
+                self._bump(db, namespace)
+            return bool(inserted)
+
+    def delete(self, namespace, key):
+        with self._write() as db:
+            db.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+            return self._bump(db, namespace)
+
+    def clear(self, namespace):
+        with self._write() as db:
+            db.execute("DELETE FROM kv WHERE namespace = ?", (namespace,))
+            return self._bump(db, namespace)
+
+    def items(self, namespace):
+        rows = self._connection().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (namespace, time.time())
+        )
+        return {key: json.loads(value) for key, value in rows}
+
+    def version(self, namespace):
+        row = self._connection().execute("SELECT version FROM versions WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def namespaces(self, prefix):
+        rows = self._connection().execute(
+            "SELECT DISTINCT namespace FROM kv WHERE substr(namespace, 1, ?) = ?", (len(prefix), prefix)
+        )
+        return [namespace for namespace, in rows]
+
+    def close(self):
+        with self._lock:
+            for db in self._connections:
+                db.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error) on one connection"""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, *exc):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class RedisStateStore(StateStore):
+    """
+    Redis backend for workers spread over several hosts. Each namespace is
+    a hash; values with a TTL are plain keys so Redis can expire them.
+    redis-py pools its connections.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_PREFIX):
+        if redis is None:
+            raise RuntimeError("STATE_BACKEND=redis needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _hash(self, namespace):
+        return f"{self.prefix}:{namespace}"
+
+    def _expiring(self, namespace, key):
+        return f"{self.prefix}:{namespace}:ttl:{key}"
+
+    def _version_key(self, namespace):
+        return f"{self.prefix}:version:{namespace}"
+
+    def get(self, namespace, key):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hget(self._hash(namespace), key)
+        pipe.get(self._expiring(namespace, key))
+        value, expiring = pipe.execute()
+        value = value if value is not None else expiring
+        return json.loads(value) if value is not None else None
+
+    def put(self, namespace, key, value, ttl=None):
+        pipe = self.client.pipeline()
+        if ttl is not None:
+            pipe.set(self._expiring(namespace, key), json.dumps(value), px=max(1, int(ttl * 1000)))
+        else:
+            pipe.hset(self._hash(namespace), key, json.dumps(value))
+        pipe.incr(self._version_key(namespace))
+        return pipe.execute()[-1]
+
+    def insert(self, namespace, key, value):
+        if not self.client.hsetnx(self._hash(namespace), key, json.dumps(value)):
+            return False
+        self.client.incr(self._version_key(namespace))
+        return True
+
+    def delete(self, namespace, key):
+        pipe = self.client.pipeline()
+        pipe.hdel(self._hash(namespace), key)
+        pipe.delete(self._expiring(namespace, key))
+        pipe.incr(self._version_key(namespace))
+        return pipe.execute()[-1]
+
+    def clear(self, namespace):
+        pipe = self.client.pipeline()
+        pipe.delete(self._hash(namespace))
+        pipe.incr(self._version_key(namespace))
+        return pipe.execute()[-1]
+
+    def items(self, namespace):
+        # Only namespaces without TTLs are listed (the document registry)
+        return {key.decode(): json.loads(value) for key, value in self.client.hgetall(self._hash(namespace)).items()}
+
+    def version(self, namespace):
+        return int(self.client.get(self._version_key(namespace)) or 0)
+
+    def namespaces(self, prefix):
+        # Namespaces are hashes; values with a TTL and versions are plain keys
+        start = len(self.prefix) + 1
+        return [key.decode()[start:] for key in self.client.scan_iter(match=f"{self.prefix}:{prefix}*", _type="hash")]
+
+    def close(self):
+        self.client.close()
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+async def run_state_io(fn, *args, **kwargs):
+    """
+    Call into the state store from async code: on the "state" pool when the
+    store is shared (a SQLite write can wait on other workers' locks, a
+    Redis call is a network round trip), inline for the in-memory store.
+    """
+    if not get_state_store().shared:
+        return fn(*args, **kwargs)
+    return await run_in_pool("state", fn, *args, **kwargs)
+
+
+def get_state_store() -> StateStore:
+    """The process-wide state store for STATE_BACKEND, opened on first use"""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            if STATE_BACKEND == "sqlite":
+                _state_store = SQLiteStateStore()
+            elif STATE_BACKEND == "redis":
+                _state_store = RedisStateStore()
+            else:
+                _state_store = MemoryStateStore()
+        return _state_store
@@ -0,0 +1,99 @@
+# services/uploads.py
+import hashlib
+import os
+import tempfile
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+# Total size of one batch upload request, across all its files
+MAX_BATCH_UPLOAD_MB = int(os.getenv("MAX_BATCH_UPLOAD_MB", "1024"))
+MAX_BATCH_UPLOAD_BYTES = MAX_BATCH_UPLOAD_MB * 1024 * 1024
+# Total bytes one zip archive may decompress to, across all its members
+MAX_ARCHIVE_EXPANDED_MB = int(os.getenv("MAX_ARCHIVE_EXPANDED_MB", "1024"))
+MAX_ARCHIVE_EXPANDED_BYTES = MAX_ARCHIVE_EXPANDED_MB * 1024 * 1024
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+UPLOAD_READ_CHUNK = 1024 * 1024
+
+
+class SpooledUpload:
+    """
+    An uploaded file copied to a private temp file on disk.
+
+    Extractors read it by path, so the content is never held in memory as
+    a whole and can outlive the request (background ingestion jobs).
+    Call `cleanup()` once it has been ingested. `content_hash` is the
+    sha256 of the file, computed while it was written.
+    """
+
+    def __init__(self, filename: str, path: str, size: int, content_hash: str = None):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.content_hash = content_hash
+
+    def cleanup(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _temp_file(filename: str):
+    suffix = os.path.splitext(filename or "")[1].lower()
+    return tempfile.NamedTemporaryFile(prefix="upload-", suffix=suffix, dir=UPLOAD_TMP_DIR, delete=False)
+
+
+def too_large_error() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"File too large. Maximum size is {MAX_UPLOAD_MB}MB."
+    )
+
+
+def batch_too_large_error() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"Upload too large. Maximum total size is {MAX_BATCH_UPLOAD_MB}MB."
+    )
+
+
+def _copy_upload(file: UploadFile, max_bytes: int) -> SpooledUpload:
+    source = file.file
+    source.seek(0)
+    tmp = _temp_file(file.filename)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with tmp:
+            while True:
+                data = source.read(UPLOAD_READ_CHUNK)
+                if not data:
+                    break
+                size += len(data)
+                if size > max_bytes:
+                    raise too_large_error()
+                digest.update(data)
+                tmp.write(data)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    return SpooledUpload(file.filename, tmp.name, size, digest.hexdigest())
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """
+    Copy an upload to a named temp file in 1MB pieces, hashing it on the way.
+
+    Starlette has already spooled the part to an anonymous temp file
+    (`file.file`), but extraction needs a path: the parse workers are
+    separate processes, and background jobs read the file after the request
+    has ended and Starlette has closed its own. The copy is read straight
+    from `file.file` in one worker thread. Files Starlette measured as
+    larger than `max_bytes` are rejected before anything is copied.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise too_large_error()
+    return await run_in_threadpool(_copy_upload, file, max_bytes)
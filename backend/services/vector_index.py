@@ -0,0 +1,271 @@
+# services/vector_index.py
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Storage precision of the index. Scores are always computed in float32.
+# - float32: exact cosine similarity, 4 bytes per dimension
+# - float16: half the memory, scores within ~1e-3 of exact, same ranking in practice
+# - int8: a quarter of the memory (+4 bytes per row for the scale), scores
+#   within ~1e-2 of exact; near-ties can swap, so recall@10 drops slightly
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32").lower()
+# Rows scored per matrix product; bounds the temporary memory of a search
+VECTOR_INDEX_BLOCK_ROWS = int(os.getenv("VECTOR_INDEX_BLOCK_ROWS", "16384"))
+# Compact the matrix once this share of its rows has been deleted
+VECTOR_INDEX_COMPACT_RATIO = float(os.getenv("VECTOR_INDEX_COMPACT_RATIO", "0.25"))
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _write_durably(path: str, write):
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class VectorIndex:
+    """
+    Exact cosine similarity index over one contiguous matrix.
+
+    Vectors are normalized on insert and stored row by row in a matrix that
+    grows by doubling, optionally quantized to float16 or int8 (symmetric,
+    one float32 scale per row). A search scores a whole batch of queries
+    with one matrix product per block of VECTOR_INDEX_BLOCK_ROWS rows and
+    keeps the top k of each block with `argpartition`, so no full sort is
+    ever done. Deletes mark rows as dead; the matrix is compacted once more
+    than VECTOR_INDEX_COMPACT_RATIO of the rows are dead.
+
+    `save()` writes the index to a directory; `load(..., mmap=True)` maps
+    the matrix from disk instead of reading it, and it's copied into
+    memory on the first write.
+    """
+
+    def __init__(self, dim: Optional[int] = None, dtype: str = VECTOR_INDEX_DTYPE):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector index dtype '{dtype}'. Use one of {', '.join(DTYPES)}.")
+        self.dtype = dtype
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._matrix = None  # (capacity, dim) in self.dtype
+        self._scales = None  # (capacity,) float32, int8 only
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_ids: List[Optional[str]] = []  # row -> id
+        self._rows: Dict[str, int] = {}  # id -> row
+        self._size = 0  # rows in use, dead ones included
+        self._mapped = False
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    @property
+    def nbytes(self) -> int:
+        if self._matrix is None:
+            return 0
+        return self._matrix[:self._size].nbytes + (self._scales[:self._size].nbytes if self._scales is not None else 0)
+
+    def _encode(self, vectors: np.ndarray):
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(DTYPES[self.dtype]), None
+
+    def _reserve(self, rows: int):
+        capacity = 0 if self._matrix is None else len(self._matrix)
+        if rows <= capacity and not self._mapped:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        matrix = np.zeros((new_capacity, self.dim), dtype=DTYPES[self.dtype])
+        alive = np.zeros(new_capacity, dtype=bool)
+        scales = np.ones(new_capacity, dtype=np.float32) if self.dtype == "int8" else None
+        if self._matrix is not None:
+            matrix[:self._size] = self._matrix[:self._size]
+            alive[:self._size] = self._alive[:self._size]
+            if scales is not None:
+                scales[:self._size] = self._scales[:self._size]
+        self._matrix, self._alive, self._scales = matrix, alive, scales
+        self._mapped = False
+
+    def add(self, ids: Iterable[str], vectors):
+        """Insert (or replace) vectors under the given ids"""
+        ids = list(ids)
+        if not ids:
+            return
+        vectors = _normalize(vectors)
+        if len(vectors) != len(ids):
+            raise ValueError("ids and vectors must have the same length")
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            self._delete(item_id for item_id in ids if item_id in self._rows)
+
+            start = self._size
+            self._reserve(start + len(ids))
+            encoded, scales = self._encode(vectors)
+            self._matrix[start:start + len(ids)] = encoded
+            if scales is not None:
+                self._scales[start:start + len(ids)] = scales
+            self._alive[start:start + len(ids)] = True
+            self._row_ids.extend(ids)
+            self._rows.update(zip(ids, range(start, start + len(ids))))
+            self._size += len(ids)
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            self._delete(ids)
+            dead = self._size - len(self._rows)
+            if dead and dead > VECTOR_INDEX_COMPACT_RATIO * self._size:
+                self.compact()
+
+    def _delete(self, ids: Iterable[str]):
+        rows = [self._rows.pop(item_id) for item_id in list(ids) if item_id in self._rows]
+        if rows:
+            self._alive[rows] = False
+            for row in rows:
+                self._row_ids[row] = None
+
+    def compact(self):
+        """Drop dead rows, keeping the live ones in insertion order"""
+        with self._lock:
+            if self._matrix is None:
+                return
+            keep = np.flatnonzero(self._alive[:self._size])
+            self._matrix = np.ascontiguousarray(self._matrix[keep])
+            if self._scales is not None:
+                self._scales = self._scales[keep]
+            self._alive = np.ones(len(keep), dtype=bool)
+            self._row_ids = [self._row_ids[row] for row in keep]
+            self._rows = {item_id: row for row, item_id in enumerate(self._row_ids)}
+            self._size = len(keep)
+            self._mapped = False
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def search(self, queries, k: int, ids: Optional[Iterable[str]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Top `k` (id, cosine similarity) pairs for each query, best first.
+        `queries` is one vector or a (n_queries, dim) matrix. Passing `ids`
+        restricts the search to those vectors (e.g. a metadata filter).
+        """
+        queries = _normalize(queries)
+        with self._lock:
+            if not self._rows or k <= 0:
+                return [[] for _ in range(len(queries))]
+            if ids is not None:
+                return self._search_rows(queries, k, [self._rows[i] for i in ids if i in self._rows])
+            k = min(k, len(self._rows))
+            best_rows = []
+            best_scores = []
+            for start in range(0, self._size, VECTOR_INDEX_BLOCK_ROWS):
+                end = min(start + VECTOR_INDEX_BLOCK_ROWS, self._size)
+                block = self._matrix[start:end]
+                if block.dtype != np.float32:
+                    block = block.astype(np.float32)
+                scores = queries @ block.T  # (n_queries, block rows)
+                if self._scales is not None:
+                    scores *= self._scales[start:end]
+                scores[:, ~self._alive[start:end]] = -np.inf
+                if scores.shape[1] > k:
+                    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                else:
+                    top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+                best_rows.append(top + start)
+                best_scores.append(np.take_along_axis(scores, top, axis=1))
+
+            # Merge the per-block winners and sort only those
+            rows = np.concatenate(best_rows, axis=1)
+            scores = np.concatenate(best_scores, axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                rows = np.take_along_axis(rows, top, axis=1)
+                scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-scores, axis=1, kind="stable")
+            rows = np.take_along_axis(rows, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+
+            return [
+                [
+                    (self._row_ids[row], float(score))
+                    for row, score in zip(query_rows, query_scores)
+                    if score != -np.inf
+                ]
+                for query_rows, query_scores in zip(rows.tolist(), scores.tolist())
+            ]
+
+    def _search_rows(self, queries: np.ndarray, k: int, rows: List[int]) -> List[List[Tuple[str, float]]]:
+        if not rows:
+            return [[] for _ in range(len(queries))]
+        rows = np.asarray(rows)
+        block = self._matrix[rows].astype(np.float32)
+        scores = queries @ block.T
+        if self._scales is not None:
+            scores *= self._scales[rows]
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return [
+            [(self._row_ids[rows[i]], float(query_scores[i])) for i in query_order]
+            for query_order, query_scores in zip(order, scores)
+        ]
+
+    def get(self, ids: Iterable[str]) -> np.ndarray:
+        """Stored (normalized, dequantized) vectors for ids, in order"""
+        with self._lock:
+            rows = [self._rows[item_id] for item_id in ids]
+            vectors = self._matrix[rows].astype(np.float32)
+            if self._scales is not None:
+                vectors *= self._scales[rows][:, None]
+            return vectors
+
+    def save(self, path: str):
+        """
+        Write the live rows to `path` (a directory) as .npy files plus an id
+        list, fsynced. Files are written in place, so replace a saved index
+        by saving to a new directory (as LocalVectorStore does).
+        """
+        with self._lock:
+            self.compact()
+            os.makedirs(path, exist_ok=True)
+            matrix = self._matrix if self._matrix is not None else np.zeros((0, self.dim or 0), DTYPES[self.dtype])
+            _write_durably(os.path.join(path, "vectors.npy"), lambda f: np.save(f, matrix[:self._size]))
+            if self._scales is not None:
+                _write_durably(os.path.join(path, "scales.npy"), lambda f: np.save(f, self._scales[:self._size]))
+            meta = json.dumps({"dtype": self.dtype, "dim": self.dim, "ids": self._row_ids}).encode("utf-8")
+            _write_durably(os.path.join(path, "ids.json"), lambda f: f.write(meta))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "VectorIndex":
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(dim=meta["dim"], dtype=meta["dtype"])
+        mode = "r" if mmap else None
+        matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        if len(matrix):
+            index._matrix = matrix
+            if index.dtype == "int8":
+                index._scales = np.load(os.path.join(path, "scales.npy"), mmap_mode=mode)
+            index._alive = np.ones(len(matrix), dtype=bool)
+            index._row_ids = list(meta["ids"])
+            index._rows = {item_id: row for row, item_id in enumerate(index._row_ids)}
+            index._size = len(matrix)
+            index._mapped = mmap
+        return index
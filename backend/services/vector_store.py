@@ -0,0 +1,545 @@
+# services/vector_store.py
+import base64
+import json
+import os
+import shutil
+import threading
+import uuid
+from itertools import islice
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from chromadb import errors as chroma_errors
+
+from services.executors import run_in_pool
+from services.vector_index import VectorIndex, VECTOR_INDEX_DTYPE
+
+# "chroma" (default) or "local" (in-process VectorIndex, no Chroma)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+# Largest number of chunks embedded and written per call
+VECTOR_STORE_BATCH_SIZE = int(os.getenv("VECTOR_STORE_BATCH_SIZE", "256"))
+# Local backend with a path: the change journal is folded into a new
+# snapshot once it grows past this size
+LOCAL_INDEX_JOURNAL_MB = int(os.getenv("LOCAL_INDEX_JOURNAL_MB", "256"))
+
+# What Chroma raises for a collection that no longer exists: NotFoundError
+# from 1.0 on, InvalidCollectionException before (NotFoundError is missing
+# before 0.5.7)
+COLLECTION_NOT_FOUND = tuple(
+    getattr(chroma_errors, name)
+    for name in ("NotFoundError", "InvalidCollectionException")
+    if hasattr(chroma_errors, name)
+)
+
+
+def _empty_result(include: Sequence[str]) -> dict:
+    return {"ids": [], **{field: [] for field in include}}
+
+
+def _fsync_dir(path: str):
+    """Make renames and new files in a directory durable (a no-op where directories can't be opened)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """
+    Evaluate a Chroma-style metadata filter: {"key": value},
+    {"key": {"$eq" | "$ne" | "$in" | "$nin" | "$gt" | "$gte" | "$lt" | "$lte": value}},
+    {"$and": [...]} and {"$or": [...]}.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, expected in condition.items():
+                if op == "$eq":
+                    ok = value == expected
+                elif op == "$ne":
+                    ok = value != expected
+                elif op == "$in":
+                    ok = value in expected
+                elif op == "$nin":
+                    ok = value not in expected
+                elif op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    ok = {
+                        "$gt": value > expected,
+                        "$gte": value >= expected,
+                        "$lt": value < expected,
+                        "$lte": value <= expected
+                    }[op]
+                else:
+                    raise ValueError(f"Unsupported filter operator '{op}'")
+                if not ok:
+                    return False
+    return True
+
+
+class VectorStore:
+    """
+    Async interface the routes and services use to store and search chunks.
+
+    Results follow Chroma's shapes, flattened per query: `query` returns one
+    {"ids", "documents", "metadatas", "distances"} dict per query embedding
+    (cosine distances), and `get` returns {"ids", <included fields>}.
+    Filters (`where`) use Chroma's metadata filter syntax. Backends run
+    their blocking work in the executor pools and batch it their own way.
+    """
+
+    name = "base"
+    max_batch_size = VECTOR_STORE_BATCH_SIZE
+
+    async def add(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings=None):
+        """Store chunks; without `embeddings` the store embeds the documents itself"""
+        raise NotImplementedError
+
+    async def query(self, query_embeddings, n_results: int, where: Optional[dict] = None) -> List[dict]:
+        raise NotImplementedError
+
+    async def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[dict] = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> dict:
+        raise NotImplementedError
+
+    async def update(self, ids: List[str], metadatas: List[dict]):
+        raise NotImplementedError
+
+    async def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None):
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def reset(self):
+        """Remove every chunk, in constant time (the collection or index is dropped and recreated)"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ChromaVectorStore(VectorStore):
+    """
+    Chroma collection backend; the collection embeds documents with its
+    embedding function. `reset()` drops and recreates the collection; a
+    handle left stale by a reset (in another worker too) is reopened on
+    its next use.
+    """
+
+    name = "chroma"
+
+    def __init__(self, client, collection_name: str, embedding_function, metadata: dict = None):
+        self.client = client
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.collection_metadata = metadata
+        self.collection = self._open_collection()
+        try:
+            self.max_batch_size = max(1, min(VECTOR_STORE_BATCH_SIZE, client.get_max_batch_size()))
+        except Exception:
+            self.max_batch_size = VECTOR_STORE_BATCH_SIZE
+
+    def _open_collection(self):
+        return self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata=self.collection_metadata,
+            embedding_function=self.embedding_function
+        )
+
+    def _call(self, method: str, **kwargs):
+        try:
+            return getattr(self.collection, method)(**kwargs)
+        except COLLECTION_NOT_FOUND:
+            # The collection was reset since this handle was opened
+            self.collection = self._open_collection()
+            return getattr(self.collection, method)(**kwargs)
+
+    async def add(self, ids, documents, metadatas, embeddings=None):
+        # Without embeddings, collection.add runs the model, so it goes to the embedding pool
+        pool = "embedding" if embeddings is None else "vector"
+        for start in range(0, len(ids), self.max_batch_size):
+            end = start + self.max_batch_size
+            batch = {} if embeddings is None else {"embeddings": [np.asarray(e, dtype=np.float32) for e in embeddings[start:end]]}
+            await run_in_pool(
+                pool,
+                self._call,
+                "add",
+                ids=ids[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end],
+                **batch
+            )
+
+    async def query(self, query_embeddings, n_results, where=None):
+        # All queries go to Chroma in a single call
+        raw = await run_in_pool(
+            "vector",
+            self._call,
+            "query",
+            query_embeddings=[np.asarray(e, dtype=np.float32) for e in query_embeddings],
+            n_results=n_results,
+            where=where or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            {
+                "ids": raw["ids"][i],
+                "documents": raw["documents"][i] if raw.get("documents") else [],
+                "metadatas": raw["metadatas"][i] if raw.get("metadatas") else [],
+                "distances": raw["distances"][i] if raw.get("distances") else []
+            }
+            for i in range(len(raw["ids"]))
+        ]
+
+    async def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        raw = await run_in_pool(
+            "vector",
+            self._call,
+            "get",
+            ids=ids,
+            where=where or None,
+            include=list(include),
+            limit=limit,
+            offset=offset or None
+        )
+        result = {"ids": raw["ids"]}
+        for field in include:
+            values = raw.get(field)
+            result[field] = list(values) if values is not None else []
+        return result
+
+    async def update(self, ids, metadatas):
+        await run_in_pool("vector", self._call, "update", ids=ids, metadatas=metadatas)
+
+    async def delete(self, ids=None, where=None):
+        if ids is not None:
+            for start in range(0, len(ids), self.max_batch_size):
+                await run_in_pool("vector", self._call, "delete", ids=ids[start:start + self.max_batch_size])
+        elif where:
+            await run_in_pool("vector", self._call, "delete", where=where)
+
+    async def count(self):
+        return await run_in_pool("vector", self._call, "count")
+
+    async def reset(self):
+        def recreate():
+            try:
+                self.client.delete_collection(self.collection_name)
+            except (*COLLECTION_NOT_FOUND, ValueError):
+                pass  # another worker dropped it first (releases before 1.0 raise ValueError)
+            self.collection = self._open_collection()
+        await run_in_pool("vector", recreate)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process backend on a VectorIndex.
+
+    Chunks are embedded with the shared embedding function in batches of
+    `max_batch_size` and written to the index in one insert per batch;
+    queries for several embeddings are scored in one matrix product.
+    Filters on `document_id` use a per-document id index, other filters
+    scan the metadata.
+
+    With a path, the store is loaded from its current snapshot there
+    (memory-mapped). Every add, update, delete and reset is also appended
+    to the snapshot's journal and fsynced as it happens, so a crash or power
+    loss loses nothing already acknowledged: the journal is replayed on the
+    next start. `close()`, or a journal grown past LOCAL_INDEX_JOURNAL_MB,
+    writes a new snapshot with an empty journal to a directory of its own
+    and then points `manifest.json` at it; replacing the manifest is the
+    commit point, so a crash part way through leaves the previous snapshot
+    and its journal in use.
+    """
+
+    name = "local"
+
+    def __init__(self, embedding_function, path: Optional[str] = None, dtype: str = VECTOR_INDEX_DTYPE):
+        self.embedding_function = embedding_function
+        self.path = path
+        self._lock = threading.RLock()
+        self.index = VectorIndex(dtype=dtype)
+        self._documents: Dict[str, str] = {}
+        self._metadatas: Dict[str, dict] = {}
+        self._by_document: Dict[str, set] = {}
+        self._journal = None
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._snapshot_dir = self._current_snapshot()
+            if os.path.exists(os.path.join(self._snapshot_dir, "chunks.jsonl")):
+                self._load()
+            self._replay()
+            self._remove_stale_snapshots()
+            self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    @property
+    def _journal_path(self) -> str:
+        return os.path.join(self._snapshot_dir, "journal.jsonl")
+
+    def _current_snapshot(self) -> str:
+        """Directory of the snapshot the manifest points at (the path itself for stores written without one)"""
+        if not os.path.exists(self._manifest_path):
+            return self.path
+        with open(self._manifest_path, "r", encoding="utf-8") as f:
+            return os.path.join(self.path, json.load(f)["snapshot"])
+
+    def _remove_stale_snapshots(self):
+        """Remove snapshots the manifest no longer points at, including ones a crash left half-written"""
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if name.startswith("snapshot-") and entry != self._snapshot_dir:
+                shutil.rmtree(entry, ignore_errors=True)
+        if self._snapshot_dir != self.path:
+            # Files of a store written before snapshots had directories of their own
+            shutil.rmtree(os.path.join(self.path, "index"), ignore_errors=True)
+            for name in ("chunks.jsonl", "journal.jsonl"):
+                if os.path.exists(os.path.join(self.path, name)):
+                    os.unlink(os.path.join(self.path, name))
+
+    def _load(self):
+        self.index = VectorIndex.load(os.path.join(self._snapshot_dir, "index"), mmap=True)
+        with open(os.path.join(self._snapshot_dir, "chunks.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self._store(entry["id"], entry["document"], entry["metadata"])
+
+    def _replay(self):
+        """Apply the changes journaled after the last snapshot"""
+        if not os.path.exists(self._journal_path):
+            return
+        replayed = 0
+        with open(self._journal_path, "rb+") as f:
+            for line in iter(f.readline, b""):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write; everything before it is
+                    # intact. Cut it off so the next change starts on a line of its own.
+                    f.truncate(f.tell() - len(line))
+                    break
+                if entry["op"] == "add":
+                    vectors = np.frombuffer(base64.b64decode(entry["vectors"]), dtype=np.float32)
+                    self._apply_add(entry["ids"], entry["documents"], entry["metadatas"], vectors.reshape(len(entry["ids"]), -1))
+                elif entry["op"] == "update":
+                    self._apply_update(entry["ids"], entry["metadatas"])
+                elif entry["op"] == "delete":
+                    self._apply_delete(entry["ids"])
+                elif entry["op"] == "reset":
+                    self._apply_reset()
+                replayed += 1
+        if replayed:
+            print(f"🔁 Replayed {replayed} journaled changes into the local index at {self.path}")
+
+    def _append(self, entry: dict):
+        if self._journal:
+            self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            if self._journal.tell() > LOCAL_INDEX_JOURNAL_MB * 1024 * 1024:
+                self._snapshot()
+
+    def _snapshot(self):
+        snapshot_dir = os.path.join(self.path, f"snapshot-{uuid.uuid4().hex[:12]}")
+        self.index.save(os.path.join(snapshot_dir, "index"))
+        with open(os.path.join(snapshot_dir, "chunks.jsonl"), "w", encoding="utf-8") as f:
+            for chunk_id, document in self._documents.items():
+                f.write(json.dumps({"id": chunk_id, "document": document, "metadata": self._metadatas[chunk_id]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        open(os.path.join(snapshot_dir, "journal.jsonl"), "w", encoding="utf-8").close()
+        _fsync_dir(snapshot_dir)
+
+        # Commit point: until the manifest is replaced, the previous snapshot and its journal stay current
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"snapshot": os.path.basename(snapshot_dir)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path)
+        _fsync_dir(self.path)
+
+        if self._journal:
+            self._journal.close()
+        self._snapshot_dir = snapshot_dir
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+        self._remove_stale_snapshots()
+
+    def close(self):
+        """Write the store to its path, if it has one"""
+        if not self.path:
+            return
+        with self._lock:
+            self._snapshot()
+            self._journal.close()
+            self._journal = None
+
+    def _store(self, chunk_id: str, document: str, metadata: dict):
+        self._unstore(chunk_id)
+        self._documents[chunk_id] = document
+        self._metadatas[chunk_id] = metadata
+        doc_id = metadata.get("document_id")
+        if doc_id is not None:
+            self._by_document.setdefault(doc_id, set()).add(chunk_id)
+
+    def _unstore(self, chunk_id: str):
+        self._documents.pop(chunk_id, None)
+        metadata = self._metadatas.pop(chunk_id, None)
+        if metadata is not None:
+            chunks = self._by_document.get(metadata.get("document_id"))
+            if chunks is not None:
+                chunks.discard(chunk_id)
+                if not chunks:
+                    del self._by_document[metadata.get("document_id")]
+
+    def _select(self, ids=None, where=None) -> List[str]:
+        """Chunk ids matching an id list and/or filter"""
+        if ids is not None:
+            candidates = [chunk_id for chunk_id in ids if chunk_id in self._metadatas]
+        elif where and isinstance(where.get("document_id"), str):
+            # Hot path: every chunk of one document
+            candidates = list(self._by_document.get(where["document_id"], ()))
+            if len(where) == 1:
+                return candidates
+        else:
+            candidates = self._metadatas
+        if not where:
+            return list(candidates)
+        return [chunk_id for chunk_id in candidates if matches_where(self._metadatas[chunk_id], where)]
+
+    def _apply_add(self, ids, documents, metadatas, embeddings):
+        self.index.add(ids, embeddings)
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            self._store(chunk_id, document, metadata)
+
+    def _add_batch(self, ids, documents, metadatas, embeddings=None):
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._apply_add(ids, documents, metadatas, embeddings)
+            self._append({
+                "op": "add",
+                "ids": list(ids),
+                "documents": list(documents),
+                "metadatas": list(metadatas),
+                "vectors": base64.b64encode(np.ascontiguousarray(embeddings).tobytes()).decode("ascii")
+            })
+
+    async def add(self, ids, documents, metadatas, embeddings=None):
+        pool = "embedding" if embeddings is None else "vector"
+        for start in range(0, len(ids), self.max_batch_size):
+            end = start + self.max_batch_size
+            await run_in_pool(
+                pool,
+                self._add_batch,
+                ids[start:end],
+                documents[start:end],
+                metadatas[start:end],
+                None if embeddings is None else embeddings[start:end]
+            )
+
+    def _query(self, query_embeddings, n_results, where):
+        with self._lock:
+            allowed = self._select(where=where) if where else None
+            hits = self.index.search(np.asarray(query_embeddings, dtype=np.float32), n_results, ids=allowed)
+            return [
+                {
+                    "ids": [chunk_id for chunk_id, _ in query_hits],
+                    "documents": [self._documents[chunk_id] for chunk_id, _ in query_hits],
+                    "metadatas": [self._metadatas[chunk_id] for chunk_id, _ in query_hits],
+                    "distances": [1.0 - score for _, score in query_hits]
+                }
+                for query_hits in hits
+            ]
+
+    async def query(self, query_embeddings, n_results, where=None):
+        return await run_in_pool("vector", self._query, query_embeddings, n_results, where)
+
+    def _get(self, ids, where, include, limit, offset):
+        with self._lock:
+            selected = self._select(ids, where)
+            selected = list(islice(selected, offset or 0, None if limit is None else (offset or 0) + limit))
+            if not selected:
+                return _empty_result(include)
+            result = {"ids": selected}
+            if "documents" in include:
+                result["documents"] = [self._documents[chunk_id] for chunk_id in selected]
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[chunk_id] for chunk_id in selected]
+            if "embeddings" in include:
+                result["embeddings"] = list(self.index.get(selected))
+            return result
+
+    async def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        return await run_in_pool("vector", self._get, ids, where, include, limit, offset)
+
+    def _apply_update(self, ids, metadatas):
+        for chunk_id, metadata in zip(ids, metadatas):
+            if chunk_id in self._documents:
+                self._store(chunk_id, self._documents[chunk_id], metadata)
+
+    def _update(self, ids, metadatas):
+        with self._lock:
+            self._apply_update(ids, metadatas)
+            self._append({"op": "update", "ids": list(ids), "metadatas": list(metadatas)})
+
+    async def update(self, ids, metadatas):
+        await run_in_pool("vector", self._update, ids, metadatas)
+
+    def _apply_delete(self, ids):
+        self.index.delete(ids)
+        for chunk_id in ids:
+            self._unstore(chunk_id)
+
+    def _delete(self, ids, where):
+        with self._lock:
+            selected = self._select(ids, where) if ids is not None or where else []
+            if selected:
+                self._apply_delete(selected)
+                self._append({"op": "delete", "ids": selected})
+
+    async def delete(self, ids=None, where=None):
+        await run_in_pool("vector", self._delete, ids, where)
+
+    async def count(self):
+        return len(self._documents)
+
+    def _apply_reset(self):
+        self.index.clear()
+        self._documents.clear()
+        self._metadatas.clear()
+        self._by_document.clear()
+
+    def _reset(self):
+        with self._lock:
+            self._apply_reset()
+            self._append({"op": "reset"})
+
+    async def reset(self):
+        await run_in_pool("vector", self._reset)
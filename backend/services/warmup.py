@@ -0,0 +1,56 @@
+# services/warmup.py
+import os
+import time
+
+from services.chunker import CHUNKER, get_chunker
+from services.embeddings import get_embedding_function
+from services.executors import run_in_pool
+from services.retriever import preload_parsers
+
+# Load the models in the background at startup; /readyz reports 503 until done.
+# With WARMUP=false the app is ready at once and models load on first use.
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+
+
+def _embed_once():
+    # The first call loads the ONNX model and tokenizer
+    get_embedding_function()(["warmup"])
+
+
+async def warmup(app):
+    """Load the embedding model and the chunk tokenizer and start a parse worker, then mark the app ready"""
+    state = app.state.warmup
+    started = time.perf_counter()
+    try:
+        await run_in_pool("embedding", _embed_once)
+        state["embedding_model"] = "loaded"
+    except Exception as e:
+        state.update(status="failed", error=f"Embedding model failed to load: {e}")
+        print(f"❌ Warmup failed: {e}")
+        return
+
+    # Optional: without them ingestion still works, just slower on first use
+    if CHUNKER == "tokens":
+        try:
+            await run_in_pool("chunk", get_chunker)
+            state["tokenizer"] = "loaded"
+        except Exception as e:
+            state["tokenizer"] = f"failed: {e}"
+    try:
+        await run_in_pool("parse", preload_parsers)
+        state["parse_pool"] = "started"
+    except Exception as e:
+        state["parse_pool"] = f"failed: {e}"
+
+    state.update(status="ready", seconds=round(time.perf_counter() - started, 2))
+    app.state.ready = True
+    print(f"🔥 Warmup finished in {state['seconds']}s")
+
+
+def readiness(app):
+    """(ready, details) for the readiness probe"""
+    details = dict(app.state.warmup)
+    if app.state.partitions is None:
+        details.update(status="failed", error="Vector store is not available")
+        return False, details
+    return app.state.ready, details
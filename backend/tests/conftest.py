@@ -0,0 +1,41 @@
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services.partitions import PartitionManager, partition_key
+from services.registry import DocumentRegistry
+from services.retrieval import create_retrieval_caches
+from services.vector_store import LocalVectorStore
+
+
+def embed(texts):
+    """Bag-of-words vectors: texts sharing words are similar"""
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1.0
+    return vectors
+
+
+class QueryEmbedder:
+    async def embed(self, text):
+        return embed([text])[0]
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """App state with local partitions under tmp_path and a stub embedder"""
+    def make(max_open=8):
+        app = SimpleNamespace(state=SimpleNamespace(embedding_function=embed, query_embedder=QueryEmbedder()))
+        create_retrieval_caches(app)
+
+        def opener(tenant):
+            path = tmp_path / partition_key(tenant)
+            return LocalVectorStore(embed, path=str(path / "local_index")), DocumentRegistry(str(path / "documents.jsonl"))
+
+        app.state.partitions = PartitionManager(app, opener, max_open=max_open)
+        return app
+
+    return make
@@ -0,0 +1,81 @@
+import hashlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from jose import jwt
+
+from auth import auth_handler
+from auth.auth_handler import (
+    REVOCATION_CHECK_SECONDS, REVOKED_TOKENS, create_access_token, cached_token_user, decode_token, invalidate_token
+)
+from services import cache, state_store
+from services.cache import LRUCache
+from services.state_store import MemoryStateStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The clock the token caches expire entries by"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """A fresh state store and empty token caches"""
+    monkeypatch.setattr(state_store, "_state_store", MemoryStateStore())
+    monkeypatch.setattr(auth_handler, "_verified_tokens", LRUCache("tokens", 100, 100 * 1024, 3600))
+    monkeypatch.setattr(auth_handler, "_revocation_checks", LRUCache("revocations", 100, 100 * 256, REVOCATION_CHECK_SECONDS))
+    return state_store.get_state_store()
+
+
+def test_logged_out_token_is_rejected_and_others_are_not(store):
+    token, other = create_access_token({"sub": "alice"}), create_access_token({"sub": "alice"})
+    assert decode_token(token) == "alice"
+    assert cached_token_user(token) == "alice"
+
+    assert invalidate_token(token)
+    assert decode_token(token) is None
+    assert cached_token_user(token) is None
+    assert decode_token(other) == "alice"
+    # Already revoked: logging out again is refused like any invalid token
+    assert not invalidate_token(token)
+
+
+def test_logout_on_another_worker_applies_after_the_check_window(store, clock):
+    token = create_access_token({"sub": "alice"})
+    assert decode_token(token) == "alice"
+    jti = jwt.get_unverified_claims(token)["jti"]
+    store.put(REVOKED_TOKENS, jti, True)  # as written by another worker
+
+    assert cached_token_user(token) == "alice"
+    clock.now += REVOCATION_CHECK_SECONDS + 1
+    assert cached_token_user(token) is None
+    assert decode_token(token) is None
+
+
+def test_token_without_jti_is_revoked_by_its_hash(store):
+    expire = datetime.utcnow() + timedelta(minutes=5)
+    token = jwt.encode({"sub": "bob", "exp": expire}, auth_handler.SECRET_KEY, algorithm=auth_handler.ALGORITHM)
+    assert decode_token(token) == "bob"
+    assert invalidate_token(token)
+    assert store.get(REVOKED_TOKENS, hashlib.sha256(token.encode()).hexdigest()) is True
+    assert decode_token(token) is None
+
+
+def test_cached_token_is_rejected_once_expired(store, monkeypatch):
+    token = create_access_token({"sub": "alice"})
+    assert decode_token(token) == "alice"
+    expires = jwt.get_unverified_claims(token)["exp"]
+    monkeypatch.setattr(auth_handler, "time", SimpleNamespace(time=lambda: expires + 1))
+    assert cached_token_user(token) is None
+    assert decode_token(token) is None
+
+
+def test_forged_token_is_never_cached(store):
+    token = jwt.encode({"sub": "mallory", "jti": "x"}, "not the secret", algorithm=auth_handler.ALGORITHM)
+    assert decode_token(token) is None
+    assert not invalidate_token(token)
+    assert cached_token_user(token) is None
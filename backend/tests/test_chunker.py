@@ -0,0 +1,73 @@
+import bisect
+import random
+
+import pytest
+
+from services.chunker import StreamingChunker, StreamingTokenChunker, TokenChunker, chunk_text
+
+
+def pages(count, seed=0):
+    """Pages of unique sentences, each ending a line"""
+    rng = random.Random(seed)
+    result = []
+    for page in range(count):
+        sentences = []
+        for i in range(rng.randint(1, 40)):
+            words = " ".join(rng.choice(["pump", "valve", "seal", "rotor", "inlet"]) for _ in range(rng.randint(2, 25)))
+            sentences.append(f"P{page}s{i} {words}{rng.choice(['.', '!', ' e.g.', ''])}")
+        result.append(rng.choice([" ", "\n", "  \n"]).join(sentences) + ".\n")
+    return result
+
+
+def split(text, seed, count=30):
+    """Cut text into segments of random length, some of them empty"""
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), count))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])] + [""]
+
+
+def stream(chunker, segments):
+    chunks = []
+    for page, segment in segments:
+        chunks.extend(chunker.feed([(page, segment)]))
+    return chunks + chunker.finish()
+
+
+@pytest.mark.parametrize("chunk_size, overlap", [(1000, 200), (120, 30), (50, 0)])
+@pytest.mark.parametrize("seed", range(3))
+def test_streaming_chunker_matches_chunk_text(chunk_size, overlap, seed):
+    text = "".join(pages(12, seed))
+    segments = list(enumerate(split(text, seed)))
+    chunks = stream(StreamingChunker(chunk_size, overlap), segments)
+    assert [chunk for chunk, _ in chunks] == chunk_text(text, chunk_size, overlap)
+
+
+@pytest.mark.parametrize("chunker", [
+    StreamingChunker(300, 60),
+    StreamingTokenChunker(TokenChunker(max_tokens=40, overlap_tokens=8), min_chars=1)
+], ids=["chars", "tokens"])
+def test_streaming_chunks_are_tagged_with_their_first_page(chunker):
+    texts = pages(20, seed=4)
+    offsets = [0]
+    for text in texts:
+        offsets.append(offsets[-1] + len(text))
+    full = "".join(texts)
+
+    position = 0
+    for chunk, page in stream(chunker, list(enumerate(texts, start=1))):
+        position = full.index(chunk, position)
+        # The chunk may have started on whitespace that was stripped
+        start = len(full[:position].rstrip())
+        assert page in {bisect.bisect_right(offsets, start), bisect.bisect_right(offsets, position)}
+        position += 1
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_streaming_token_chunker_matches_token_chunker(seed):
+    chunker = TokenChunker(max_tokens=40, overlap_tokens=8)  # approximate tokens, no tokenizer needed
+    text = "".join(pages(12, seed))
+    # Chunked after every segment, so the cut-off at the end of the buffer is hit often
+    segments = list(enumerate(split(text, seed, count=300)))
+    chunks = stream(StreamingTokenChunker(chunker, min_chars=1), segments)
+    assert [chunk for chunk, _ in chunks] == chunker.chunk(text)
+    assert all(span.tokens <= 40 for span in chunker.spans(text))
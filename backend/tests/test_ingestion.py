@@ -0,0 +1,169 @@
+import asyncio
+
+from services import chunker
+from services.ingestion import _tenant_gate, _tenant_gates, document_lock, ingest_document, partition_lock
+from services.retrieval import retrieve
+
+
+def test_delete_all_waits_for_ingestions_and_holds_off_new_ones():
+    async def scenario():
+        events = []
+        ingesting = asyncio.Event()
+        finish_ingestion = asyncio.Event()
+
+        async def ingestion(name, started=None):
+            async with _tenant_gate("t"):
+                events.append(f"{name} start")
+                if started:
+                    started.set()
+                    await finish_ingestion.wait()
+                events.append(f"{name} end")
+
+        async def delete_all():
+            async with partition_lock("t"):
+                events.append("delete all")
+
+        first = asyncio.create_task(ingestion("first", ingesting))
+        await ingesting.wait()
+        deleting = asyncio.create_task(delete_all())
+        await asyncio.sleep(0)
+        # Queued behind the waiting delete-all, not let in beside the first ingestion
+        second = asyncio.create_task(ingestion("second"))
+        await asyncio.sleep(0)
+        assert events == ["first start"]
+
+        finish_ingestion.set()
+        await asyncio.gather(first, deleting, second)
+        assert events == ["first start", "first end", "delete all", "second start", "second end"]
+        assert not _tenant_gates
+
+    asyncio.run(scenario())
+
+
+def test_document_lock_serializes_with_ingestion_of_the_same_file():
+    async def scenario():
+        events = []
+        release = asyncio.Event()
+
+        async def delete(filename):
+            async with document_lock("t", filename):
+                events.append(f"delete {filename}")
+                await release.wait()
+
+        async def ingest(filename):
+            async with document_lock("t", filename):
+                events.append(f"ingest {filename}")
+
+        deleting = asyncio.create_task(delete("a.txt"))
+        await asyncio.sleep(0)
+        same = asyncio.create_task(ingest("a.txt"))
+        other = asyncio.create_task(ingest("b.txt"))
+        await asyncio.sleep(0.01)
+        assert events == ["delete a.txt", "ingest b.txt"]
+        release.set()
+        await asyncio.gather(deleting, same, other)
+        assert events[-1] == "ingest a.txt"
+
+    asyncio.run(scenario())
+
+
+def document(tmp_path, name, paragraphs):
+    path = tmp_path / name
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+    return str(path)
+
+
+def paragraphs(count, topic="pump"):
+    return [" ".join(f"{topic} section {i} line {j} pressure valve." for j in range(12)) for i in range(count)]
+
+
+def test_identical_upload_is_deduplicated(make_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(chunker, "CHUNKER", "chars")
+
+    async def scenario():
+        partitions = make_app().state.partitions
+        async with partitions.use("user:a") as partition:
+            first = await ingest_document(partition, "a.txt", document(tmp_path, "a.txt", paragraphs(6)))
+            copy = await ingest_document(partition, "copy.txt", document(tmp_path, "copy.txt", paragraphs(6)))
+            stored = await partition.vector_store.get(include=[])
+        await partitions.close()
+        return first, copy, stored
+
+    first, copy, stored = asyncio.run(scenario())
+    assert first["status"] == "indexed" and first["chunks_created"] > 1
+    assert copy == {"document_id": first["document_id"], "filename": "copy.txt", "chunks_created": 0, "status": "unchanged"}
+    assert len(stored["ids"]) == first["chunks_created"]
+
+
+def test_new_version_only_embeds_changed_chunks(make_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(chunker, "CHUNKER", "chars")
+    original = paragraphs(6)
+    edited = original[:4] + paragraphs(1, topic="turbine")
+
+    async def scenario():
+        partitions = make_app().state.partitions
+        async with partitions.use("user:a") as partition:
+            first = await ingest_document(partition, "a.txt", document(tmp_path, "v1.txt", original))
+            second = await ingest_document(partition, "a.txt", document(tmp_path, "v2.txt", edited))
+            stored = await partition.vector_store.get(where={"document_id": first["document_id"]})
+            hits = await retrieve(partition, "turbine section", 1)
+            metadata = dict(partition.document_metadata[first["document_id"]])
+        await partitions.close()
+        return first, second, stored, hits, metadata
+
+    first, second, stored, hits, metadata = asyncio.run(scenario())
+    assert second["status"] == "updated"
+    assert second["document_id"] == first["document_id"]
+    assert second["chunks_reused"] > 0 and second["chunks_created"] > 0 and second["chunks_deleted"] > 0
+    assert second["chunks_reused"] + second["chunks_deleted"] == first["chunks_created"]
+
+    chunks = second["chunks_reused"] + second["chunks_created"]
+    assert metadata["chunks"] == chunks
+    assert sorted(m["chunk_index"] for m in stored["metadatas"]) == list(range(chunks))
+    assert not any("section 5" in text for text in stored["documents"])
+    assert "turbine" in hits["documents"][0]
+
+
+def test_registered_document_without_chunks_is_indexed_again(make_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(chunker, "CHUNKER", "chars")
+
+    async def scenario():
+        partitions = make_app().state.partitions
+        async with partitions.use("user:a") as partition:
+            path = document(tmp_path, "a.txt", paragraphs(3))
+            first = await ingest_document(partition, "a.txt", path)
+            # As after a restart of an in-memory store under a shared registry
+            await partition.vector_store.reset()
+            partition.lexical_index.clear()
+            second = await ingest_document(partition, "a.txt", path)
+            stored = await partition.vector_store.get(include=[])
+            registered = list(partition.document_metadata)
+        await partitions.close()
+        return first, second, stored, registered
+
+    first, second, stored, registered = asyncio.run(scenario())
+    assert second["status"] == "indexed"
+    assert second["document_id"] != first["document_id"]
+    assert registered == [second["document_id"]]
+    assert len(stored["ids"]) == second["chunks_created"] == first["chunks_created"]
+
+
+def test_concurrent_copies_under_different_names_are_indexed_once(make_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(chunker, "CHUNKER", "chars")
+
+    async def scenario():
+        partitions = make_app().state.partitions
+        async with partitions.use("user:a") as partition:
+            results = await asyncio.gather(*(
+                ingest_document(partition, name, document(tmp_path, name, paragraphs(6)))
+                for name in ("a.txt", "b.txt", "c.txt")
+            ))
+            stored = await partition.vector_store.get(include=[])
+            registered = list(partition.document_metadata)
+        await partitions.close()
+        return results, stored, registered
+
+    results, stored, registered = asyncio.run(scenario())
+    assert sorted(result["status"] for result in results) == ["indexed", "unchanged", "unchanged"]
+    assert {result["document_id"] for result in results} == set(registered)
+    assert len(stored["ids"]) == max(result["chunks_created"] for result in results)
@@ -0,0 +1,101 @@
+import math
+import random
+
+import pytest
+
+from services.lexical_index import BM25_MAX_DF_RATIO, LexicalIndex, tokenize
+from services.retrieval import reciprocal_rank_fusion
+
+WORDS = [f"w{i}" for i in range(300)]
+
+
+def corpus(count, seed=0):
+    rng = random.Random(seed)
+    return {f"c{i}": " ".join(rng.choices(WORDS, k=rng.randint(5, 40))) for i in range(count)}
+
+
+def reference_bm25(docs, query, k1=1.2, b=0.75):
+    """Plain BM25 over a dict of texts, with the index's rule for common terms"""
+    tokenized = {chunk_id: tokenize(text) for chunk_id, text in docs.items()}
+    avg_length = sum(map(len, tokenized.values())) / len(docs)
+    terms = [t for t in dict.fromkeys(tokenize(query)) if any(t in tokens for tokens in tokenized.values())]
+    df = {t: sum(t in tokens for tokens in tokenized.values()) for t in terms}
+    rare = [t for t in terms if df[t] <= BM25_MAX_DF_RATIO * len(docs)]
+    scores = {}
+    for chunk_id, tokens in tokenized.items():
+        score = 0.0
+        for t in rare or terms:
+            tf = tokens.count(t)
+            if tf:
+                idf = math.log(1 + (len(docs) - df[t] + 0.5) / (df[t] + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokens) / avg_length))
+        if score > 0:
+            scores[chunk_id] = score
+    return scores
+
+
+def assert_matches_reference(index, docs, query, n_results=10):
+    expected = reference_bm25(docs, query)
+    hits = index.search(query, n_results)
+    assert len(hits) == min(n_results, len(expected))
+    for chunk_id, score in hits:
+        assert score == pytest.approx(expected[chunk_id], rel=1e-4)
+    # The best scores, best first
+    assert [score for _, score in hits] == pytest.approx(sorted(expected.values(), reverse=True)[:len(hits)], rel=1e-4)
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Replace part AB-1234 (see v2.1)") == ["replace", "part", "ab-1234", "see", "v2.1", "ab", "1234", "v2", "1"]
+
+
+def test_scores_match_reference_bm25():
+    docs = corpus(200)
+    index = LexicalIndex()
+    index.add(list(docs), list(docs.values()))
+    for query in ("w1 w2 w3", "w150", "w7 w7 w299 unknown"):
+        assert_matches_reference(index, docs, query)
+
+
+def test_exact_identifier_match_ranks_first():
+    docs = corpus(50)
+    docs["part"] = "error code E_042 on the pump controller"
+    index = LexicalIndex()
+    index.add(list(docs), list(docs.values()))
+    assert index.search("what does E_042 mean", 3)[0][0] == "part"
+
+
+def test_removed_and_replaced_chunks_after_compaction():
+    docs = corpus(3000, seed=1)
+    index = LexicalIndex()
+    index.add(list(docs), list(docs.values()))
+    removed = list(docs)[::2]
+    index.remove(removed)
+    for chunk_id in removed:
+        del docs[chunk_id]
+    docs["c1"] = "w5 w5 w5 replaced"
+    index.add(["c1"], [docs["c1"]])
+
+    assert index.stats()["tombstones"] == 1  # compacted, then c1's old slot
+    assert len(index) == len(docs)
+    assert_matches_reference(index, docs, "w5 w42")
+    assert "c0" not in index
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert fused == ["a", "c", "b"]
+
+
+def test_batches_without_terms_are_indexed():
+    index = LexicalIndex()
+    index.add(["border"], ["---- **** ==== !!!"])
+    assert "border" in index and len(index) == 1
+    assert index.search("border", 5) == []
+
+    docs = {"rule": "+-----+-----+", "text": "pump pressure", "blank": "   "}
+    index.add(list(docs), list(docs.values()))
+    assert len(index) == 4
+    assert [chunk_id for chunk_id, _ in index.search("pump", 5)] == ["text"]
+    index.remove(["border", "rule", "blank"])
+    docs = {"text": docs["text"]}
+    assert_matches_reference(index, docs, "pump")
@@ -0,0 +1,114 @@
+import asyncio
+
+from services.ingestion import add_chunks
+from services import partitions as partitions_module
+from services.partitions import PUBLIC_TENANT, partition_key, tenant_for
+from services.retrieval import invalidate_retrieval_cache, retrieve
+
+
+async def add_document(partition, doc_id, filename, text):
+    await add_chunks(partition, [f"{doc_id}_chunk_0"], [text], [{"document_id": doc_id, "filename": filename}])
+    partition.document_metadata[doc_id] = {"filename": filename, "chunks": 1}
+    invalidate_retrieval_cache(partition)
+
+
+async def search(partitions, tenant, query):
+    async with partitions.use(tenant) as partition:
+        results = await retrieve(partition, query, 5)
+    return sorted(meta["filename"] for meta in results["metadatas"])
+
+
+def test_reopened_partition_does_not_serve_results_cached_before_eviction(make_app):
+    async def scenario():
+        app = make_app(max_open=1)
+        partitions = app.state.partitions
+        async with partitions.use("user:a") as partition:
+            await add_document(partition, "one", "one.txt", "pump pressure manual")
+        assert await search(partitions, "user:a", "pump") == ["one.txt"]
+
+        # Opening b evicts a; a is rebuilt from disk on its next use
+        async with partitions.use("user:b"):
+            pass
+        async with partitions.use("user:a") as partition:
+            await add_document(partition, "two", "two.txt", "pump valve guide")
+        assert partitions.evicted == 2
+        assert await search(partitions, "user:a", "pump") == ["one.txt", "two.txt"]
+        await partitions.close()
+
+    asyncio.run(scenario())
+
+
+def test_public_partition_does_not_take_a_slot(make_app):
+    async def scenario():
+        partitions = make_app(max_open=1).state.partitions
+        await partitions.open(PUBLIC_TENANT)
+        async with partitions.use("user:a"):
+            pass
+        assert partitions.stats()["open"] == 2
+        assert partitions.evicted == 0
+
+        async with partitions.use("user:b"):
+            pass
+        assert {p.tenant for p in partitions.open_partitions()} == {PUBLIC_TENANT, "user:b"}
+        await partitions.close()
+
+    asyncio.run(scenario())
+
+
+def test_tenants_only_see_their_own_documents(make_app, tmp_path):
+    async def scenario():
+        partitions = make_app().state.partitions
+        async with partitions.use("user:a") as partition:
+            await add_document(partition, "one", "a.txt", "pump pressure manual")
+        async with partitions.use("user:b") as partition:
+            await add_document(partition, "two", "b.txt", "pump valve guide")
+        assert await search(partitions, "user:a", "pump") == ["a.txt"]
+        assert await search(partitions, "user:b", "pump") == ["b.txt"]
+        assert await search(partitions, PUBLIC_TENANT, "pump") == []
+        await partitions.close()
+
+    asyncio.run(scenario())
+    # Directories are named by hash, without the user name
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [PUBLIC_TENANT, partition_key("user:a"), partition_key("user:b")]
+    )
+
+
+def test_tenant_for_follows_the_isolation_setting(monkeypatch):
+    assert tenant_for("alice") == "user:alice"
+    assert tenant_for(None) == PUBLIC_TENANT
+    monkeypatch.setattr(partitions_module, "TENANT_ISOLATION", "none")
+    assert tenant_for("alice") == PUBLIC_TENANT
+
+
+def test_partitions_in_use_are_not_evicted(make_app):
+    async def scenario():
+        partitions = make_app(max_open=1).state.partitions
+        async with partitions.use("user:a") as held:
+            async with partitions.use("user:b"):
+                async with partitions.use("user:c"):
+                    # Over the limit, but every partition is in use
+                    assert len(partitions.open_partitions()) == 3
+            # a is held, so the idle ones went instead, however recently used
+            assert [p.tenant for p in partitions.open_partitions()] == ["user:a"]
+            assert partitions.evicted == 2
+
+        # Released, a is idle like any other
+        async with partitions.use("user:d"):
+            pass
+        assert [p.tenant for p in partitions.open_partitions()] == ["user:d"]
+        assert await partitions.open("user:a") is not held
+        await partitions.close()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_opens_share_one_load(make_app):
+    async def scenario():
+        partitions = make_app().state.partitions
+        opened = await asyncio.gather(*(partitions.open("user:a") for _ in range(5)))
+        assert all(partition is opened[0] for partition in opened)
+        assert partitions.opened == 1
+        await partitions.close()
+
+    asyncio.run(scenario())
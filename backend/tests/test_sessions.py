@@ -0,0 +1,22 @@
+import pytest
+from fastapi import HTTPException
+
+from services.sessions import SessionStore
+
+
+def test_evicting_last_session_keeps_new_one_reachable():
+    store = SessionStore(max_per_user=1)
+    first = store.create("u")
+    second = store.create("u")
+    assert store.get("u", second.id) is second
+    with pytest.raises(HTTPException):
+        store.get("u", first.id)
+    assert [session.id for session in store.list("u")] == [second.id]
+
+
+def test_zero_per_user_limit_still_allows_one_session():
+    store = SessionStore(max_per_user=0)
+    store.create("u")
+    session = store.create("u")
+    assert store.get("u", session.id) is session
+    assert store.stats()["sessions"] == 1
@@ -0,0 +1,25 @@
+import pytest
+
+from services.registry import SharedDocumentRegistry, clear_shared_registries
+from services.state_store import MemoryStateStore, SQLiteStateStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryStateStore() if request.param == "memory" else SQLiteStateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+def test_clearing_registries_keeps_other_namespaces(store):
+    public, tenant = SharedDocumentRegistry(store), SharedDocumentRegistry(store, "documents:abc")
+    public["d1"] = {"filename": "a.txt", "chunks": 1}
+    tenant["d2"] = {"filename": "b.txt", "chunks": 2}
+    store.put("users", "alice", {"hashed_password": "x"})
+
+    assert sorted(store.namespaces("documents")) == ["documents", "documents:abc"]
+    assert clear_shared_registries(store) == 2
+    assert store.namespaces("documents") == []
+    assert store.get("users", "alice") == {"hashed_password": "x"}
+    # Other workers' copies see the change on their next refresh
+    assert tenant.refresh() and len(tenant) == 0
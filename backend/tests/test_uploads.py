@@ -0,0 +1,37 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from services.uploads import spool_upload
+
+
+def upload(data: bytes, size=None) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename="notes.TXT", size=len(data) if size is None else size)
+
+
+def test_spooled_copy_has_the_content_and_its_hash():
+    data = os.urandom(3 * 1024 * 1024 + 7)
+    file = upload(data)
+    file.file.read(10)  # a partly read upload is copied from the start
+    spooled = asyncio.run(spool_upload(file))
+    try:
+        assert spooled.path.endswith(".txt")
+        with open(spooled.path, "rb") as f:
+            assert f.read() == data
+        assert spooled.size == len(data)
+        assert spooled.content_hash == hashlib.sha256(data).hexdigest()
+    finally:
+        spooled.cleanup()
+
+
+@pytest.mark.parametrize("size", [None, 0])  # Starlette's size, or one that understates the file
+def test_oversized_upload_is_rejected_without_leaving_a_file(tmp_path, monkeypatch, size):
+    monkeypatch.setattr("services.uploads.UPLOAD_TMP_DIR", str(tmp_path))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(spool_upload(upload(b"x" * 2048, size=size), max_bytes=1024))
+    assert error.value.status_code == 400
+    assert os.listdir(tmp_path) == []
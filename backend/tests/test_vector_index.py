@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from services import vector_index
+from services.vector_index import VectorIndex
+
+
+def random_vectors(count, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def brute_force(vectors, queries, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T
+    return [list(np.argsort(-row, kind="stable")[:k]) for row in scores], scores
+
+
+def build(vectors, dtype="float32"):
+    index = VectorIndex(dtype=dtype)
+    index.add([f"v{i}" for i in range(len(vectors))], vectors)
+    return index
+
+
+def test_top_k_matches_brute_force_across_blocks(monkeypatch):
+    monkeypatch.setattr(vector_index, "VECTOR_INDEX_BLOCK_ROWS", 64)
+    vectors, queries = random_vectors(1000), random_vectors(5, seed=1)
+    expected, scores = brute_force(vectors, queries, 10)
+    hits = build(vectors).search(queries, 10)
+    for query, query_hits in enumerate(hits):
+        assert [item_id for item_id, _ in query_hits] == [f"v{row}" for row in expected[query]]
+        assert [score for _, score in query_hits] == pytest.approx(scores[query, expected[query]], abs=1e-5)
+
+
+@pytest.mark.parametrize("dtype, tolerance, min_recall", [("float16", 2e-3, 0.9), ("int8", 2e-2, 0.8)])
+def test_quantized_scores_stay_close(dtype, tolerance, min_recall):
+    vectors, queries = random_vectors(2000), random_vectors(20, seed=1)
+    expected, scores = brute_force(vectors, queries, 10)
+    index = build(vectors, dtype)
+    assert index.nbytes < build(vectors).nbytes
+    recall = []
+    for query, query_hits in enumerate(index.search(queries, 10)):
+        for item_id, score in query_hits:
+            assert score == pytest.approx(scores[query, int(item_id[1:])], abs=tolerance)
+        recall.append(len({int(item_id[1:]) for item_id, _ in query_hits} & set(expected[query])) / 10)
+    assert np.mean(recall) >= min_recall
+
+
+def test_deletes_replacements_and_id_filter():
+    vectors = random_vectors(100)
+    index = build(vectors, "int8")
+    index.delete([f"v{i}" for i in range(50)])  # past the compaction ratio
+    assert len(index) == 50
+    query = vectors[10]
+    assert all(item_id not in {f"v{i}" for i in range(50)} for item_id, _ in index.search(query, 100)[0])
+
+    index.add(["v60"], [query])
+    assert index.search(query, 1)[0][0][0] == "v60"
+    # Deleted ids in the filter are ignored
+    _, scores = brute_force(vectors[[70, 99]], query[None, :], 2)
+    expected = ["v70", "v99"] if scores[0, 0] >= scores[0, 1] else ["v99", "v70"]
+    assert [item_id for item_id, _ in index.search(query, 5, ids=["v70", "v99", "v3"])[0]] == expected
+
+
+def test_saved_index_is_mapped_and_copied_on_write(tmp_path):
+    vectors = random_vectors(300)
+    index = build(vectors, "int8")
+    index.save(str(tmp_path))
+    loaded = VectorIndex.load(str(tmp_path), mmap=True)
+    assert isinstance(loaded._matrix, np.memmap)
+    assert loaded.search(vectors[:3], 5) == index.search(vectors[:3], 5)
+
+    loaded.add(["new"], random_vectors(1, seed=2))
+    assert not isinstance(loaded._matrix, np.memmap)
+    assert len(VectorIndex.load(str(tmp_path))) == 300
@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from services import vector_store
+from services.vector_store import LocalVectorStore
+
+
+def embed(texts):
+    return np.asarray([[len(text), text.count("a"), text.count("e"), 1.0] for text in texts], dtype=np.float32)
+
+
+def contents(store):
+    result = asyncio.run(store.get())
+    return dict(zip(result["ids"], zip(result["documents"], result["metadatas"])))
+
+
+def fill(store):
+    async def changes():
+        await store.add(["a", "b", "c"], ["alpha", "beta", "gamma"], [{"document_id": "d1"}, {"document_id": "d1"}, {"document_id": "d2"}])
+        await store.update(["b"], [{"document_id": "d1", "chunk_index": 1}])
+        await store.delete(where={"document_id": "d2"})
+
+    asyncio.run(changes())
+
+
+def test_journal_replays_changes_that_were_never_snapshotted(tmp_path):
+    store = LocalVectorStore(embed, path=str(tmp_path))
+    fill(store)
+    expected = contents(store)
+    # No close(): as after a crash, only the journal has the changes
+    reopened = LocalVectorStore(embed, path=str(tmp_path))
+    assert contents(reopened) == expected
+    assert set(expected) == {"a", "b"}
+    assert expected["b"][1] == {"document_id": "d1", "chunk_index": 1}
+
+
+def test_torn_journal_line_is_dropped(tmp_path):
+    store = LocalVectorStore(embed, path=str(tmp_path))
+    asyncio.run(store.add(["a"], ["alpha"], [{"document_id": "d1"}]))
+    with open(store._journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "ids": ["b"')
+
+    reopened = LocalVectorStore(embed, path=str(tmp_path))
+    assert set(contents(reopened)) == {"a"}
+    asyncio.run(reopened.add(["c"], ["gamma"], [{"document_id": "d2"}]))
+    assert set(contents(LocalVectorStore(embed, path=str(tmp_path)))) == {"a", "c"}
+
+
+def test_snapshot_and_reset_survive_reopen(tmp_path):
+    store = LocalVectorStore(embed, path=str(tmp_path))
+    fill(store)
+    store.close()
+    reopened = LocalVectorStore(embed, path=str(tmp_path))
+    assert set(contents(reopened)) == {"a", "b"}
+    hits = asyncio.run(reopened.query(embed(["alpha"]), 1))[0]
+    assert hits["ids"] == ["a"]
+
+    asyncio.run(reopened.reset())
+    asyncio.run(reopened.add(["z"], ["zeta"], [{"document_id": "d3"}]))
+    assert set(contents(LocalVectorStore(embed, path=str(tmp_path)))) == {"z"}
+
+
+def test_crash_before_manifest_switch_keeps_previous_snapshot(tmp_path, monkeypatch):
+    store = LocalVectorStore(embed, path=str(tmp_path))
+    fill(store)
+    store.close()
+    store = LocalVectorStore(embed, path=str(tmp_path))
+    asyncio.run(store.add(["c"], ["gamma"], [{"document_id": "d2"}]))
+    expected = contents(store)
+
+    def crash(*args):
+        raise OSError("crashed before the manifest was replaced")
+
+    monkeypatch.setattr(vector_store.os, "replace", crash)
+    with pytest.raises(OSError):
+        store.close()
+    monkeypatch.undo()
+
+    reopened = LocalVectorStore(embed, path=str(tmp_path))
+    assert contents(reopened) == expected
+    # The half-finished snapshot is gone; only the current one is left
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("snapshot-")]) == 1